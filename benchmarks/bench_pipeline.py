@@ -0,0 +1,234 @@
+"""
+Benchmark harness for the analysis pipeline.
+
+Builds synthetic raw datasets at multiples of cleaned_mobile_payments.csv (more months and
+more series), then times each pipeline stage and records wall time and peak traced memory:
+
+    load       read the raw CSV
+    clean      parse month names, dates and numeric columns
+    derive     YoY, monthly growth and ratio columns
+    correlate  correlation matrix of the four metrics
+    dashboard  build the date-range index and answer 100 window queries
+    chart      render a time-series chart of the national totals
+    excel      write the report workbook with the processed frame as Raw Data
+
+Results are written to benchmarks/results/ as JSON and compared with
+benchmarks/baseline.json when it exists; stages slower than the baseline by more than
+the threshold are flagged.
+
+Usage:
+    python benchmarks/bench_pipeline.py --scales 1 100
+    python benchmarks/bench_pipeline.py --update-baseline
+    python benchmarks/bench_pipeline.py --fail-on-regression
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import tracemalloc
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.abspath(os.path.join(base_dir, '..', 'scripts')))
+
+from metrics_store import numeric_columns, derive_metrics, segment_frame, CLEANED_DATA_PATH
+from ingest import parse_rows
+from instrumentation import peak_rss_mb, span
+
+RESULTS_DIR = os.path.join(base_dir, 'results')
+BASELINE_PATH = os.path.join(base_dir, 'baseline.json')
+STAGES = ['load', 'clean', 'derive', 'correlate', 'dashboard', 'chart', 'excel']
+MONTH_NAMES = ['January', 'February', 'March', 'April', 'May', 'June', 'July',
+               'August', 'September', 'October', 'November', 'December']
+
+
+def scale_shape(scale, base_months):
+    """
+    Split a scale factor into (series, months): history grows up to 10x, the rest is more series.
+    """
+    month_factor = min(scale, 10)
+    return max(1, scale // month_factor), base_months * month_factor
+
+
+def make_raw_dataset(scale, file_path, seed=0):
+    """
+    Write a synthetic raw CSV (same layout as 'Mobile Payments.csv' plus a segment column)
+    whose series follow the growth and noise of the real data.
+    """
+    base = pd.read_csv(CLEANED_DATA_PATH)
+    n_series, n_months = scale_shape(scale, len(base))
+    rng = np.random.default_rng(seed)
+
+    # Resample real month-on-month log growth to extend the history and vary the series
+    growth = np.diff(np.log(base[numeric_columns].to_numpy(dtype=float)), axis=0)
+    steps = growth[rng.integers(0, len(growth), size=(n_series, n_months - 1))]
+    start = np.log(base[numeric_columns].iloc[0].to_numpy(dtype=float))
+    levels = np.exp(start + np.concatenate([np.zeros((n_series, 1, 4)), np.cumsum(steps, axis=1)], axis=1))
+    levels *= rng.uniform(0.5, 1.5, size=(n_series, 1, 1))
+    # Keep synthetic levels in a plausible range for long histories
+    levels = np.minimum(levels, base[numeric_columns].max().to_numpy(dtype=float) * 10)
+
+    # The history ends last month so validation does not reject future months
+    last_month = pd.Timestamp.now().to_period('M').to_timestamp() - pd.DateOffset(months=1)
+    dates = pd.date_range(end=last_month, periods=n_months, freq='MS')
+    frame = pd.DataFrame({
+        'segment': np.repeat([f"series_{i:04d}" for i in range(n_series)], n_months),
+        'Year': np.tile(dates.year, n_series),
+        'Month': np.tile(np.asarray(MONTH_NAMES)[dates.month - 1], n_series),
+    })
+    values = levels.reshape(-1, 4)
+    frame['Active Agents'] = pd.Series(values[:, 0].round().astype(int)).map('{:,}'.format)
+    for i, col in enumerate(numeric_columns[1:], start=1):
+        frame[col] = values[:, i].round(4)
+    frame.to_csv(file_path, index=False)
+    return n_series, n_months, len(frame)
+
+
+def run_stage(name, func):
+    """
+    Run one stage and return (result, wall seconds, peak traced memory in MB). The stage
+    runs as a span, so the spans inside the pipeline code, which reset tracemalloc's
+    peak, fold their peaks into it.
+    """
+    with span(f'bench.{name}') as stage:
+        result = func()
+    return result, stage.record['wall_s'], stage.record['peak_mb']
+
+
+def bench_scale(scale, work_dir, skip=()):
+    raw_path = os.path.join(work_dir, f'raw_{scale}x.csv')
+    n_series, n_months, n_rows = make_raw_dataset(scale, raw_path)
+    print(f"\nScale {scale}x: {n_series} series x {n_months} months = {n_rows:,} rows")
+
+    results = {'series': n_series, 'months': n_months, 'rows': n_rows, 'stages': {}}
+    state = {}
+
+    def derive():
+        # All series in one grouped pass; lags never cross segments
+        return pd.concat([state['clean'], derive_metrics(state['clean'])], axis=1)
+
+    def dashboard():
+        from range_index import RangeIndex
+        national = state['national']
+        index = RangeIndex(national)
+        rng = np.random.default_rng(1)
+        picks = np.sort(rng.choice(national['date'].to_numpy(), size=(100, 2)), axis=1)
+        for start, end in picks:
+            index.slice(start, end)
+            index.correlation(start, end)
+            index.deltas(start, end)
+        return index
+
+    def chart():
+        from visualisation import plot_time_series
+        return plot_time_series(state['national'], numeric_columns[0], 'Benchmark Chart', 'Active Agents',
+                                output_dir=work_dir)
+
+    def excel():
+        from report_writer import write_report
+        file_path = os.path.join(work_dir, f'report_{scale}x.xlsx')
+        summary = state['derived'][numeric_columns].describe().T.rename_axis('Metric').reset_index()
+        return write_report(file_path, summary, state['derived'])
+
+    stages = {
+        'load': lambda: pd.read_csv(raw_path, dtype=str),
+        'clean': lambda: parse_rows(state['raw'], quarantine_path=None),
+        'derive': derive,
+        'correlate': lambda: state['derived'][numeric_columns].corr(),
+        'dashboard': dashboard,
+        'chart': chart,
+        'excel': excel,
+    }
+    keys = {'load': 'raw', 'clean': 'clean', 'derive': 'derived'}
+
+    for name in STAGES:
+        if name in skip:
+            continue
+        if name in ('dashboard', 'chart') and 'national' not in state:
+            # National totals across series, as plotted and queried by the dashboard
+            state['national'] = segment_frame(state['derived'])
+        result, seconds, peak_mb = run_stage(name, stages[name])
+        if name in keys:
+            state[keys[name]] = result
+        results['stages'][name] = {'seconds': round(seconds, 4), 'peak_mb': round(peak_mb, 2)}
+        print(f"  {name:<10} {seconds:9.3f}s  {peak_mb:10.1f} MB")
+
+    return results
+
+
+def compare(results, baseline, threshold):
+    """
+    Stages whose wall time exceeds the baseline by more than `threshold` (a ratio).
+    """
+    regressions = []
+    for scale, scale_results in results['scales'].items():
+        base_stages = baseline.get('scales', {}).get(scale, {}).get('stages', {})
+        for name, stage in scale_results['stages'].items():
+            if name not in base_stages:
+                continue
+            ratio = stage['seconds'] / max(base_stages[name]['seconds'], 1e-6)
+            if ratio > threshold:
+                regressions.append({'scale': scale, 'stage': name, 'seconds': stage['seconds'],
+                                    'baseline_seconds': base_stages[name]['seconds'], 'ratio': round(ratio, 2)})
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the mobile money analysis pipeline")
+    parser.add_argument('--scales', type=int, nargs='+', default=[1, 100, 10000],
+                        help="dataset sizes as multiples of cleaned_mobile_payments.csv")
+    parser.add_argument('--skip', nargs='*', default=[], choices=STAGES[3:],
+                        help="output stages to leave out (load, clean and derive feed the others)")
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help="flag stages slower than baseline by more than this ratio")
+    parser.add_argument('--update-baseline', action='store_true', help="store this run as the baseline")
+    parser.add_argument('--fail-on-regression', action='store_true', help="exit with status 1 on regressions")
+    args = parser.parse_args(argv)
+
+    # Keep the benchmark's spans out of the pipeline's span log
+    os.environ.setdefault('PIPELINE_SPAN_LOG', os.path.join(RESULTS_DIR, 'spans.jsonl'))
+    tracemalloc.start()
+    results = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'machine': platform.platform(),
+        'scales': {},
+    }
+    with tempfile.TemporaryDirectory() as work_dir:
+        for scale in args.scales:
+            results['scales'][str(scale)] = bench_scale(scale, work_dir, skip=set(args.skip))
+    tracemalloc.stop()
+    results['peak_rss_mb'] = peak_rss_mb()
+
+    if os.path.exists(BASELINE_PATH) and not args.update_baseline:
+        with open(BASELINE_PATH) as f:
+            results['regressions'] = compare(results, json.load(f), args.threshold)
+        for item in results['regressions']:
+            print(f"REGRESSION {item['scale']}x {item['stage']}: {item['seconds']:.3f}s "
+                  f"vs baseline {item['baseline_seconds']:.3f}s ({item['ratio']}x)")
+        if not results['regressions']:
+            print("\nNo regressions against baseline")
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    results_path = os.path.join(RESULTS_DIR, f"bench_{datetime.now():%Y%m%d_%H%M%S}.json")
+    with open(results_path, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults saved to {results_path}")
+
+    if args.update_baseline:
+        with open(BASELINE_PATH, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline updated: {BASELINE_PATH}")
+
+    if args.fail_on_regression and results.get('regressions'):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
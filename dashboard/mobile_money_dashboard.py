@@ -1,42 +1,139 @@
 import streamlit as st
-import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
-import numpy as np
 import os
+import sys
+from pathlib import Path
 
-# Set page configuration
+# Make the shared analysis modules in scripts/ importable
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts')))
+from metrics_store import load_metrics, metric_slug, segments
+from dashboard_cache import build_index, build_levels, build_rolling, read_snapshot
+from instrumentation import span
+
+# Plotting and analysis modules are imported in the loaders and tabs that use them: values
+# served from the warm snapshot never import the modules that build them
+
+# Images are bundled with the app rather than fetched from the web on every start
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+FLAG_PATH = os.path.join(STATIC_DIR, 'kenya_flag.svg')
+
+# Set page configuration. The icon is given as a Path: an emoji, or any string Streamlit
+# has to check for one, loads its emoji table on the first run (about 0.3s)
 st.set_page_config(
     page_title="Kenya Mobile Money Analysis",
-    page_icon="💰",
+    page_icon=Path(FLAG_PATH),
     layout="wide",
     initial_sidebar_state="expanded"
 )
 
+# Time every rerun and its sections (see scripts/instrumentation.py for the span log)
+rerun = span('dashboard.rerun').start()
+
+# Resources prebuilt by `python scripts/cli.py warm` for the current data version ({} if not warmed)
+@st.cache_resource
+def load_snapshot():
+    with span('dashboard.load_snapshot'):
+        return read_snapshot()
+
+
+def from_snapshot(key, build):
+    # The loaders below take their value from the snapshot when it has one, else compute it
+    snapshot = load_snapshot()
+    if key in snapshot:
+        return snapshot[key]
+    with span(f"dashboard.build_{key if isinstance(key, str) else key[0]}"):
+        return build()
+
+
 # Function to load data
-@st.cache_data
+@st.cache_resource
 def load_data():
-    # Get the absolute path of the current script (e.g., dashboard/)
-    base_dir = os.path.dirname(os.path.abspath(__file__))
+    # Base and derived metrics are computed once per version of cleaned_mobile_payments.csv
+    # and read back from the Parquet metrics store in the compact layout; one read-only
+    # frame is shared by every session instead of a copy per session
+    return from_snapshot('data', lambda: load_metrics(compact=True))
+
+
+# Segment names (operators, counties, ...) in the metrics store, national first
+@st.cache_data
+def load_segments():
+    return from_snapshot('segments', lambda: segments(load_data()))
+
+
+# CAGR of every metric for every segment, computed in one grouped pass
+@st.cache_data
+def load_segment_cagr():
+    from data_analysis import cagr_by_segment
+
+    return from_snapshot('segment_cagr', lambda: cagr_by_segment(load_data()))
+
+
+# Date-range index per segment shared by all sessions; window slices, deltas and correlations are cached in it
+@st.cache_resource
+def load_index(segment):
+    return from_snapshot(('index', segment), lambda: build_index(load_data(), segment))
 
-    # Navigate one level up, then into data/processed/
-    file_path = os.path.join(base_dir, '..', 'data', 'processed', 'cleaned_mobile_payments.csv')
-    file_path = os.path.abspath(file_path)  # Resolves ".." properly
 
-    print(f"Loading data from: {file_path}")  # Optional for debugging
+# Multi-resolution LTTB levels of every plotted series, so charts get at most about one point per pixel
+@st.cache_resource
+def load_levels(segment):
+    return from_snapshot(('levels', segment), lambda: build_levels(load_index(segment)))
 
-    df = pd.read_csv(file_path)
-    df['date'] = pd.to_datetime(df['date'])
-    return df
 
+# Rolling statistics and seasonal indices over the full history, computed once per segment and window length
+@st.cache_resource
+def load_rolling(window, segment):
+    return from_snapshot(('rolling', window, segment), lambda: build_rolling(load_index(segment), window))
+
+
+# Growth phases of every metric over the segment's full history (PELT change points on log growth)
+@st.cache_data
+def load_phases(segment):
+    def build():
+        from changepoints import growth_phases
+
+        return growth_phases(load_index(segment).df)
+
+    return from_snapshot(('phases', segment), build)
+
+
+# Fitted forecast parameters for the current data version (fitted once, then only used for inference)
+@st.cache_resource
+def load_forecast_models(segment):
+    def build():
+        from forecasting import load_models
+
+        return load_models(load_index(segment).df)
+
+    return from_snapshot(('forecast_models', segment), build)
+
+
+# Monte Carlo percentile fan of a scenario (seeded, so every session sees the same paths)
+@st.cache_data
+def load_fan(scenario, segment):
+    def build():
+        from scenarios import scenario_fan
+
+        return scenario_fan(load_index(segment).df, scenario)
+
+    return from_snapshot(('fan', scenario, segment), build)
 
-# Load the data
-df = load_data()
 
 # Create sidebar for filtering
 st.sidebar.title("Kenya Mobile Money Dashboard")
-st.sidebar.image("https://upload.wikimedia.org/wikipedia/commons/thumb/4/49/Flag_of_Kenya.svg/800px-Flag_of_Kenya.svg.png", width=100)
+st.sidebar.image(FLAG_PATH, width=100)
+
+# Segment selector, shown when the data has operator or county series
+segment_names = load_segments()
+if len(segment_names) > 1:
+    segment = st.sidebar.selectbox("Segment", options=segment_names,
+                                   format_func=lambda name: name.replace('_', ' ').title())
+else:
+    segment = segment_names[0]
+
+# Load the data for the selected segment
+index = load_index(segment)
+levels = load_levels(segment)
+df = index.df
 
 # Add date range selector
 min_date = df['date'].min().date()
@@ -45,8 +142,14 @@ max_date = df['date'].max().date()
 start_date = st.sidebar.date_input("Start Date", min_date, min_value=min_date, max_value=max_date)
 end_date = st.sidebar.date_input("End Date", max_date, min_value=min_date, max_value=max_date)
 
-# Filter data based on date selection
-filtered_df = df[(df['date'].dt.date >= start_date) & (df['date'].dt.date <= end_date)]
+# Filter data based on date selection (a positional slice located with searchsorted)
+filtered_df = index.get(start_date, end_date, 'slice')
+if filtered_df.empty:
+    st.warning("No data in the selected date range. Please choose an end date after the start date.")
+    # st.stop() ends the script here, so the rerun span is recorded first
+    rerun.set(segment=segment, empty=True)
+    rerun.stop()
+    st.stop()
 
 # Main dashboard
 st.title("Kenya Mobile Money Ecosystem Analysis")
@@ -57,32 +160,41 @@ st.markdown("### Key Metrics")
 col1, col2, col3, col4 = st.columns(4)
 
 latest_data = filtered_df.iloc[-1]
-earliest_data = filtered_df.iloc[0]
+deltas = index.deltas(start_date, end_date)
 
 with col1:
     st.metric("Active Agents", 
               f"{int(latest_data['Active Agents']):,}", 
-              f"{int(latest_data['Active Agents']) - int(earliest_data['Active Agents']):,}")
+              f"{int(deltas['Active Agents']):,}")
 
 with col2:
     st.metric("Registered Accounts in Millions", 
               f"{int(latest_data['Total Registered Mobile Money Accounts (Millions)']):,}", 
-              f"{int(latest_data['Total Registered Mobile Money Accounts (Millions)']) - int(earliest_data['Total Registered Mobile Money Accounts (Millions)']):,}")
+              f"{int(deltas['Total Registered Mobile Money Accounts (Millions)']):,}")
 
 with col3:
     st.metric("Transaction Volume in Millions", 
               f"{int(latest_data['Total Agent Cash in Cash Out (Volume Million)']):,}", 
-              f"{int(latest_data['Total Agent Cash in Cash Out (Volume Million)']) - int(earliest_data['Total Agent Cash in Cash Out (Volume Million)']):,}")
+              f"{int(deltas['Total Agent Cash in Cash Out (Volume Million)']):,}")
 
 with col4:
     st.metric("Transaction Value (KES) in Billions", 
               f"{int(latest_data['Total Agent Cash in Cash Out (Value KSh billions)']):,}", 
-              f"{int(latest_data['Total Agent Cash in Cash Out (Value KSh billions)']) - int(earliest_data['Total Agent Cash in Cash Out (Value KSh billions)']):,}")
+              f"{int(deltas['Total Agent Cash in Cash Out (Value KSh billions)']):,}")
+
+# Growth of every segment side by side, from the precomputed grouped CAGR
+if len(segment_names) > 1:
+    with st.expander("Compare segments (CAGR over full history)"):
+        st.dataframe(load_segment_cagr().style.format('{:.2%}'), use_container_width=True)
 
 # Create tabs for different visualizations
-tab1, tab2, tab3, tab4 = st.tabs(["Growth Trends", "Year-over-Year Analysis", "Per Account Metrics", "Correlations"])
+tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs(["Growth Trends", "Year-over-Year Analysis", "Per Account Metrics",
+                                              "Correlations", "Rolling & Seasonality", "Forecasts"])
+
+with tab1, span('dashboard.growth', rows=len(filtered_df)):
+    import pandas as pd
+    import plotly.graph_objects as go
 
-with tab1:
     st.markdown("### Growth of Mobile Money Ecosystem")
     
     # Metric selector for the main chart
@@ -92,33 +204,47 @@ with tab1:
                 "Total Agent Cash in Cash Out (Volume Million)", "Total Agent Cash in Cash Out (Value KSh billions)"]
     )
     
-    # Create line chart
-    fig = px.line(filtered_df, x='date', y=selected_metric, 
-                  title=f"Growth in {selected_metric} (2007-2025)")
-    fig.update_layout(height=500)
+    # Create line chart from the downsampled rows of the range
+    plot_df = levels.frame([selected_metric], start_date, end_date)
+    fig = go.Figure(go.Scatter(x=plot_df['date'], y=plot_df[selected_metric], mode='lines'))
+    fig.update_layout(title=f"Growth in {selected_metric} (2007-2025)", xaxis_title="date",
+                      yaxis_title=selected_metric, height=500)
+
+    # Shade the detected growth phases, clipped to the selected range
+    range_start, range_end = pd.Timestamp(start_date), pd.Timestamp(end_date)
+    phases = load_phases(segment).xs(selected_metric, level='metric').droplevel(0)
+    phases = phases[(phases['end'] >= range_start) & (phases['start'] <= range_end)]
+    for phase, row in phases.iterrows():
+        # A band runs to the start of the next phase so neighbouring bands meet
+        fig.add_vrect(x0=max(row['start'], range_start), x1=min(row['end'] + pd.offsets.MonthBegin(), range_end),
+                      fillcolor='#636efa' if phase % 2 else '#00cc96', opacity=0.08, line_width=0,
+                      annotation_text=f"{row['annualized_growth_%']:.0f}%/yr", annotation_position='top left')
     st.plotly_chart(fig, use_container_width=True)
+    st.caption("Shaded bands are growth phases found by change-point detection on monthly log growth, "
+               "labelled with their annualized growth.")
+
+with tab2, span('dashboard.yoy', rows=len(filtered_df)):
+    import plotly.graph_objects as go
 
-with tab2:
     st.markdown("### Year-over-Year Growth Analysis")
     
-    # Calculate YoY growth for visualization
-    if len(filtered_df) >= 13:  # Need at least 13 months for YoY calculation
-        yoy_metrics = []
-        for col in ["Active Agents", "Total Registered Mobile Money Accounts (Millions)", 
-                   "Total Agent Cash in Cash Out (Volume Million)", "Total Agent Cash in Cash Out (Value KSh billions)"]:
-            col_short = col.replace("Total ", "").replace(" ", "_")
-            filtered_df[f'{col_short}_yoy'] = filtered_df[col].pct_change(12) * 100
-            yoy_metrics.append(f'{col_short}_yoy')
-        
+    # YoY growth is precomputed over the full history, so every month in the range has a value
+    yoy_metrics = {}
+    for col in ["Active Agents", "Total Registered Mobile Money Accounts (Millions)", 
+               "Total Agent Cash in Cash Out (Volume Million)", "Total Agent Cash in Cash Out (Value KSh billions)"]:
+        yoy_metrics[f'{metric_slug(col)}_yoy_growth'] = col.replace("Total ", "").replace(" ", "_")
+
+    if filtered_df[list(yoy_metrics)].notna().any().any():
         # Create multi-line chart for YoY growth
         fig = go.Figure()
+        plot_df = levels.frame(list(yoy_metrics), start_date, end_date)
         
-        for metric in yoy_metrics:
+        for metric, name in yoy_metrics.items():
             fig.add_trace(go.Scatter(
-                x=filtered_df['date'][12:],  # Skip first year with NaN values
-                y=filtered_df[metric][12:],
+                x=plot_df['date'],
+                y=plot_df[metric],
                 mode='lines',
-                name=metric.replace('_yoy', '')
+                name=name
             ))
         
         fig.update_layout(
@@ -131,23 +257,23 @@ with tab2:
     else:
         st.info("Not enough data for year-over-year analysis. Please select a longer date range.")
 
-with tab3:
+with tab3, span('dashboard.per_account', rows=len(filtered_df)):
+    import plotly.graph_objects as go
+    from plotly.subplots import make_subplots
+
     st.markdown("### Per Account Analysis")
     
-    # Calculate metrics per account
-    filtered_df['tx_per_account'] = filtered_df['Total Agent Cash in Cash Out (Volume Million)'] / filtered_df['Total Registered Mobile Money Accounts (Millions)']
-    filtered_df['value_per_account'] = filtered_df['Total Agent Cash in Cash Out (Value KSh billions)'] / filtered_df['Total Registered Mobile Money Accounts (Millions)']
-    
     # Create a two-metric chart
     fig = make_subplots(specs=[[{"secondary_y": True}]])
+    plot_df = levels.frame(['transactions_per_account', 'value_per_account'], start_date, end_date)
     
     fig.add_trace(
-        go.Scatter(x=filtered_df['date'], y=filtered_df['tx_per_account'], name="Transactions per Account"),
+        go.Scatter(x=plot_df['date'], y=plot_df['transactions_per_account'], name="Transactions per Account"),
         secondary_y=False,
     )
     
     fig.add_trace(
-        go.Scatter(x=filtered_df['date'], y=filtered_df['value_per_account'], name="Value per Account (KES)"),
+        go.Scatter(x=plot_df['date'], y=plot_df['value_per_account'], name="Value per Account (KES)"),
         secondary_y=True,
     )
     
@@ -162,28 +288,150 @@ with tab3:
     
     st.plotly_chart(fig, use_container_width=True)
 
-with tab4:
+with tab4, span('dashboard.correlations', rows=len(filtered_df)):
+    import numpy as np
+    import plotly.graph_objects as go
+    from spectral import cross_correlation_frame
+
     st.markdown("### Correlation Analysis")
     
-    # Calculate correlation matrix
-    corr_matrix = filtered_df[["Active Agents", "Total Registered Mobile Money Accounts (Millions)", 
-                              "Total Agent Cash in Cash Out (Volume Million)", "Total Agent Cash in Cash Out (Value KSh billions)"]].corr()
+    # Correlation matrix for the window, from the index's prefix sums
+    corr_matrix = index.correlation(start_date, end_date)
     
     # Create correlation heatmap
-    fig = px.imshow(corr_matrix, 
-                   labels=dict(x="Metric", y="Metric", color="Correlation"),
-                   x=corr_matrix.columns,
-                   y=corr_matrix.columns,
-                   color_continuous_scale="RdBu_r",
-                   zmin=-1, zmax=1)
+    fig = go.Figure(go.Heatmap(z=corr_matrix.to_numpy(), x=corr_matrix.columns, y=corr_matrix.columns,
+                               colorscale="RdBu_r", zmin=-1, zmax=1, colorbar=dict(title="Correlation")))
     
     fig.update_layout(
         title="Correlation Matrix of Key Metrics",
+        xaxis_title="Metric",
+        yaxis=dict(title="Metric", autorange="reversed"),
         height=600
     )
     
     st.plotly_chart(fig, use_container_width=True)
 
+    # Lagged correlations of monthly growth, all lags of the pair in one FFT pass
+    st.markdown("#### Lead/Lag Between Metrics")
+    lead_col, follow_col = st.columns(2)
+    metric_options = ["Active Agents", "Total Registered Mobile Money Accounts (Millions)",
+                      "Total Agent Cash in Cash Out (Volume Million)", "Total Agent Cash in Cash Out (Value KSh billions)"]
+    leader = lead_col.selectbox("Leading metric", options=metric_options, key="ccf_leader")
+    follower = follow_col.selectbox("Following metric", options=metric_options, index=2, key="ccf_follower")
+
+    ccf = cross_correlation_frame(filtered_df, max_lag=12, columns=[leader, follower])
+    ccf = ccf.xs((leader, follower), axis=1, level=['leader', 'follower']).iloc[:, 0]
+    if ccf.notna().any():
+        best_lag = int(ccf.abs().idxmax())
+        fig = go.Figure(go.Bar(x=ccf.index, y=ccf.to_numpy(),
+                               marker_color=np.where(ccf.index == best_lag, '#bb0000', '#636efa')))
+        fig.update_layout(title=f"Cross-Correlation of Monthly Growth: {leader} vs {follower}",
+                          xaxis_title="Lag (months; positive = leading metric moves first)",
+                          yaxis=dict(title="Correlation", range=[-1, 1]), height=400)
+        st.plotly_chart(fig, use_container_width=True)
+        st.caption(f"Strongest correlation {ccf[best_lag]:.2f} at a lag of {best_lag} months.")
+    else:
+        st.info("Not enough data for lead/lag analysis. Please select a longer date range.")
+
+with tab5, span('dashboard.rolling', rows=len(filtered_df)):
+    import plotly.graph_objects as go
+    from plotly.subplots import make_subplots
+    from downsampling import downsample_frame
+
+    st.markdown("### Rolling Trends, Volatility and Seasonality")
+
+    rolling_metric = st.selectbox(
+        "Select Metric",
+        options=["Active Agents", "Total Registered Mobile Money Accounts (Millions)", 
+                "Total Agent Cash in Cash Out (Volume Million)", "Total Agent Cash in Cash Out (Value KSh billions)"],
+        key="rolling_metric"
+    )
+    window = st.slider("Rolling window (months)", min_value=3, max_value=24, value=12)
+
+    rolling_df, seasonal_df = load_rolling(window, segment)
+    slug = metric_slug(rolling_metric)
+    mean_col, volatility_col = f"{slug}_rolling_mean_{window}", f"{slug}_volatility_{window}"
+    window_df = filtered_df[['date', rolling_metric]].join(rolling_df[[mean_col, volatility_col]])
+    window_df = downsample_frame(window_df, 'date', [rolling_metric, mean_col, volatility_col])
+
+    # Actual values against the rolling mean, with annualized volatility of monthly growth below
+    fig = make_subplots(rows=2, cols=1, shared_xaxes=True, row_heights=[0.65, 0.35], vertical_spacing=0.08)
+    fig.add_trace(go.Scatter(x=window_df['date'], y=window_df[rolling_metric], name="Actual"), row=1, col=1)
+    fig.add_trace(go.Scatter(x=window_df['date'], y=window_df[mean_col],
+                             name=f"{window}-month mean"), row=1, col=1)
+    fig.add_trace(go.Scatter(x=window_df['date'], y=window_df[volatility_col] * 100,
+                             name="Volatility (%)"), row=2, col=1)
+    fig.update_layout(title=f"Rolling Statistics for {rolling_metric}", height=600)
+    st.plotly_chart(fig, use_container_width=True)
+
+    # Multiplicative seasonal indices (1.0 = an average month)
+    seasonal_t = seasonal_df.T
+    fig = go.Figure(go.Heatmap(z=seasonal_t.to_numpy(), x=seasonal_t.columns, y=seasonal_t.index,
+                               colorscale="RdBu_r", zmid=1.0, texttemplate="%{z:.3f}",
+                               colorbar=dict(title="Seasonal Index")))
+    fig.update_layout(title="Seasonal Index by Month (1.0 = average month)", xaxis_title="Month",
+                      yaxis=dict(title="Metric", autorange="reversed"), height=400)
+    st.plotly_chart(fig, use_container_width=True)
+
+with tab6, span('dashboard.forecasts', rows=len(filtered_df)):
+    import plotly.graph_objects as go
+    from forecasting import MIN_HISTORY, forecast
+    from scenarios import SCENARIOS
+
+    st.markdown("### Forecasts")
+
+    forecast_metric = st.selectbox(
+        "Select Metric",
+        options=["Active Agents", "Total Registered Mobile Money Accounts (Millions)", 
+                "Total Agent Cash in Cash Out (Volume Million)", "Total Agent Cash in Cash Out (Value KSh billions)"],
+        key="forecast_metric"
+    )
+    horizon = st.slider("Forecast horizon (months)", min_value=1, max_value=36, value=12)
+
+    models = load_forecast_models(segment)
+    plot_df = levels.frame([forecast_metric], start_date, end_date)
+    if forecast_metric in models:
+        forecast_df = forecast(models, horizon)[forecast_metric]
+        fig = go.Figure()
+        fig.add_trace(go.Scatter(x=plot_df['date'], y=plot_df[forecast_metric], name="Actual"))
+        for model in forecast_df.columns:
+            fig.add_trace(go.Scatter(x=forecast_df.index, y=forecast_df[model], name=model.replace('_', ' ').title(),
+                                     line=dict(dash='dash')))
+        fig.update_layout(title=f"{forecast_metric}: {horizon}-Month Forecast", height=500)
+        st.plotly_chart(fig, use_container_width=True)
+    else:
+        st.info(f"{forecast_metric} has fewer than {MIN_HISTORY} months of values, so it is not forecast.")
+
+    # Percentile bands of simulated paths: bootstrapped growth residuals plus seasonal factors
+    st.markdown("#### Scenario Fan Chart")
+    scenario = st.selectbox("Scenario", options=list(SCENARIOS), format_func=lambda name: name.title(),
+                            key="scenario")
+    fan = load_fan(scenario, segment)
+    if forecast_metric in fan.columns.get_level_values('metric'):
+        fan = fan[forecast_metric]
+        low, inner_low, median, inner_high, high = fan.columns
+
+        fig = go.Figure()
+        fig.add_trace(go.Scatter(x=plot_df['date'], y=plot_df[forecast_metric], name="Actual"))
+        for lower, upper, opacity in [(low, high, 0.15), (inner_low, inner_high, 0.3)]:
+            fig.add_trace(go.Scatter(x=fan.index, y=fan[lower], line=dict(width=0), showlegend=False,
+                                     hoverinfo='skip'))
+            fig.add_trace(go.Scatter(x=fan.index, y=fan[upper], line=dict(width=0), fill='tonexty',
+                                     fillcolor=f"rgba(99, 110, 250, {opacity})", name=f"{lower}-{upper}"))
+        fig.add_trace(go.Scatter(x=fan.index, y=fan[median], name="Median", line=dict(color='#636efa')))
+        fig.update_layout(title=f"{forecast_metric}: {scenario.title()} Scenario", height=500)
+        st.plotly_chart(fig, use_container_width=True)
+        assumptions = SCENARIOS[scenario]
+        st.caption(f"{len(fan)} months of simulated paths with {assumptions['growth']:g}x the recent growth trend, "
+                   f"{assumptions['volatility']:g}x its month-to-month volatility and "
+                   f"{assumptions['seasonality']:g}x the seasonal swings.")
+    else:
+        st.info(f"{forecast_metric} has no value in the latest month, so it is not simulated.")
+
+rerun.rows = len(filtered_df)
+rerun.set(segment=segment)
+rerun.stop()
+
 # Footer with insights
 st.markdown("---")
 st.markdown("### Key Insights")
@@ -1,180 +1,138 @@
-import pandas as pd
-import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
 from datetime import datetime
 import os
-import smtplib
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
-from email.mime.application import MIMEApplication
+from metrics_store import SEGMENT_COLUMN, segment_frame
+from ingest import RAW_DATA_PATH, ingest, read_raw, parse_rows
+from storage import read_processed
+from rolling import seasonal_index_frame
+from changepoints import growth_phases
+from scenarios import scenario_fan, scenario_summary
+from forecasting import load_models, forecast
+from data_analysis import cagr_by_segment
+from summary import latest_summary
+from report_writer import write_report
+from instrumentation import span, timed
 
-def run_mobile_money_analysis(input_file='data\Mobile Payments.csv', output_dir='reports'):
+@timed('report')
+def run_mobile_money_analysis(input_file=RAW_DATA_PATH, output_dir='reports', incremental=False,
+                              record_type=None):
     """
     Automated analysis of mobile money data that can be scheduled to run periodically.
+    With incremental=True only months newer than the last run are parsed and appended
+    to the processed dataset, which is then used for the report. With record_type set to
+    'transaction' or 'agent', input_file is a record-level feed that is streamed in
+    chunks and aggregated into the monthly schema first.
     """
     print(f"Starting analysis at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     
-    # Create output directory if it doesn't exist
+    # Load and process data
+    with span('load') as load:
+        if record_type is not None:
+            from streaming import aggregate_stream
+            df, _ = aggregate_stream(input_file, record_type=record_type)
+        elif incremental:
+            ingest(input_file)
+            df = read_processed()
+        else:
+            # Parse month names, build the date column and strip thousands separators
+            df = parse_rows(read_raw(input_file))
+        load.rows = len(df)
+
+    report_file = write_analysis_report(df, output_dir)
+    print(f"Analysis completed at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    return report_file
+
+def write_analysis_report(df, output_dir='reports'):
+    """
+    Write the Excel report of an already processed (possibly segmented) frame, e.g. the
+    metrics store, to output_dir. Returns the report path.
+    """
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
-    
-    # Load and process data
-    df = pd.read_csv(input_file)
-    
-    # Data cleaning and preparation
-    df['date'] = pd.to_datetime(df[['Year', 'Month']].assign(day=1))
-    df = df.sort_values('date')
-    
-    # Ensure numeric columns are properly formatted
-    numeric_columns = ['Active Agents', 'Total Registered Mobile Money Accounts (Millions)', 
-                      'Total Agent Cash in Cash Out (Volume Million)', 'Total Agent Cash in Cash Out (Value KSh billions)']
-    
-    for col in numeric_columns:
-        if df[col].dtype == 'object':
-            df[col] = df[col].str.replace(',', '').astype(float)
+
+    # Segmented feeds are summarised on the national series (national rows or the segment totals)
+    segmented = df
+    df = segment_frame(segmented)
     
     # Generate report timestamp
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
     
-    # Calculate key metrics for the latest month
-    latest_month = df.iloc[-1]
-    previous_month = df.iloc[-2]
-    previous_year_same_month = df[df['date'] == df['date'].iloc[-1] - pd.DateOffset(months=12)].iloc[0] if len(df) > 12 else None
-    
-    # Create monthly report dataframe
-    report_data = {
-        'Metric': [],
-        'Current Value': [],
-        'MoM Change': [],
-        'MoM %': [],
-        'YoY Change': [],
-        'YoY %': []
-    }
+    # MoM, QoQ, YoY and YTD changes of every metric for the latest month
+    with span('summary', rows=len(df)):
+        report_df = latest_summary(df)
     
-    for col in numeric_columns:
-        report_data['Metric'].append(col)
-        report_data['Current Value'].append(latest_month[col])
-        
-        # Month-over-Month calculations
-        mom_change = latest_month[col] - previous_month[col]
-        mom_pct = (mom_change / previous_month[col] * 100) if previous_month[col] != 0 else 0
-        report_data['MoM Change'].append(mom_change)
-        report_data['MoM %'].append(mom_pct)
-        
-        # Year-over-Year calculations (if data available)
-        if previous_year_same_month is not None:
-            yoy_change = latest_month[col] - previous_year_same_month[col]
-            yoy_pct = (yoy_change / previous_year_same_month[col] * 100) if previous_year_same_month[col] != 0 else 0
-            report_data['YoY Change'].append(yoy_change)
-            report_data['YoY %'].append(yoy_pct)
-        else:
-            report_data['YoY Change'].append(np.nan)
-            report_data['YoY %'].append(np.nan)
-    
-    # Create the report dataframe
-    report_df = pd.DataFrame(report_data)
-    
-    # Format the numeric columns
-    for col in ['Current Value', 'MoM Change', 'YoY Change']:
-        report_df[col] = report_df[col].map('{:,.2f}'.format)
-    
-    for col in ['MoM %', 'YoY %']:
-        report_df[col] = report_df[col].map('{:,.2f}%'.format)
+    # Seasonal indices by month and the 12-month forecasts of each model
+    with span('forecast', rows=len(df)):
+        seasonality = seasonal_index_frame(df).rename_axis('Month')
+        forecasts = forecast(load_models(df), horizon=12).rename_axis('date')
+    forecasts.columns = [f"{metric} ({model})" for metric, model in forecasts.columns]
+
+    # Growth phases of every metric (and every segment of a segmented feed)
+    with span('phases', rows=len(segmented)):
+        phases = growth_phases(segmented)
+
+    # Monte Carlo fan of the baseline scenario and annual percentiles of every scenario
+    with span('scenarios', rows=len(df)):
+        fan = scenario_fan(df)
+        scenarios = scenario_summary(df)
     
     # Save report to Excel
     report_file = f"{output_dir}/mobile_money_report_{timestamp}.xlsx"
-    with pd.ExcelWriter(report_file, engine='xlsxwriter') as writer:
-        # Write the report
-        report_df.to_excel(writer, sheet_name='Monthly Summary', index=False)
-        
-        # Write the raw data
-        df.to_excel(writer, sheet_name='Raw Data', index=False)
-        
-        # Access the workbook and worksheet objects
-        workbook = writer.book
-        
-        # Add formats
-        header_format = workbook.add_format({
-            'bold': True,
-            'text_wrap': True,
-            'valign': 'top',
-            'bg_color': '#D9E1F2',
-            'border': 1
-        })
-        
-        # Create charts in Excel
-        chart_sheet = workbook.add_worksheet('Charts')
-        
-        # Create a chart for registered accounts
-        accounts_chart = workbook.add_chart({'type': 'line'})
-        
-        # Configure the series for the chart
-        accounts_chart.add_series({
-            'name': 'Registered Accounts',
-            'categories': ['Raw Data', 1, df.columns.get_loc('date'), len(df), df.columns.get_loc('date')],
-            'values': ['Raw Data', 1, df.columns.get_loc('Total Registered Mobile Money Accounts (Millions)'), 
-                       len(df), df.columns.get_loc('Total Registered Mobile Money Accounts (Millions)')],
-        })
-        
-        accounts_chart.set_title({'name': 'Mobile Money Account Growth'})
-        accounts_chart.set_x_axis({'name': 'Date'})
-        accounts_chart.set_y_axis({'name': 'Number of Accounts'})
-        
-        chart_sheet.insert_chart('B2', accounts_chart, {'x_scale': 1.5, 'y_scale': 1.5})
+    extra_sheets = {'Seasonality': seasonality}
+    if len(forecasts.columns):
+        # Metrics without enough history are not forecast; the sheet is left out if none are
+        extra_sheets['Forecast'] = forecasts
+    extra_sheets.update({'Growth Phases': phases, 'Scenarios': scenarios})
+    if SEGMENT_COLUMN in segmented.columns:
+        # Per-segment growth and the full segmented data behind it
+        cagr = cagr_by_segment(segmented) * 100
+        cagr.columns = [f"{col} CAGR %" for col in cagr.columns]
+        extra_sheets['Segment CAGR'] = cagr
+        extra_sheets['Segment Data'] = segmented.set_index([SEGMENT_COLUMN, 'date'])
+    with span('excel', rows=len(df), sheets=2 + len(extra_sheets)):
+        write_report(report_file, report_df, df, extra_sheets, fan=fan)
     
-    print(f"Analysis completed at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     print(f"Report saved to {report_file}")
-    
     return report_file
 
-def send_email_report(report_file, recipient_email, sender_email, password):
+def send_email_report(report_file, recipient_email, sender_email, password, host=None, port=None,
+                      batch_size=50, workers=4):
     """
-    Send the report via email.
+    Send the report via email to one address or a list of addresses. Recipients are sent
+    in batches over pooled SMTP connections with retries (see delivery.py); the host and
+    port default to SMTP_SERVER and SMTP_PORT from the environment.
     Note: For production use, consider using a more secure approach for credentials.
     """
+    from delivery import SmtpPool, deliver_report
+
+    recipients = [recipient_email] if isinstance(recipient_email, str) else list(recipient_email)
+    overrides = {'username': sender_email, 'password': password, 'size': workers}
+    if host is not None:
+        overrides['host'] = host
+    if port is not None:
+        overrides['port'] = port
+
     try:
-        # Create message
-        msg = MIMEMultipart()
-        msg['From'] = sender_email
-        msg['To'] = recipient_email
-        msg['Subject'] = f"Mobile Money Analysis Report - {datetime.now().strftime('%Y-%m-%d')}"
-        
-        # Message body
-        body = """
-        Hello,
-        
-        Please find attached the latest Mobile Money Analysis Report.
-        
-        Best regards,
-        Your Automation System
-        """
-        msg.attach(MIMEText(body, 'plain'))
-        
-        # Attach the report
-        with open(report_file, "rb") as file:
-            part = MIMEApplication(file.read(), Name=os.path.basename(report_file))
-        
-        part['Content-Disposition'] = f'attachment; filename="{os.path.basename(report_file)}"'
-        msg.attach(part)
-        
-        # Send email
-        server = smtplib.SMTP('smtp.gmail.com', 587)
-        server.starttls()
-        server.login(sender_email, password)
-        server.send_message(msg)
-        server.quit()
-        
-        print(f"Email sent successfully to {recipient_email}")
-        return True
-    
+        with SmtpPool.from_env(**overrides) as pool:
+            records = deliver_report(report_file, recipients, sender=sender_email, pool=pool,
+                                     batch_size=batch_size, workers=workers)
     except Exception as e:
         print(f"Failed to send email: {str(e)}")
         return False
 
+    if records and all(record['ok'] for record in records):
+        print(f"Email sent successfully to {len(recipients)} recipients")
+        return True
+    return False
+
 # Example usage
 if __name__ == "__main__":
-    report_file = run_mobile_money_analysis()
+    import argparse
+    parser = argparse.ArgumentParser(description="Generate the mobile money analysis report")
+    parser.add_argument('--incremental', action='store_true',
+                        help="only ingest months newer than the last run")
+    args = parser.parse_args()
+
+    report_file = run_mobile_money_analysis(incremental=args.incremental)
     
     # Uncomment to send email (replace with actual credentials)
     # send_email_report(
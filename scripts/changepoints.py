@@ -0,0 +1,171 @@
+"""
+Change-point detection of growth phases.
+
+A phase is a run of months whose monthly log growth varies around one mean, so phase
+boundaries are the months where a metric's growth rate shifted. detect_phases() finds
+them with PELT (pruned exact linear time) under a Gaussian mean-shift cost:
+
+    cost(s, t) = sum of squared deviations of growth in months s..t-1 from their mean
+
+which is computed in O(1) for any (s, t) from cumulative sums of the growth, its square
+and the count of observed months. Each boundary costs a penalty proportional to the
+series' noise variance times log(months), estimated robustly from month-to-month changes
+of growth so one large shift does not inflate it. Values shaped (..., T, N) are solved in
+batches of series: a batch advances through the months in step and candidates pruned for
+all its series are dropped from the shared candidate range, so a (segments, T, 4) block
+costs a few NumPy operations per month and batch rather than a Python loop per series.
+
+Missing months (NaN) add nothing to the sums, which lets segments of different lengths
+share one block from monthly_blocks().
+"""
+import warnings
+import numpy as np
+import pandas as pd
+from metrics_store import numeric_columns, SEGMENT_COLUMN
+from rolling import log_growth
+from spectral import monthly_blocks
+
+# Shortest phase in observed months
+MIN_SIZE = 12
+# Boundary penalty in units of noise variance times log(months)
+PENALTY = 3.0
+# Series solved together: larger batches spread the per-month NumPy overhead, smaller ones
+# let pruning shrink the shared candidate range sooner
+BATCH = 256
+
+
+def noise_variance(growth):
+    """
+    Robust variance of each series' growth around its local mean, shaped (..., N): the
+    median absolute month-to-month change scaled to a normal standard deviation. Changes
+    of growth have twice its variance, hence the sqrt(2).
+    """
+    changes = np.diff(growth, axis=-2)
+    # Series without two observed changes get NaN; NumPy warns about those rather than erroring
+    with np.errstate(all='ignore'), warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        mad = np.nanmedian(np.abs(changes - np.nanmedian(changes, axis=-2, keepdims=True)), axis=-2)
+    return (1.4826 * mad / np.sqrt(2)) ** 2
+
+
+def _pelt(count, sum_x, sum_xx, beta, min_size):
+    # Optimal cost of months [0, t) and start of its last phase, for a batch of series
+    n_rows, n = count.shape[0], count.shape[1] - 1
+    rows = np.arange(n_rows)
+    best = np.full((n_rows, n + 1), np.inf)
+    best[:, 0] = -beta
+    last = np.zeros((n_rows, n + 1), dtype=np.int64)
+    alive = np.zeros((n_rows, n + 1), dtype=bool)
+    alive[:, 0] = True
+    lo = 0
+    for t in range(1, n + 1):
+        alive[:, t] = True
+        # Candidate starts of the last phase: s in [lo, hi] still alive for the series. A
+        # phase must hold min_size observed months, so later starts cannot qualify yet;
+        # s = 0 stays a candidate while the months so far hold no observation at all
+        hi = max(t - min_size, 0)
+        if hi < lo:
+            continue
+        s = slice(lo, hi + 1)
+        size = count[:, t, None] - count[:, s]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            span_cost = (sum_xx[:, t, None] - sum_xx[:, s]
+                         - (sum_x[:, t, None] - sum_x[:, s]) ** 2 / np.maximum(size, 1))
+        total = np.where(alive[:, s], best[:, s] + span_cost, np.inf)
+        ok = size >= min_size
+        if lo == 0:
+            ok[:, 0] |= size[:, 0] == 0
+        candidates = np.where(ok, total + beta[:, None], np.inf)
+        choice = candidates.argmin(axis=1)
+        best[:, t] = candidates[rows, choice]
+        last[:, t] = lo + choice
+
+        # PELT pruning: a start whose cost already exceeds the optimum can never win later
+        alive[:, s] &= ~(ok & (total > best[:, t, None]))
+        while lo < t and not alive[:, lo].any():
+            lo += 1
+    return best, last
+
+
+def detect_phases(growth, min_size=MIN_SIZE, penalty=PENALTY):
+    """
+    Phase number of every month for growth shaped (..., T, N), numbered from 0 within
+    each series; returns an int array shaped like growth. Series with no observed months
+    stay in phase 0.
+    """
+    growth = np.asarray(growth, dtype=float)
+    n = growth.shape[-2]
+    # One row per series: (S, T)
+    flat = np.moveaxis(growth, -1, -2).reshape(-1, n)
+    observed = ~np.isnan(flat)
+    x = np.where(observed, flat, 0.0)
+
+    # Prefix sums so the cost of any span of months is O(1)
+    zeros = np.zeros((len(flat), 1))
+    count = np.hstack([zeros, np.cumsum(observed, axis=1)])
+    sum_x = np.hstack([zeros, np.cumsum(x, axis=1)])
+    sum_xx = np.hstack([zeros, np.cumsum(x ** 2, axis=1)])
+
+    variance = noise_variance(flat[..., None])[..., 0]
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        variance = np.where(np.isfinite(variance) & (variance > 0), variance, np.nanvar(flat, axis=1))
+    beta = penalty * np.nan_to_num(variance) * np.log(np.maximum(count[:, -1], 2))
+
+    best = np.empty((len(flat), n + 1))
+    last = np.zeros((len(flat), n + 1), dtype=np.int64)
+    for rows in range(0, len(flat), BATCH):
+        batch = slice(rows, rows + BATCH)
+        best[batch], last[batch] = _pelt(count[batch], sum_x[batch], sum_xx[batch], beta[batch], min_size)
+
+    # Walk the optimal boundaries back from the end of each series
+    labels = np.zeros((len(flat), n), dtype=np.int64)
+    for row in range(len(flat)):
+        bounds = []
+        t = n
+        while t > 0 and np.isfinite(best[row, t]):
+            bounds.append(t)
+            t = last[row, t]
+        for phase, (start, end) in enumerate(zip([0] + bounds[::-1][:-1], bounds[::-1])):
+            labels[row, start:end] = phase
+    return np.moveaxis(labels.reshape(growth.shape[:-2] + growth.shape[-1:] + (n,)), -1, -2)
+
+
+def growth_phases(df, columns=None, min_size=MIN_SIZE, penalty=PENALTY):
+    """
+    Growth phases of every metric for every segment: one row per (segment, metric,
+    phase) with its first and last month, length and annualized mean growth.
+    """
+    columns = list(columns or numeric_columns)
+    names, dates, values = monthly_blocks(df, columns)
+    growth = log_growth(values)
+    labels = detect_phases(growth, min_size, penalty)
+    observed = ~np.isnan(values)
+
+    records = []
+    for i, segment in enumerate(names):
+        for j, metric in enumerate(columns):
+            months = np.flatnonzero(observed[i, :, j])
+            if not len(months):
+                continue
+            phase_of = labels[i, months, j]
+            starts = np.flatnonzero(np.r_[True, phase_of[1:] != phase_of[:-1]])
+            ends = np.r_[starts[1:], len(months)] - 1
+            for phase, (first, end) in enumerate(zip(months[starts], months[ends])):
+                rates = growth[i, first:end + 1, j]
+                rates = rates[~np.isnan(rates)]
+                records.append((segment, metric, phase + 1, dates[first], dates[end], end - first + 1,
+                                np.expm1(rates.mean() * 12) * 100 if len(rates) else np.nan))
+
+    index = [SEGMENT_COLUMN, 'metric', 'phase']
+    return pd.DataFrame.from_records(
+        records, columns=index + ['start', 'end', 'months', 'annualized_growth_%']).set_index(index)
+
+
+def boundaries(phases):
+    """
+    First month of every phase after the first, per (segment, metric): the months where
+    growth shifted.
+    """
+    later = phases[phases.index.get_level_values('phase') > 1]
+    return later['start'].droplevel('phase').groupby(level=[0, 1]).agg(list)
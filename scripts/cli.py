@@ -0,0 +1,281 @@
+"""
+Command line entry point for the mobile money analysis pipeline.
+
+Usage:
+    python scripts/cli.py clean
+    python scripts/cli.py ingest
+    python scripts/cli.py analyze
+    python scripts/cli.py charts --output-dir reports/assests
+    python scripts/cli.py report --incremental
+    python scripts/cli.py stream transactions.csv monthly.csv --sorted
+    python scripts/cli.py summary --as-of 2024-06 2024-12
+    python scripts/cli.py summary --all --output summary_history.csv
+    python scripts/cli.py scenarios --scenario slowdown --horizon 70 --paths 20000
+    python scripts/cli.py query --start 2024-01 --end 2024-12 --metric "Active Agents" --segment national
+    python scripts/cli.py query --summaries --start 2024-12 --measure YoY YTD
+    python scripts/cli.py schedule --every 3600 --recipients team@example.com
+    python scripts/cli.py serve --port 8000
+    python scripts/cli.py memory
+    python scripts/cli.py warm
+    python scripts/cli.py spans --since 2024-06-01
+    python scripts/cli.py --profile report
+
+Every command logs timing spans (wall and CPU time, rows, peak memory) to
+data/processed/spans.jsonl; --profile also writes a cProfile and tracemalloc dump of the run.
+"""
+import argparse
+import os
+import sys
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, base_dir)
+
+
+# Each command imports its module on demand so `--help` and unrelated commands stay fast
+def run_clean(args):
+    from data_exploration import main
+    main()
+
+
+def run_ingest(args):
+    from ingest import ingest
+    ingest()
+
+
+def run_analyze(args):
+    from data_analysis import main
+    main()
+
+
+def run_charts(args):
+    from visualisation import main
+    main(output_dir=args.output_dir, workers=args.workers, force=args.force)
+
+
+def run_report(args):
+    from automated_analysis import RAW_DATA_PATH, run_mobile_money_analysis
+    run_mobile_money_analysis(input_file=args.input or RAW_DATA_PATH, output_dir=args.output_dir,
+                              incremental=args.incremental, record_type=args.record_type)
+
+
+def run_forecast(args):
+    import pandas as pd
+    from forecasting import load_models, forecast, backtest, backtest_summary
+    from metrics_store import load_metrics, segment_frame
+
+    df = segment_frame(load_metrics())
+    if args.backtest:
+        result = backtest_summary(backtest(df, horizon=args.horizon))
+    else:
+        result = forecast(load_models(df), args.horizon)
+    with pd.option_context('display.width', 200, 'display.max_columns', 20):
+        print(result.round(2))
+
+
+def run_stream(args):
+    from streaming import aggregate_stream
+    df, _ = aggregate_stream(args.input, record_type=args.record_type, batch_rows=args.batch_rows,
+                             sorted_input=args.sorted, agent_output=args.agent_output)
+    df.to_csv(args.output, index=False)
+    print(f"Monthly aggregates saved to: {args.output}")
+
+
+def run_summary(args):
+    import pandas as pd
+    from metrics_store import load_metrics
+    from summary import summary_as_of, summary_history
+
+    df = load_metrics()
+    result = summary_history(df) if args.all else summary_as_of(df, args.as_of)
+    if args.output:
+        result.to_csv(args.output)
+        print(f"Summary saved to: {args.output}")
+    else:
+        with pd.option_context('display.width', 200, 'display.max_columns', 20):
+            print(result.round(2))
+
+
+def run_scenarios(args):
+    import pandas as pd
+    from metrics_store import load_metrics, segment_frame
+    from scenarios import scenario_summary
+
+    df = segment_frame(load_metrics())
+    result = scenario_summary(df, args.scenario, horizon=args.horizon, paths=args.paths, seed=args.seed)
+    with pd.option_context('display.width', 200, 'display.max_columns', 10, 'display.max_rows', 200):
+        print(result.round(2))
+
+
+def run_query(args):
+    import pandas as pd
+    from sqlite_store import MetricsDB, sync_store
+
+    db_path = sync_store()
+    with MetricsDB(db_path) as db:
+        if args.summaries:
+            result = db.summaries(args.start, args.end, args.segment, args.metric, args.measure)
+        else:
+            result = db.metrics(args.metric, args.start, args.end, args.segment)
+    if args.output:
+        result.to_csv(args.output, index=False)
+        print(f"Query result saved to: {args.output}")
+    else:
+        with pd.option_context('display.width', 200, 'display.max_columns', 20, 'display.max_rows', 200):
+            print(result.round(2))
+
+
+def run_schedule(args):
+    from scheduler import run_daemon, run_pipeline
+
+    recipients = args.recipients or [r for r in os.environ.get('REPORT_RECIPIENTS', '').split(',') if r.strip()]
+    options = dict(raw_path=args.input, report_dir=args.output_dir, recipients=recipients,
+                   workers=args.workers)
+    if args.every:
+        run_daemon(args.every, **options)
+    else:
+        status = run_pipeline(force=args.force, **options)
+        if any(value in ('failed', 'blocked') for value in status.values()):
+            sys.exit(1)
+
+
+def run_serve(args):
+    from metrics_api import serve
+    serve(host=args.host, port=args.port)
+
+
+def run_memory(args):
+    import pandas as pd
+    from metrics_store import compact_frame, load_metrics, memory_report
+
+    df = load_metrics()
+    full, compact = memory_report(df), memory_report(compact_frame(df))
+    report = full[['dtype', 'bytes']].join(compact[['dtype', 'bytes']], rsuffix='_compact')
+    with pd.option_context('display.width', 200, 'display.max_columns', 10, 'display.max_rows', 100):
+        print(report.fillna({'dtype_compact': 'dropped', 'bytes_compact': 0}).astype({'bytes_compact': int}))
+    print(f"\nTotal: {full['bytes'].sum() / 1024:,.1f} KiB, compact: {compact['bytes'].sum() / 1024:,.1f} KiB "
+          f"for {len(df):,} rows")
+
+
+def run_warm(args):
+    from dashboard_cache import warm
+    warm()
+
+
+def run_spans(args):
+    import pandas as pd
+    from instrumentation import read_spans, span_summary
+
+    spans = read_spans()
+    if spans.empty:
+        print("No spans logged yet")
+        return
+    since = pd.Timestamp(args.since) if args.since else None
+    with pd.option_context('display.width', 200, 'display.max_columns', 10, 'display.max_rows', 100):
+        print(span_summary(spans, since).round(3))
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Kenya mobile money analysis pipeline")
+    parser.add_argument('--profile', action='store_true',
+                        help="profile the command with cProfile and tracemalloc (dumps to data/processed/profiles)")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    commands.add_parser('clean', help="clean the raw dataset and save the processed data").set_defaults(func=run_clean)
+    commands.add_parser('ingest', help="append new months from the raw feed").set_defaults(func=run_ingest)
+    commands.add_parser('analyze', help="print correlations and CAGR").set_defaults(func=run_analyze)
+
+    charts = commands.add_parser('charts', help="render the report charts")
+    charts.add_argument('--output-dir', default=os.path.join(base_dir, '..', 'reports', 'assests'))
+    charts.add_argument('--workers', type=int, default=None, help="number of rendering processes")
+    charts.add_argument('--force', action='store_true', help="re-render charts even if their inputs are unchanged")
+    charts.set_defaults(func=run_charts)
+
+    report = commands.add_parser('report', help="generate the Excel report")
+    report.add_argument('--output-dir', default='reports')
+    report.add_argument('--incremental', action='store_true', help="only ingest months newer than the last run")
+    report.add_argument('--input', help="input file (defaults to the raw monthly dataset)")
+    report.add_argument('--record-type', choices=['transaction', 'agent'],
+                        help="treat --input as a record-level feed and aggregate it by month")
+    report.set_defaults(func=run_report)
+
+    forecast = commands.add_parser('forecast', help="forecast every metric from the cached models")
+    forecast.add_argument('--horizon', type=int, default=12, help="months ahead")
+    forecast.add_argument('--backtest', action='store_true', help="print backtest MAPE by model, metric and horizon")
+    forecast.set_defaults(func=run_forecast)
+
+    stream = commands.add_parser('stream', help="aggregate a transaction- or agent-level feed by month")
+    stream.add_argument('input', help="CSV or Parquet file of records")
+    stream.add_argument('output', help="CSV file for the monthly aggregates")
+    stream.add_argument('--record-type', choices=['transaction', 'agent'], default='transaction')
+    stream.add_argument('--batch-rows', type=int, default=1_000_000, help="rows per chunk")
+    stream.add_argument('--sorted', action='store_true', help="input is time-ordered, close months as they pass")
+    stream.add_argument('--agent-output', help="directory for per-agent monthly totals (Parquet)")
+    stream.set_defaults(func=run_stream)
+
+    summary = commands.add_parser('summary', help="MoM, QoQ, YoY and YTD changes as of given months")
+    summary.add_argument('--as-of', nargs='+', help="dates to summarise (defaults to the latest month)")
+    summary.add_argument('--all', action='store_true', help="summarise every month, e.g. to backfill reports")
+    summary.add_argument('--output', help="CSV file for the summary instead of printing it")
+    summary.set_defaults(func=run_summary)
+
+    scenarios = commands.add_parser('scenarios', help="annual percentiles of Monte Carlo scenarios of every metric")
+    scenarios.add_argument('--scenario', nargs='+', choices=['baseline', 'slowdown', 'acceleration', 'volatile'],
+                           help="scenarios to simulate (defaults to all)")
+    scenarios.add_argument('--horizon', type=int, default=60, help="months ahead")
+    scenarios.add_argument('--paths', type=int, default=10_000, help="simulated paths per scenario")
+    scenarios.add_argument('--seed', type=int, default=0, help="random seed")
+    scenarios.set_defaults(func=run_scenarios)
+
+    query = commands.add_parser('query', help="slice the indexed metrics database by date range and segment")
+    query.add_argument('--start', help="first month (inclusive)")
+    query.add_argument('--end', help="last month (inclusive)")
+    query.add_argument('--segment', nargs='+', help="segments to return (defaults to all)")
+    query.add_argument('--metric', nargs='+', help="metrics to return (defaults to all)")
+    query.add_argument('--summaries', action='store_true', help="query the MoM/QoQ/YoY/YTD summaries instead")
+    query.add_argument('--measure', nargs='+', choices=['MoM', 'QoQ', 'YoY', 'YTD'],
+                       help="summary measures to return (defaults to all)")
+    query.add_argument('--output', help="CSV file for the result instead of printing it")
+    query.set_defaults(func=run_query)
+
+    schedule = commands.add_parser('schedule', help="run the ingest-to-email pipeline, skipping unchanged stages")
+    schedule.add_argument('--every', type=int, help="keep running as a daemon, once every N seconds")
+    schedule.add_argument('--input', help="raw monthly dataset (defaults to data/Mobile Payments.csv)")
+    schedule.add_argument('--output-dir', default=os.path.abspath(os.path.join(base_dir, '..', 'reports')),
+                          help="directory for the Excel reports")
+    schedule.add_argument('--recipients', nargs='*',
+                          help="report recipients (defaults to the comma-separated REPORT_RECIPIENTS)")
+    schedule.add_argument('--force', nargs='*', default=[],
+                          choices=['ingest', 'derive', 'forecast', 'charts', 'warm', 'excel', 'email'],
+                          help="re-run these stages and everything downstream of them")
+    schedule.add_argument('--workers', type=int, default=None, help="chart rendering processes")
+    schedule.set_defaults(func=run_schedule)
+
+    serve = commands.add_parser('serve', help="serve the metrics as a read-only JSON API")
+    serve.add_argument('--host', default='127.0.0.1', help="interface to listen on")
+    serve.add_argument('--port', type=int, default=8000)
+    serve.set_defaults(func=run_serve)
+
+    commands.add_parser('memory', help="print memory per column of the metrics frame, full and compact"
+                        ).set_defaults(func=run_memory)
+    commands.add_parser('warm', help="prebuild the dashboard's start-up snapshot for the current data"
+                        ).set_defaults(func=run_warm)
+
+    spans = commands.add_parser('spans', help="total the logged timing spans by stage, slowest first")
+    spans.add_argument('--since', help="only spans started on or after this date or time")
+    spans.set_defaults(func=run_spans)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.profile:
+        from instrumentation import profile_run
+        with profile_run():
+            args.func(args)
+    else:
+        args.func(args)
+
+
+if __name__ == "__main__":
+    main()
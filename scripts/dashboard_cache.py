@@ -0,0 +1,122 @@
+"""
+Warm-start snapshot of what the dashboard loads on its first run.
+
+warm() builds the dashboard's cached resources for the default view (the compact metrics
+frame, the segment names and CAGR table, and for the national series the RangeIndex with
+its full-range results, the downsampling levels, the growth phases, the rolling
+statistics for the default window, the fitted forecast models and the default scenario
+fan) and pickles them into one file per data version under DASHBOARD_CACHE_DIR. It runs
+at deploy time (`python scripts/cli.py warm`) and as the scheduler's last stage, so a
+freshly started dashboard unpickles a single file instead of reading Parquet, deriving
+and fitting. A snapshot for another data version is ignored and the
+dashboard builds what it needs itself.
+
+The dashboard's loaders call the build_* functions here too, so a value read from the
+snapshot is the value the dashboard would have computed.
+"""
+import glob
+import os
+import pickle
+import time
+import pandas as pd
+from metrics_store import CLEANED_DATA_PATH, compact_frame, data_version, load_metrics, segment_frame, segments
+
+# Default location of the snapshots
+base_dir = os.path.dirname(os.path.abspath(__file__))
+DASHBOARD_CACHE_DIR = os.path.abspath(os.path.join(base_dir, '..', 'data', 'processed', 'dashboard_cache'))
+
+# Initial value of the dashboard's rolling window slider
+DEFAULT_WINDOW = 12
+
+
+def snapshot_path(version, cache_dir=DASHBOARD_CACHE_DIR):
+    return os.path.join(cache_dir, f"dashboard_{version}.pkl")
+
+
+def build_index(df, segment):
+    from range_index import RangeIndex
+
+    # A national series summed over segments is rebuilt in full precision, so compact it again
+    return RangeIndex(compact_frame(segment_frame(df, segment)))
+
+
+def build_levels(index):
+    from downsampling import FrameLevels
+
+    df = index.df
+    columns = [col for col in df.columns if col != 'date' and pd.api.types.is_numeric_dtype(df[col])]
+    return FrameLevels(df, columns)
+
+
+def build_rolling(index, window):
+    from rolling import rolling_frame, seasonal_index_frame
+
+    return rolling_frame(index.df, window), seasonal_index_frame(index.df)
+
+
+def build_snapshot(source_path=CLEANED_DATA_PATH, window=DEFAULT_WINDOW):
+    """
+    The dashboard's resources for the default view, keyed like its loaders:
+    'data', 'segments', 'segment_cagr', and ('index' | 'levels' | 'phases' | 'forecast_models', segment),
+    ('rolling', window, segment) and ('fan', scenario, segment) for the national series.
+    """
+    from changepoints import growth_phases
+    from data_analysis import cagr_by_segment
+    from forecasting import load_models
+    from scenarios import DEFAULT_SCENARIO, scenario_fan
+
+    df = load_metrics(source_path=source_path, compact=True)
+    segment = segments(df)[0]
+    index = build_index(df, segment)
+
+    # Results of the full date range, which is what a new session shows first
+    start, end = index.dates[0], index.dates[-1]
+    for metric in ('slice', 'deltas', 'correlation'):
+        index.get(start, end, metric)
+
+    return {
+        'data': df,
+        'segments': segments(df),
+        'segment_cagr': cagr_by_segment(df),
+        ('index', segment): index,
+        ('levels', segment): build_levels(index),
+        ('phases', segment): growth_phases(index.df),
+        ('rolling', window, segment): build_rolling(index, window),
+        ('forecast_models', segment): load_models(index.df),
+        ('fan', DEFAULT_SCENARIO, segment): scenario_fan(index.df, DEFAULT_SCENARIO),
+    }
+
+
+def read_snapshot(source_path=CLEANED_DATA_PATH, cache_dir=DASHBOARD_CACHE_DIR):
+    """
+    The snapshot for the current version of the source dataset, or {} when it has not been warmed.
+    """
+    file_path = snapshot_path(data_version(source_path), cache_dir)
+    if not os.path.exists(file_path):
+        return {}
+    with open(file_path, 'rb') as f:
+        return pickle.load(f)
+
+
+def warm(source_path=CLEANED_DATA_PATH, cache_dir=DASHBOARD_CACHE_DIR):
+    """
+    Build and save the snapshot for the current data version, removing older ones.
+    Returns the snapshot path.
+    """
+    started = time.perf_counter()
+    snapshot = build_snapshot(source_path)
+    os.makedirs(cache_dir, exist_ok=True)
+    file_path = snapshot_path(data_version(source_path), cache_dir)
+
+    # Write to a temporary file first so a starting dashboard never reads a partial snapshot
+    tmp_path = f"{file_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, file_path)
+    for stale in glob.glob(os.path.join(cache_dir, 'dashboard_*.pkl')):
+        if stale != file_path:
+            os.remove(stale)
+
+    size = os.path.getsize(file_path) / 1024
+    print(f"Dashboard snapshot written to {file_path} ({size:,.0f} KiB, {time.perf_counter() - started:.1f}s)")
+    return file_path
@@ -1,57 +1,131 @@
-from data_exploration import numeric_columns, df
+import numpy as np
+import pandas as pd
+from data_exploration import numeric_columns
+from metrics_store import MONTH_LABELS, SEGMENT_COLUMN, NATIONAL, derive_metrics, load_metrics, segment_frame
+from spectral import dominant_periods, lead_lag_table
+from changepoints import growth_phases
+from instrumentation import span
 
 # Create a function to calculate year-over-year growth
 def calculate_yoy_growth(df, column):
     # Calculate absolute year-over-year difference
     yoy_diff = df[column].diff(12)
-    
+
     # Calculate percentage growth
     yoy_pct = df[column].pct_change(12) * 100
-    
-    return yoy_diff, yoy_pct
-
-# Apply to each main metric
-for column in numeric_columns:
-    col_name = column.split(' ')[-1] if 'Total' in column else column.replace(' ', '_')
-    diff_col = f"{col_name}_yoy_diff"
-    pct_col = f"{col_name}_yoy_growth"
-    
-    df[diff_col], df[pct_col] = calculate_yoy_growth(df, column)
 
-# Calculate monthly growth rates
-for column in numeric_columns:
-    col_name = column.split(' ')[-1] if 'Total' in column else column.replace(' ', '_')
-    df[f"{col_name}_monthly_growth"] = df[column].pct_change() * 100
-
-# Calculate per account metrics
-df['transactions_per_account'] = df['Total Agent Cash in Cash Out (Volume Million)'] / df['Total Registered Mobile Money Accounts (Millions)']
-df['value_per_account'] = df['Total Agent Cash in Cash Out (Value KSh billions)'] / df['Total Registered Mobile Money Accounts (Millions)']
-df['value_per_transaction'] = df['Total Agent Cash in Cash Out (Value KSh billions)'] / df['Total Agent Cash in Cash Out (Volume Million)']
+    return yoy_diff, yoy_pct
 
-# Calculate transactions per agent
-df['transactions_per_agent'] = df['Total Agent Cash in Cash Out (Volume Million)'] / df['Active Agents']
-df['value_per_agent'] = df['Total Agent Cash in Cash Out (Value KSh billions)'] / df['Active Agents']
+# Add YoY, monthly growth and per account/agent metrics in one vectorized pass
+def add_derived_metrics(df):
+    derived = derive_metrics(df)
+    return pd.concat([df.drop(columns=derived.columns, errors='ignore'), derived], axis=1)
 
 # Check correlations between key metrics
-correlation = df[numeric_columns].corr()
-print("\nCorrelation matrix:")
-print(correlation)
+def correlation_matrix(df):
+    with span('correlate', rows=len(df)):
+        return df[numeric_columns].corr()
 
 # Calculate seasonal patterns (monthly averages)
-monthly_patterns = df.groupby(df['date'].dt.month)[numeric_columns].mean()
-monthly_patterns.index = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 
-                          'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+def seasonal_patterns(df):
+    monthly_patterns = df.groupby(df['date'].dt.month)[numeric_columns].mean()
+    monthly_patterns.index = [MONTH_LABELS[month - 1] for month in monthly_patterns.index]
+    return monthly_patterns
 
 # Calculate compound annual growth rate (CAGR)
 def calculate_cagr(start_value, end_value, num_years):
     return (end_value / start_value) ** (1 / num_years) - 1
 
-# Calculate for each numeric column
-for col in numeric_columns:
-    start_val = df[col].iloc[0]
-    end_val = df[col].iloc[-1]
+# Calculate CAGR for each numeric column
+def cagr_by_metric(df):
     years = df['date'].iloc[-1].year - df['date'].iloc[0].year + (df['date'].iloc[-1].month - df['date'].iloc[0].month) / 12
-    
-    if start_val > 0:  # Avoid division by zero
-        cagr = calculate_cagr(start_val, end_val, years)
-        print(f"CAGR for {col}: {cagr:.2%}")
\ No newline at end of file
+
+    cagr = {}
+    for col in numeric_columns:
+        start_val = df[col].iloc[0]
+        end_val = df[col].iloc[-1]
+
+        if start_val > 0:  # Avoid division by zero
+            cagr[col] = calculate_cagr(start_val, end_val, years)
+    return pd.Series(cagr)
+
+# Segment of each row as integer codes plus the segment names, one group for unsegmented frames
+def _segment_groups(df):
+    if SEGMENT_COLUMN not in df.columns:
+        return np.zeros(len(df), dtype=np.int64), pd.Index([NATIONAL], name=SEGMENT_COLUMN)
+    codes, names = pd.factorize(df[SEGMENT_COLUMN])
+    return codes, pd.Index(names, name=SEGMENT_COLUMN)
+
+# Calculate CAGR of every metric for every segment at once from each segment's first and last month
+def cagr_by_segment(df):
+    codes, names = _segment_groups(df)
+    grouped = df[['date'] + numeric_columns].groupby(codes, sort=False)
+    first, last = grouped.first(), grouped.last()
+
+    years = ((last['date'].dt.year - first['date'].dt.year)
+             + (last['date'].dt.month - first['date'].dt.month) / 12).to_numpy()[:, None]
+    start = first[numeric_columns].to_numpy(dtype=float)
+    end = last[numeric_columns].to_numpy(dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cagr = np.where((start > 0) & (years > 0), (end / start) ** (1 / years) - 1, np.nan)
+    return pd.DataFrame(cagr, index=names[first.index], columns=numeric_columns)
+
+# Correlation matrix of the metrics for every segment from grouped sums of centered products
+def correlation_by_segment(df):
+    codes, names = _segment_groups(df)
+    values = df[numeric_columns].to_numpy(dtype=float)
+    k = len(numeric_columns)
+
+    # Center each segment on its own mean so the sums of products stay well conditioned
+    means = pd.DataFrame(values).groupby(codes).mean().to_numpy()
+    centered = values - means[codes]
+    products = (centered[:, :, None] * centered[:, None, :]).reshape(len(values), k * k)
+    cov = pd.DataFrame(products).groupby(codes).sum().to_numpy().reshape(-1, k, k)
+
+    std = np.sqrt(np.einsum('sii->si', cov))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        corr = np.clip(cov / (std[:, :, None] * std[:, None, :]), -1, 1)
+    index = pd.MultiIndex.from_product([names, numeric_columns], names=[SEGMENT_COLUMN, None])
+    return pd.DataFrame(corr.reshape(-1, k), index=index, columns=numeric_columns)
+
+# Print the analysis for the current processed dataset
+def main():
+    metrics = load_metrics()
+    df = segment_frame(metrics)
+
+    print("\nCorrelation matrix:")
+    print(correlation_matrix(df))
+
+    for col, cagr in cagr_by_metric(df).items():
+        print(f"CAGR for {col}: {cagr:.2%}")
+
+    if SEGMENT_COLUMN in metrics.columns:
+        print("\nCAGR by segment:")
+        print(cagr_by_segment(metrics).map('{:.2%}'.format))
+
+    print("\nLead/lag of monthly growth (best_lag > 0: metric leads other):")
+    print(lead_lag_table(metrics).round(3))
+
+    print("\nDominant periods of monthly growth (months):")
+    print(dominant_periods(metrics).round(3))
+
+    print("\nGrowth phases (change points in monthly log growth):")
+    print(growth_phases(metrics).round(1))
+
+# Results used by the charts are computed on first access, e.g. `data_analysis.correlation`
+_cache = {}
+_lazy = {
+    'df': lambda: segment_frame(load_metrics()),
+    'correlation': lambda: correlation_matrix(__getattr__('df')),
+    'monthly_patterns': lambda: seasonal_patterns(__getattr__('df')),
+}
+
+def __getattr__(name):
+    if name in _lazy:
+        if name not in _cache:
+            _cache[name] = _lazy[name]()
+        return _cache[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+if __name__ == "__main__":
+    main()
@@ -1,92 +1,95 @@
 import pandas as pd
 import os
-import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
+from instrumentation import span, timed
+from metrics_store import numeric_columns, CLEANED_DATA_PATH
+from validation import QUARANTINE_PATH
 
-# Set visualization style
-# print(plt.style.available)
-plt.style.use('seaborn-v0_8-whitegrid')
-sns.set_palette("deep")
+# Default location of the raw dataset
+base_dir = os.path.dirname(os.path.abspath(__file__))
+RAW_DATA_PATH = os.path.abspath(os.path.join(base_dir, '..', 'data', 'Mobile Payments.csv'))
 
 # Load the data
-def load_data():
-    # Get the absolute path of the current script (e.g., dashboard/)
-    base_dir = os.path.dirname(os.path.abspath(__file__))
-
-    # Navigate one level up, then into data/processed/
-    file_path = os.path.join(base_dir, '..', 'data', 'Mobile Payments.csv')
-    file_path = os.path.abspath(file_path)  # Resolves ".." properly
-
+@timed('load', rows=len)
+def load_data(file_path=RAW_DATA_PATH):
     print(f"Loading data from: {file_path}")  # Optional for debugging
 
     df = pd.read_csv(file_path)
     return df
 
-# Load the data
-df = load_data()
-
-
-# Display the first few rows to understand the structure
-print("First 5 rows of the dataset:")
-print(df.head())
+# Print an overview of the raw dataset
+def describe_data(df):
+    # Display the first few rows to understand the structure
+    print("First 5 rows of the dataset:")
+    print(df.head())
 
-# Check the data types of each column
-print("\nData types:")
-print(df.dtypes)
+    # Check the data types of each column
+    print("\nData types:")
+    print(df.dtypes)
 
-# Check dataset dimensions
-print(f"\nDataset dimensions: {df.shape[0]} rows and {df.shape[1]} columns")
+    # Check dataset dimensions
+    print(f"\nDataset dimensions: {df.shape[0]} rows and {df.shape[1]} columns")
 
-# Check column names
-print("\nColumn names:")
-print(df.columns.tolist())
+    # Check column names
+    print("\nColumn names:")
+    print(df.columns.tolist())
 
-# Check for missing values
-print("\nMissing values in each column:")
-print(df.isnull().sum())
+    # Check for missing values
+    print("\nMissing values in each column:")
+    print(df.isnull().sum())
 
 # Data cleaning and preparation
+def clean_data(df, quarantine_path=QUARANTINE_PATH):
+    from ingest import parse_rows
 
-# Convert full month names to month numbers
-df['Month'] = pd.to_datetime(df['Month'], format='%B').dt.month
+    # Parse month names and numbers with thousands separators, validate every row and
+    # quarantine malformed rows instead of failing on the first bad cell
+    # (quarantine_path=None drops them without writing the quarantine file)
+    return parse_rows(df.astype(str), quarantine_path=quarantine_path)
 
-# Create a proper date column
-df['date'] = pd.to_datetime(df[['Year', 'Month']].assign(day=1))
+# Save the cleaned dataset
+def save_data(df, file_path=CLEANED_DATA_PATH):
+    from storage import write_processed
 
-# Sort by date to ensure chronological order
-df = df.sort_values('date')
+    print(f"Saving data to: {file_path}")  # Optional for debugging
 
-# Check for any duplicates
-print(f"\nNumber of duplicate rows: {df.duplicated().sum()}")
+    with span('save', rows=len(df)):
+        # Also write the typed, year-partitioned Parquet dataset used by the batch jobs
+        write_processed(df)
 
-# Convert numeric columns if they're not already
-numeric_columns = ['Active Agents', 'Total Registered Mobile Money Accounts (Millions)', 
-                   'Total Agent Cash in Cash Out (Volume Million)', 'Total Agent Cash in Cash Out (Value KSh billions)']
+        return df.to_csv(file_path, index=False)
 
-for col in numeric_columns:
-    if df[col].dtype == 'object':
-        # Remove commas and convert to numeric
-        df[col] = df[col].str.replace(',', '').astype(float)
+# Load the processed dataset, preferring the typed Parquet store over the cleaned CSV
+def load_processed(columns=None):
+    from storage import processed_exists, read_processed
 
-# Add year-month column for easier grouping
-df['year_month'] = df['date'].dt.strftime('%Y-%m')
+    if processed_exists():
+        return read_processed(columns)
+    df = pd.read_csv(CLEANED_DATA_PATH, parse_dates=['date']).sort_values('date').reset_index(drop=True)
+    return df[columns] if columns is not None else df
 
-# Save the cleaned dataset
-def save_data():
-    # Get the absolute path of the current script (e.g., dashboard/)
-    base_dir = os.path.dirname(os.path.abspath(__file__))
+# Run the full exploration and cleaning step
+def main():
+    df = load_data()
+    describe_data(df)
 
-    # Navigate one level up, then into data/processed/
-    file_path = os.path.join(base_dir, '..', 'data', 'processed', 'cleaned_mobile_payments.csv')
+    df = clean_data(df)
 
-    file_path = os.path.abspath(file_path)  # Resolves ".." properly
+    save_data(df)
 
-    print(f"Saving data to: {file_path}")  # Optional for debugging
+    print("\nSummary statistics of the cleaned numeric data:")
+    print(df[numeric_columns].describe())
+    return df
 
-    return df.to_csv(file_path, index=False)
+# The cleaned frame is only built when first accessed as `data_exploration.df`; reading
+# it does not append to the quarantine file, only main() (the cleaning step) does
+_cache = {}
 
-save_data()
+def __getattr__(name):
+    if name == 'df':
+        if 'df' not in _cache:
+            _cache['df'] = clean_data(load_data(), quarantine_path=None)
+        return _cache['df']
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-print("\nSummary statistics of the cleaned numeric data:")
-print(df[numeric_columns].describe())
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+"""
+Report delivery over a pool of reusable SMTP connections.
+
+Recipients are split into batches and each batch is one message whose envelope lists the
+batch's addresses (they are not shown in the headers); it is serialised once and the same
+bytes are sent for every batch. Batches are sent concurrently by a small thread pool,
+each thread borrowing an open, logged-in connection from SmtpPool, so a fan-out to
+hundreds of recipients costs a handful of logins rather than one per recipient.
+Transient failures (dropped connections, 4xx replies, timeouts) are retried with
+exponential backoff; permanent 5xx rejections and other SMTP errors are not. Every
+message's latency, attempts and outcome are returned and can be appended to a JSON lines log.
+
+Connection settings come from the environment (SMTP_SERVER, SMTP_PORT, EMAIL_SENDER,
+EMAIL_PASSWORD, SMTP_STARTTLS), so a local SMTP stand-in can be used for testing.
+"""
+import json
+import os
+import queue
+import smtplib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+from email.mime.application import MIMEApplication
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from tenacity import Retrying, retry_if_exception, stop_after_attempt, wait_exponential
+from instrumentation import span
+
+DEFAULT_BODY = """
+Hello,
+
+Please find attached the latest Mobile Money Analysis Report.
+
+Best regards,
+Your Automation System
+"""
+
+
+def smtp_settings():
+    """
+    SMTP connection settings from the environment, defaulting to Gmail with STARTTLS.
+    """
+    return {
+        'host': os.environ.get('SMTP_SERVER', 'smtp.gmail.com'),
+        'port': int(os.environ.get('SMTP_PORT', 587)),
+        'username': os.environ.get('EMAIL_SENDER'),
+        'password': os.environ.get('EMAIL_PASSWORD'),
+        'starttls': os.environ.get('SMTP_STARTTLS', 'true').lower() not in ('0', 'false', 'no'),
+    }
+
+
+def is_transient(exc):
+    """
+    Whether a send failure is worth retrying: connection problems and 4xx replies.
+    Other SMTP errors (5xx replies, no usable auth method, ...) are permanent.
+    """
+    if isinstance(exc, (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError)):
+        return True
+    if isinstance(exc, smtplib.SMTPRecipientsRefused):
+        return all(400 <= code < 500 for code, _ in exc.recipients.values())
+    if isinstance(exc, smtplib.SMTPResponseException):
+        return 400 <= exc.smtp_code < 500
+    if isinstance(exc, smtplib.SMTPException):
+        return False
+    return isinstance(exc, (ConnectionError, TimeoutError))
+
+
+class SmtpPool:
+    """
+    Up to `size` open SMTP connections shared between threads. Connections are opened
+    on first use and returned to the pool after each message; a connection that fails
+    is closed and replaced on the next checkout.
+    """
+
+    def __init__(self, host='smtp.gmail.com', port=587, username=None, password=None,
+                 starttls=True, size=4, timeout=30):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self.opened = 0
+
+    @classmethod
+    def from_env(cls, **overrides):
+        return cls(**{**smtp_settings(), **overrides})
+
+    def _open(self):
+        if self.port == 465:
+            server = smtplib.SMTP_SSL(self.host, self.port, timeout=self.timeout)
+        else:
+            server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+            if self.starttls:
+                server.starttls()
+        if self.username and self.password:
+            server.login(self.username, self.password)
+        with self._lock:
+            self.opened += 1
+        return server
+
+    @contextmanager
+    def connection(self):
+        with self._slots:
+            try:
+                server = self._idle.get_nowait()
+            except queue.Empty:
+                server = self._open()
+            try:
+                yield server
+            except Exception:
+                self._discard(server)
+                raise
+            self._idle.put(server)
+
+    @staticmethod
+    def _discard(server):
+        try:
+            server.close()
+        except Exception:
+            pass
+
+    def close(self):
+        while True:
+            try:
+                server = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                server.quit()
+            except Exception:
+                self._discard(server)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def build_message(report_file, sender, subject=None, body=DEFAULT_BODY):
+    """
+    The report email with the file attached; recipients are given per send as the envelope.
+    """
+    msg = MIMEMultipart()
+    msg['From'] = sender
+    msg['To'] = 'undisclosed-recipients:;'
+    msg['Subject'] = subject or f"Mobile Money Analysis Report - {datetime.now().strftime('%Y-%m-%d')}"
+    msg.attach(MIMEText(body, 'plain'))
+
+    with open(report_file, 'rb') as file:
+        part = MIMEApplication(file.read(), Name=os.path.basename(report_file))
+    part['Content-Disposition'] = f'attachment; filename="{os.path.basename(report_file)}"'
+    msg.attach(part)
+    return msg
+
+
+def batches(recipients, batch_size):
+    recipients = list(dict.fromkeys(recipients))
+    return [recipients[i:i + batch_size] for i in range(0, len(recipients), batch_size)]
+
+
+def send_batch(pool, message, sender, recipients, attempts=4, max_wait=30):
+    """
+    Send one serialised message (bytes, as from build_message(...).as_bytes()) to a batch
+    of recipients, retrying transient failures with exponential backoff. Returns a record
+    of the outcome, attempts and latency.
+    """
+    record = {'recipients': len(recipients), 'attempts': 0, 'ok': False, 'error': None}
+    start = time.perf_counter()
+    retrying = Retrying(stop=stop_after_attempt(attempts), wait=wait_exponential(multiplier=0.5, max=max_wait),
+                        retry=retry_if_exception(is_transient), reraise=True)
+    try:
+        for attempt in retrying:
+            with attempt:
+                record['attempts'] += 1
+                with pool.connection() as server:
+                    refused = server.sendmail(sender, recipients, message)
+        record['ok'] = True
+        if refused:
+            record['refused'] = sorted(refused)
+    except Exception as e:
+        record['error'] = f"{type(e).__name__}: {e}"
+    record['seconds'] = time.perf_counter() - start
+    return record
+
+
+def deliver_report(report_file, recipients, sender=None, pool=None, batch_size=50, workers=4,
+                   subject=None, log_path=None):
+    """
+    Email the report to every recipient in batches of `batch_size`, sending up to
+    `workers` batches at once over pooled connections. Returns one record per message.
+    """
+    own_pool = pool is None
+    pool = pool or SmtpPool.from_env(size=workers)
+    sender = sender or pool.username
+    # Flattening a message sets its multipart boundary, so it is done once here rather than
+    # by every sending thread on the shared message
+    message = build_message(report_file, sender, subject).as_bytes()
+
+    start = time.perf_counter()
+    try:
+        with span('email', rows=len(recipients)), ThreadPoolExecutor(max_workers=workers) as executor:
+            records = list(executor.map(lambda batch: send_batch(pool, message, sender, batch),
+                                        batches(recipients, batch_size)))
+    finally:
+        if own_pool:
+            pool.close()
+
+    sent = sum(record['recipients'] for record in records if record['ok'])
+    latencies = sorted(record['seconds'] for record in records)
+    if latencies:
+        print(f"Sent {len(records)} messages to {sent}/{sum(r['recipients'] for r in records)} recipients "
+              f"in {time.perf_counter() - start:.2f}s over {pool.opened} connections "
+              f"(median {latencies[len(latencies) // 2]:.3f}s, max {latencies[-1]:.3f}s per message)")
+    for record in records:
+        if not record['ok']:
+            print(f"Failed to send to {record['recipients']} recipients after {record['attempts']} "
+                  f"attempts: {record['error']}")
+
+    if log_path is not None:
+        timestamp = datetime.now().isoformat(timespec='seconds')
+        with open(log_path, 'a') as f:
+            for record in records:
+                f.write(json.dumps({'timestamp': timestamp, 'report': os.path.basename(report_file), **record}) + '\n')
+    return records
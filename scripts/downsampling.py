@@ -0,0 +1,199 @@
+"""
+Downsampling of time series to a point budget before they are plotted.
+
+lttb_indices() implements Largest-Triangle-Three-Buckets, which keeps the points that
+preserve the visual shape of a line; minmax_indices() keeps the minimum and maximum of
+each bucket, which preserves spikes exactly. Both return positions into the input, so
+the selected rows can be taken from a frame.
+
+SeriesLevels precomputes selections of a full series at doubling point budgets (1x, 2x,
+4x, ... the base budget, then full resolution). Each level is reduced from the next finer
+one: min/max buckets for the large levels, then LTTB on those pre-selected points for the
+levels up to LTTB_MAX_LEVEL budgets, so building all levels costs about two passes over
+the data. A date-range query picks the finest level that still fits the budget inside
+the range and slices it with searchsorted, so any range is served without recomputation
+and zooming into a short range gives full detail. FrameLevels does the same for several
+columns of a frame. A frame that feeds several traces shares its point budget between
+their columns, so the rows returned stay within it.
+"""
+import numpy as np
+import pandas as pd
+
+# About one point per horizontal pixel of a full-width chart
+DEFAULT_POINTS = 1000
+# Levels up to this many times the base budget use LTTB, larger ones min/max buckets
+LTTB_MAX_LEVEL = 8
+
+
+def _as_float(x):
+    x = np.asarray(x)
+    if np.issubdtype(x.dtype, np.datetime64):
+        return x.astype('datetime64[ns]').astype(np.int64).astype(float)
+    return x.astype(float)
+
+
+def lttb_indices(x, y, n_out):
+    """
+    Positions of the n_out points chosen by Largest-Triangle-Three-Buckets. The first and
+    last points are always kept; x must be increasing and y finite.
+    """
+    x, y = _as_float(x), np.asarray(y, dtype=float)
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    # n_out - 2 buckets over the interior points, and the average point of each bucket
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    counts = np.diff(edges)
+    avg_x = np.add.reduceat(x[:n - 1], edges[:-1]) / counts
+    avg_y = np.add.reduceat(y[:n - 1], edges[:-1]) / counts
+
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        # Third vertex: the next bucket's average, or the last point after the final bucket
+        cx, cy = (avg_x[i + 1], avg_y[i + 1]) if i + 1 < n_out - 2 else (x[n - 1], y[n - 1])
+        area = np.abs((x[a] - cx) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (cy - y[a]))
+        a = lo + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+def minmax_indices(y, n_buckets):
+    """
+    Positions of the minimum and maximum of each of n_buckets equal-width buckets plus the
+    first and last points, in order. y must be finite.
+    """
+    y = np.asarray(y, dtype=float)
+    n = len(y)
+    if 2 * n_buckets + 2 >= n:
+        return np.arange(n)
+
+    # Pad with the last value to a (n_buckets, width) block so each bucket is one row
+    width = -(-n // n_buckets)
+    block = np.concatenate([y, np.full(width * n_buckets - n, y[-1])]).reshape(n_buckets, width)
+    offsets = np.arange(n_buckets) * width
+    lows = np.minimum(offsets + block.argmin(axis=1), n - 1)
+    highs = np.minimum(offsets + block.argmax(axis=1), n - 1)
+    return np.unique(np.concatenate([lows, highs, [0, n - 1]]))
+
+
+def select(x, y, n_out, method='lttb'):
+    """
+    Positions of at most n_out points of (x, y); non-finite y values are dropped.
+    """
+    y = np.asarray(y, dtype=float)
+    finite = np.flatnonzero(np.isfinite(y))
+    if n_out < (3 if method == 'lttb' else 4) and len(finite) > n_out:
+        # Too few points for buckets: the first (and last) point
+        return finite[np.unique(np.linspace(0, len(finite) - 1, max(n_out, 1)).astype(np.int64))]
+    if method == 'lttb':
+        chosen = lttb_indices(np.asarray(x)[finite], y[finite], n_out)
+    elif method == 'minmax':
+        chosen = minmax_indices(y[finite], max(n_out // 2 - 1, 1))
+    else:
+        raise ValueError(f"Unknown downsampling method: {method}")
+    return finite[chosen]
+
+
+def union_within(choose, columns, max_points):
+    """
+    Union of every column's selection, choose(column, budget) -> positions, with the
+    largest per-column budget that keeps it within max_points rows. Selections of several
+    columns share most rows (the ends, the same spikes), so the budget is searched for
+    rather than split evenly; an even split always fits and is the starting point.
+    """
+    def union(budget):
+        return np.unique(np.concatenate([choose(col, budget) for col in columns]))
+
+    lo, hi = max(max_points // max(len(columns), 1), 1), max_points
+    rows = union(lo)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        candidate = union(mid)
+        if len(candidate) <= max_points:
+            lo, rows = mid, candidate
+        else:
+            hi = mid - 1
+    return rows
+
+
+def downsample_frame(df, x_column, columns, max_points=DEFAULT_POINTS, method='lttb'):
+    """
+    At most max_points rows of df to draw its columns: the union of every column's
+    selection (see union_within), so one frame can feed several traces.
+    """
+    if len(df) <= max_points:
+        return df
+    x = df[x_column].to_numpy()
+    values = {col: df[col].to_numpy(dtype=float) for col in columns}
+    rows = union_within(lambda col, budget: select(x, values[col], budget, method), columns, max_points)
+    return df.iloc[rows]
+
+
+class SeriesLevels:
+    """
+    Precomputed selections of one series at doubling point budgets, coarsest first.
+    """
+
+    def __init__(self, x, y, base_points=DEFAULT_POINTS):
+        x, y = _as_float(x), np.asarray(y, dtype=float)
+        finite = np.flatnonzero(np.isfinite(y))
+        self.x, self.y = x, y
+
+        sizes = []
+        while base_points * 2 ** len(sizes) < len(finite):
+            sizes.append(base_points * 2 ** len(sizes))
+
+        # Each level is reduced from the next finer one
+        self.levels = [finite]
+        for size in reversed(sizes):
+            points = self.levels[0]
+            if size <= base_points * LTTB_MAX_LEVEL:
+                chosen = lttb_indices(x[points], y[points], size)
+            else:
+                chosen = minmax_indices(y[points], size // 2 - 1)
+            self.levels.insert(0, points[chosen])
+
+    def indices(self, lo, hi, max_points=DEFAULT_POINTS):
+        """
+        Positions in [lo, hi) to plot: the finest level with at most max_points points in
+        the range, or the coarsest level's points in the range reduced to max_points when
+        even that has more.
+        """
+        for level in reversed(self.levels):
+            start, end = np.searchsorted(level, [lo, hi])
+            if end - start <= max_points:
+                return level[start:end]
+        rows = self.levels[0][start:end]
+        return rows[select(self.x[rows], self.y[rows], max_points)]
+
+
+class FrameLevels:
+    """
+    SeriesLevels for several columns of a date-sorted frame, queried by date range.
+    """
+
+    def __init__(self, df, columns, x_column='date', base_points=DEFAULT_POINTS):
+        self.df = df
+        self.x_column = x_column
+        self.x = self.df[x_column].to_numpy()
+        self.series = {col: SeriesLevels(self.x, self.df[col].to_numpy(dtype=float), base_points)
+                       for col in columns}
+
+    def bounds(self, start, end):
+        lo = np.searchsorted(self.x, np.datetime64(pd.Timestamp(start), 'ns'), side='left')
+        hi = np.searchsorted(self.x, np.datetime64(pd.Timestamp(end), 'ns'), side='right')
+        return int(lo), int(max(lo, hi))
+
+    def frame(self, columns, start, end, max_points=DEFAULT_POINTS):
+        """
+        At most max_points rows between start and end (inclusive) to draw the columns.
+        """
+        lo, hi = self.bounds(start, end)
+        if hi - lo <= max_points:
+            return self.df.iloc[lo:hi]
+        rows = union_within(lambda col, budget: self.series[col].indices(lo, hi, budget), columns, max_points)
+        return self.df.iloc[rows]
@@ -0,0 +1,275 @@
+"""
+Per-metric forecasting with cached model parameters.
+
+Three models are fitted on log values for each of the numeric_columns:
+
+- seasonal_baseline: the same month last year plus the average YoY log growth of the last year
+- holt_winters: additive Holt-Winters (level, trend, 12-month seasonality) on log values,
+  with smoothing parameters chosen by scipy.optimize
+- regression: ridge regression on a linear trend and month-of-year dummies over the
+  most recent `REGRESSION_WINDOW` months
+
+Fits run in parallel with joblib and the fitted parameters are stored per data version,
+so the dashboard and report only run inference. backtest() evaluates the baseline and
+regression models at many cutoffs in one batched solve instead of refitting in a loop.
+scipy, scikit-learn and joblib are imported only when models are fitted or read from disk,
+so importing this module for inference is cheap.
+"""
+import os
+import glob
+import re
+import numpy as np
+import pandas as pd
+from metrics_store import NATIONAL, SEGMENT_COLUMN, numeric_columns
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+MODELS_DIR = os.path.abspath(os.path.join(base_dir, '..', 'data', 'processed', 'models'))
+
+MODELS = ['seasonal_baseline', 'holt_winters', 'regression']
+PERIOD = 12
+REGRESSION_WINDOW = 60
+RIDGE_ALPHA = 1e-3
+# Months of positive values a metric needs to be fitted: the seasonal baseline's drift and
+# the Holt-Winters start-up both compare two full years
+MIN_HISTORY = 2 * PERIOD
+
+
+def _design(t, months):
+    # Trend in decades keeps the normal equations well conditioned; one dummy per month
+    return np.column_stack([np.asarray(t, dtype=float) / 120, np.eye(PERIOD)[np.asarray(months) - 1]])
+
+
+def _months_after(last_date, horizon):
+    dates = pd.date_range(last_date + pd.DateOffset(months=1), periods=horizon, freq='MS')
+    return dates, dates.month.to_numpy()
+
+
+def fit_seasonal_baseline(log_values):
+    last_year = log_values[-PERIOD:]
+    drift = np.mean(log_values[-PERIOD:] - log_values[-2 * PERIOD:-PERIOD])
+    return {'last_year': last_year.tolist(), 'drift': float(drift)}
+
+
+def predict_seasonal_baseline(params, horizon):
+    steps = np.arange(horizon)
+    last_year = np.asarray(params['last_year'])
+    return last_year[steps % PERIOD] + params['drift'] * (steps // PERIOD + 1)
+
+
+def _holt_winters_pass(log_values, alpha, beta, gamma):
+    # One filtering pass; returns the one-step-ahead squared error and the final state
+    level = log_values[:PERIOD].mean()
+    trend = (log_values[PERIOD:2 * PERIOD].mean() - level) / PERIOD
+    season = list(log_values[:PERIOD] - level)
+    sse = 0.0
+    for t in range(PERIOD, len(log_values)):
+        s = season[t - PERIOD]
+        error = log_values[t] - (level + trend + s)
+        sse += error * error
+        new_level = alpha * (log_values[t] - s) + (1 - alpha) * (level + trend)
+        trend = beta * (new_level - level) + (1 - beta) * trend
+        season.append(gamma * (log_values[t] - new_level) + (1 - gamma) * s)
+        level = new_level
+    return sse, level, trend, season[-PERIOD:]
+
+
+def fit_holt_winters(log_values):
+    # Imported here so that loading cached models does not pay for scipy
+    from scipy.optimize import minimize
+
+    result = minimize(lambda p: _holt_winters_pass(log_values, *p)[0], x0=[0.5, 0.1, 0.1],
+                      bounds=[(0.01, 0.99)] * 3, method='L-BFGS-B')
+    _, level, trend, season = _holt_winters_pass(log_values, *result.x)
+    return {'alpha': float(result.x[0]), 'beta': float(result.x[1]), 'gamma': float(result.x[2]),
+            'level': float(level), 'trend': float(trend), 'season': [float(s) for s in season]}
+
+
+def predict_holt_winters(params, horizon):
+    steps = np.arange(1, horizon + 1)
+    season = np.asarray(params['season'])
+    return params['level'] + steps * params['trend'] + season[(steps - 1) % PERIOD]
+
+
+def fit_regression(log_values, months):
+    from sklearn.linear_model import Ridge
+
+    t = np.arange(len(log_values))[-REGRESSION_WINDOW:]
+    model = Ridge(alpha=RIDGE_ALPHA, fit_intercept=False)
+    model.fit(_design(t, months[-REGRESSION_WINDOW:]), log_values[-REGRESSION_WINDOW:])
+    return {'coef': model.coef_.tolist(), 'next_t': len(log_values)}
+
+
+def predict_regression(params, horizon, months):
+    t = params['next_t'] + np.arange(horizon)
+    return _design(t, months) @ np.asarray(params['coef'])
+
+
+def _fit_one(model, log_values, months):
+    if model == 'seasonal_baseline':
+        return fit_seasonal_baseline(log_values)
+    if model == 'holt_winters':
+        return fit_holt_winters(log_values)
+    return fit_regression(log_values, months)
+
+
+def _fit_history(values):
+    # First row and log values a metric is fitted on: the run of positive values up to the
+    # last month, or None when it is shorter than MIN_HISTORY
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_values = np.log(np.asarray(values, dtype=float))
+    gaps = np.flatnonzero(~np.isfinite(log_values))
+    start = gaps[-1] + 1 if len(gaps) else 0
+    if len(log_values) - start < MIN_HISTORY:
+        return None
+    return start, log_values[start:]
+
+
+def fit_models(df, n_jobs=-1):
+    """
+    Fit every model for every metric in parallel. Returns {metric: {model: params}}
+    plus the last observed date under '_last_date'. Metrics without MIN_HISTORY months
+    of positive values up to the last month (a short feed, or a transaction feed without
+    account ids) are left out.
+    """
+    import joblib
+
+    months = df['date'].dt.month.to_numpy()
+    tasks = []
+    for col in numeric_columns:
+        history = _fit_history(df[col].to_numpy(dtype=float))
+        if history is None:
+            print(f"Not forecasting {col}: fewer than {MIN_HISTORY} months of values")
+            continue
+        start, log_values = history
+        tasks += [(col, model, log_values, months[start:]) for model in MODELS]
+    results = joblib.Parallel(n_jobs=n_jobs)(
+        joblib.delayed(_fit_one)(model, log_values, fit_months) for _, model, log_values, fit_months in tasks)
+
+    models = {'_last_date': df['date'].iloc[-1].strftime('%Y-%m-%d')}
+    for (col, model, _, _), params in zip(tasks, results):
+        models.setdefault(col, {})[model] = params
+    return models
+
+
+def _segment_key(segment):
+    # Segment names as they appear in file names
+    return re.sub(r'[^A-Za-z0-9_-]', '_', str(segment))
+
+
+def models_path(version, models_dir=MODELS_DIR, segment=NATIONAL):
+    return os.path.join(models_dir, f"forecast_models_{_segment_key(segment)}_{version}.joblib")
+
+
+def load_models(df=None, models_dir=MODELS_DIR, n_jobs=-1):
+    """
+    Fitted parameters for a frame (the national metrics by default), keyed by its segment
+    and a hash of its contents. Models are fitted and cached on first use for each data
+    version; older versions of the same segment's models are removed, other segments' kept.
+    """
+    import joblib
+    from metrics_store import frame_version, load_metrics, segment_frame
+
+    df = df if df is not None else segment_frame(load_metrics())
+    segment = df[SEGMENT_COLUMN].iloc[0] if SEGMENT_COLUMN in df.columns and len(df) else NATIONAL
+    file_path = models_path(frame_version(df), models_dir, segment)
+    if os.path.exists(file_path):
+        return joblib.load(file_path)
+
+    models = fit_models(df, n_jobs=n_jobs)
+    os.makedirs(models_dir, exist_ok=True)
+    joblib.dump(models, file_path)
+    # Versions are 16 hex digits, so one segment's pattern never matches a longer segment name
+    pattern = f"forecast_models_{glob.escape(_segment_key(segment))}_{'[0-9a-f]' * 16}.joblib"
+    for stale in glob.glob(os.path.join(models_dir, pattern)):
+        if stale != file_path:
+            os.remove(stale)
+    return models
+
+
+def forecast(models, horizon=12):
+    """
+    Forecast every fitted metric with every model from cached parameters (inference only).
+    Returns a frame indexed by date with one column per (metric, model); it has no columns
+    when no metric had enough history to be fitted.
+    """
+    dates, months = _months_after(pd.Timestamp(models['_last_date']), horizon)
+    data = {}
+    for col in numeric_columns:
+        if col not in models:
+            continue
+        params = models[col]
+        data[(col, 'seasonal_baseline')] = predict_seasonal_baseline(params['seasonal_baseline'], horizon)
+        data[(col, 'holt_winters')] = predict_holt_winters(params['holt_winters'], horizon)
+        data[(col, 'regression')] = predict_regression(params['regression'], horizon, months)
+    result = np.exp(pd.DataFrame(data, index=dates, dtype=float))
+    result.columns = pd.MultiIndex.from_arrays([[col for col, _ in data], [model for _, model in data]],
+                                               names=['metric', 'model'])
+    return result
+
+
+def backtest(df, cutoffs=None, horizon=12):
+    """
+    Evaluate the seasonal baseline and regression models at many cutoffs at once.
+
+    The regression's normal equations for every cutoff come from prefix sums of X'X and X'y,
+    so all cutoffs and all metrics are solved in one batched np.linalg.solve call.
+    Returns a long frame of (cutoff, model, metric, horizon, actual, forecast, ape).
+    """
+    log_values = np.log(df[numeric_columns].to_numpy(dtype=float))
+    months = df['date'].dt.month.to_numpy()
+    n = len(df)
+    if cutoffs is None:
+        cutoffs = np.arange(max(REGRESSION_WINDOW, 2 * PERIOD), n - horizon + 1)
+    else:
+        cutoffs = np.searchsorted(df['date'].to_numpy(), pd.to_datetime(cutoffs).to_numpy(), side='right')
+    cutoffs = np.asarray(cutoffs)
+    cutoffs = cutoffs[(cutoffs >= max(REGRESSION_WINDOW, 2 * PERIOD)) & (cutoffs + horizon <= n)]
+
+    # Cutoff c means rows [0, c) are observed; forecasts are for rows c .. c + horizon - 1
+    future = cutoffs[:, None] + np.arange(horizon)
+    actual = log_values[future]
+
+    # Seasonal baseline: same month last year plus the mean YoY log growth over the last year
+    steps = np.arange(horizon)
+    last_year_rows = cutoffs[:, None] - PERIOD + (steps % PERIOD)
+    year_window = cutoffs[:, None] - PERIOD + np.arange(PERIOD)
+    drift = (log_values[year_window] - log_values[year_window - PERIOD]).mean(axis=1)
+    baseline = log_values[last_year_rows] + drift[:, None, :] * (steps // PERIOD + 1)[None, :, None]
+
+    # Regression: windowed normal equations from prefix sums of the design products
+    X = _design(np.arange(n), months)
+    p = X.shape[1]
+    xtx = np.zeros((n + 1, p, p))
+    xtx[1:] = np.cumsum(X[:n, :, None] * X[:n, None, :], axis=0)
+    xty = np.zeros((n + 1, p, len(numeric_columns)))
+    xty[1:] = np.cumsum(X[:n, :, None] * log_values[:, None, :], axis=0)
+
+    start = cutoffs - REGRESSION_WINDOW
+    A = xtx[cutoffs] - xtx[start] + RIDGE_ALPHA * np.eye(p)
+    b = xty[cutoffs] - xty[start]
+    coef = np.linalg.solve(A, b)
+    regression = np.einsum('chp,cpm->chm', X[future], coef)
+
+    frames = []
+    for model, predicted in [('seasonal_baseline', baseline), ('regression', regression)]:
+        c, h, m = np.meshgrid(np.arange(len(cutoffs)), steps, np.arange(len(numeric_columns)), indexing='ij')
+        actual_values = np.exp(actual[c, h, m])
+        forecast_values = np.exp(predicted[c, h, m])
+        frames.append(pd.DataFrame({
+            'cutoff': df['date'].to_numpy()[cutoffs - 1][c.ravel()],
+            'model': model,
+            'metric': np.asarray(numeric_columns)[m.ravel()],
+            'horizon': h.ravel() + 1,
+            'actual': actual_values.ravel(),
+            'forecast': forecast_values.ravel(),
+        }))
+    result = pd.concat(frames, ignore_index=True)
+    result['ape'] = (result['forecast'] - result['actual']).abs() / result['actual'] * 100
+    return result
+
+
+def backtest_summary(results):
+    """
+    Mean absolute percentage error by model, metric and horizon.
+    """
+    return results.groupby(['model', 'metric', 'horizon'])['ape'].mean().unstack('horizon')
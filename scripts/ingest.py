@@ -0,0 +1,226 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+from metrics_store import (numeric_columns, CLEANED_DATA_PATH, SEGMENT_COLUMN, data_version, build_metrics,
+                           extend_metrics, sort_frame, segment_frame)
+from storage import PROCESSED_DATASET_DIR, write_processed, append_processed, processed_exists, read_processed
+from sqlite_store import STORE_PATH, update_store, write_store
+from validation import QUARANTINE_PATH, parse_numeric, quarantine, report_issues, validate
+from instrumentation import span, timed
+
+# Default locations of the raw feed and the ingestion state
+base_dir = os.path.dirname(os.path.abspath(__file__))
+RAW_DATA_PATH = os.path.abspath(os.path.join(base_dir, '..', 'data', 'Mobile Payments.csv'))
+INGEST_STATE_PATH = os.path.abspath(os.path.join(base_dir, '..', 'data', 'processed', 'ingest_state.json'))
+
+MONTH_NUMBERS = {name: number for number, name in enumerate(
+    ['January', 'February', 'March', 'April', 'May', 'June', 'July',
+     'August', 'September', 'October', 'November', 'December'], start=1)}
+
+# Number of trailing months kept in the state for YoY and rolling aggregates
+WINDOW = 12
+
+
+def read_raw(file_path=RAW_DATA_PATH):
+    """
+    Read the raw feed as strings; parsing is deferred until rows are known to be new.
+    """
+    return pd.read_csv(file_path, dtype=str, encoding='utf-8-sig')
+
+
+def period_keys(raw):
+    """
+    Sortable YYYYMM integer key for each raw row, or -1 where Year/Month cannot be read.
+    """
+    years = pd.to_numeric(raw['Year'], errors='coerce')
+    months = raw['Month'].str.strip().str.capitalize().map(MONTH_NUMBERS)
+    months = months.fillna(pd.to_numeric(raw['Month'], errors='coerce'))
+    return (years * 100 + months).fillna(-1).astype(int)
+
+
+def row_hashes(raw):
+    """
+    Content hash of each raw row, used to remember the rows an earlier run quarantined.
+    """
+    return pd.util.hash_pandas_object(raw, index=False).map('{:016x}'.format)
+
+
+def parse_rows(raw, history=None, quarantine_path=QUARANTINE_PATH):
+    """
+    Parse raw rows into the processed schema: numeric month, date, year_month and
+    float metrics with thousands separators removed. Every row is validated; rows with
+    errors (unreadable period or metric, negative values, future months) are appended to
+    the quarantine file instead of aborting (pass quarantine_path=None to skip it), and
+    warnings such as declines and growth outliers are reported. history holds earlier
+    processed rows the growth checks compare the new rows against. A segment column in the
+    feed (operator, county, ...) is kept and rows are ordered by segment then date, with
+    one row per segment and month.
+    """
+    return _parse_rows(raw, history, quarantine_path)[0]
+
+
+@timed('clean', rows=lambda result: len(result[0]))
+def _parse_rows(raw, history=None, quarantine_path=QUARANTINE_PATH):
+    # parse_rows, also returning the index labels of the raw rows with errors
+    keys = period_keys(raw)
+    df = pd.DataFrame({'Year': keys // 100, 'Month': keys % 100}, index=raw.index)
+    df['date'] = pd.to_datetime(pd.DataFrame({'year': df['Year'].where(keys > 0), 'month': df['Month'], 'day': 1}),
+                                errors='coerce')
+    for col in numeric_columns:
+        df[col] = parse_numeric(raw[col])
+    if SEGMENT_COLUMN in raw.columns:
+        df[SEGMENT_COLUMN] = raw[SEGMENT_COLUMN].str.strip()
+
+    with span('validate', rows=len(df)):
+        passed, issues = validate(df, history)
+    report_issues(issues)
+    if quarantine_path is not None:
+        quarantine(raw, issues, quarantine_path)
+    df = df[passed]
+
+    # Format each distinct month once; segmented feeds repeat every month per segment
+    codes, months = pd.factorize(df['date'])
+    df['year_month'] = months.strftime('%Y-%m').to_numpy()[codes]
+    if SEGMENT_COLUMN in df.columns:
+        df = df[['Year', 'Month'] + numeric_columns + ['date', 'year_month', SEGMENT_COLUMN]]
+        df = df.drop_duplicates([SEGMENT_COLUMN, 'date'], keep='last')
+    else:
+        df = df[['Year', 'Month'] + numeric_columns + ['date', 'year_month']]
+        df = df.drop_duplicates('date', keep='last')
+    return sort_frame(df), raw.index[~passed]
+
+
+def load_state(state_path=INGEST_STATE_PATH):
+    if not os.path.exists(state_path):
+        return None
+    with open(state_path) as f:
+        return json.load(f)
+
+
+def save_state(state, state_path=INGEST_STATE_PATH):
+    tmp_path = f"{state_path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, state_path)
+
+
+def _aggregates(state):
+    # YoY, rolling 12-month mean and CAGR from the first row and the trailing window only
+    tail = np.array(state['tail'], dtype=float)
+    first = np.array(state['first_values'], dtype=float)
+    first_date = pd.Timestamp(state['first_date'])
+    last_date = pd.Timestamp(state['high_water_mark'])
+    years = last_date.year - first_date.year + (last_date.month - first_date.month) / 12
+
+    aggregates = {}
+    for i, col in enumerate(numeric_columns):
+        latest = tail[-1, i]
+        year_ago = tail[-WINDOW - 1, i] if len(tail) > WINDOW else np.nan
+        aggregates[col] = {
+            'latest': latest,
+            'yoy_pct': (latest / year_ago - 1) * 100 if year_ago else None,
+            'rolling_12m_mean': tail[-WINDOW:, i].mean(),
+            'cagr': (latest / first[i]) ** (1 / years) - 1 if years > 0 and first[i] > 0 else None,
+        }
+    return {col: {k: (None if v is None or np.isnan(v) else float(v)) for k, v in agg.items()}
+            for col, agg in aggregates.items()}
+
+
+def update_state(state, new_rows):
+    """
+    Fold newly ingested rows into the state: advance the high-water mark, slide the
+    trailing window and refresh the aggregates without touching older history.
+    """
+    values = new_rows[numeric_columns].to_numpy(dtype=float)
+    if state is None:
+        state = {
+            'first_date': new_rows['date'].iloc[0].strftime('%Y-%m-%d'),
+            'first_values': values[0].tolist(),
+            'tail': [],
+            'rows': 0,
+        }
+    # One extra month is kept so YoY can be taken against the same month last year
+    state['tail'] = (state['tail'] + values.tolist())[-(WINDOW + 1):]
+    state['rows'] += len(new_rows)
+    state['high_water_mark'] = new_rows['date'].max().strftime('%Y-%m-%d')
+    state['aggregates'] = _aggregates(state)
+    return state
+
+
+@timed('ingest', rows=len)
+def ingest(raw_path=RAW_DATA_PATH, processed_path=CLEANED_DATA_PATH, state_path=INGEST_STATE_PATH,
+           dataset_dir=PROCESSED_DATASET_DIR, db_path=STORE_PATH, quarantine_path=QUARANTINE_PATH):
+    """
+    Append raw rows newer than the high-water mark to the processed CSV and Parquet
+    datasets and update the derived metrics, the metrics database and the aggregates
+    incrementally. Falls back to a full build when no previous state or processed file
+    exists. Rows with errors are quarantined once: the state remembers their hashes and
+    later runs skip them. Returns the newly ingested rows.
+    """
+    state = load_state(state_path)
+    if state is not None and not os.path.exists(processed_path):
+        state = None
+
+    raw = read_raw(raw_path)
+    quarantined = set(state.get('quarantined', [])) if state is not None else set()
+    if state is not None:
+        # Filter on the cheap period key first so only new rows are parsed; rows whose
+        # period cannot be read are kept so validation quarantines them, and rows an
+        # earlier run already quarantined are dropped so each is quarantined once
+        hwm = pd.Timestamp(state['high_water_mark'])
+        keys = period_keys(raw)
+        raw = raw[((keys > hwm.year * 100 + hwm.month) | (keys < 0)).to_numpy()]
+        raw = raw[~row_hashes(raw).isin(quarantined).to_numpy()]
+
+    if raw.empty:
+        print("No new rows to ingest")
+        return raw
+
+    # New rows are validated against the last two years of history of their segments
+    history = None
+    if state is not None and processed_exists(dataset_dir):
+        history = read_processed(years=range(hwm.year - 1, hwm.year + 1), dataset_dir=dataset_dir)
+    new_rows, rejected = _parse_rows(raw, history, quarantine_path)
+    quarantined |= set(row_hashes(raw.loc[rejected]))
+    if new_rows.empty:
+        if state is not None and len(rejected):
+            state['quarantined'] = sorted(quarantined)
+            save_state(state, state_path)
+        return new_rows
+
+    if state is None:
+        print(f"Full build of {processed_path} from {len(new_rows)} rows")
+        new_rows.to_csv(processed_path, index=False)
+        write_processed(new_rows, dataset_dir)
+        state = update_state(None, segment_frame(new_rows))
+        metrics = build_metrics(processed_path)
+        previous_version = None
+    else:
+        expected = pd.Timestamp(state['high_water_mark']) + pd.DateOffset(months=1)
+        if new_rows['date'].min() != expected:
+            print(f"Warning: gap in feed, expected {expected:%Y-%m} but got {new_rows['date'].min():%Y-%m}")
+
+        previous_version = state.get('data_version')
+        new_rows.to_csv(processed_path, mode='a', header=False, index=False)
+        if processed_exists(dataset_dir):
+            append_processed(new_rows, dataset_dir)
+        else:
+            write_processed(pd.read_csv(processed_path, parse_dates=['date']), dataset_dir)
+        state = update_state(state, segment_frame(new_rows))
+        metrics = extend_metrics(new_rows, previous_version, processed_path)
+
+    state['data_version'] = data_version(processed_path)
+    state['quarantined'] = sorted(quarantined)
+    # The metrics database gets every row after a full build and only the new months otherwise
+    if previous_version is None:
+        write_store(metrics, state['data_version'], db_path)
+    else:
+        update_store(metrics, new_rows['date'].min(), previous_version, state['data_version'], db_path)
+    save_state(state, state_path)
+    print(f"Ingested {len(new_rows)} rows up to {state['high_water_mark']}")
+    return new_rows
+
+
+if __name__ == "__main__":
+    ingest()
@@ -0,0 +1,276 @@
+"""
+Timing spans and opt-in profiling for the pipeline and the dashboard.
+
+A span wraps one step and records its wall time, CPU time, rows processed and memory:
+
+    with span('derive', rows=len(df)):
+        ...
+
+    @timed('excel')
+    def write_report(...):
+        ...
+
+Each finished span is appended as one JSON line to SPAN_LOG_PATH (the PIPELINE_SPAN_LOG
+environment variable overrides it; set it empty to turn logging off). A log that reaches
+SPAN_LOG_MAX_BYTES is rotated to <log>.1, replacing the previous one, so the two files
+stay bounded however often the CLI, timed functions and dashboard reruns write. Spans
+opened inside another span in the same thread record it as their parent. CPU time is the
+process's, so it includes other threads working at the same time (e.g. the scheduler's
+parallel stages). peak_rss_mb is the process's high-water mark when the span ended;
+peak_mb is the highest traced Python memory while the span was open, recorded only
+while tracemalloc is tracing (e.g. under profile_run()) and only for spans in the main
+thread or the thread running profile_run(): tracemalloc has a single process-wide peak
+that every span would otherwise reset. It still counts memory allocated by other threads
+meanwhile, so peak_mb is unreliable while spans run concurrently (e.g. the scheduler's
+parallel stages).
+
+profile_run() profiles a single run with cProfile (the calling thread and any thread
+started during the run) and tracemalloc, and writes a .prof file and the top allocation
+sites to a directory. span_summary() totals the logged spans by name.
+"""
+import contextvars
+import cProfile
+import functools
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+
+# Default location of the span log
+base_dir = os.path.dirname(os.path.abspath(__file__))
+SPAN_LOG_PATH = os.path.abspath(os.path.join(base_dir, '..', 'data', 'processed', 'spans.jsonl'))
+PROFILE_DIR = os.path.abspath(os.path.join(base_dir, '..', 'data', 'processed', 'profiles'))
+# Size at which the span log is rotated
+SPAN_LOG_MAX_BYTES = 10 * 2 ** 20
+
+_current = contextvars.ContextVar('current_span', default=None)
+_write_lock = threading.Lock()
+# tracemalloc keeps one peak for the whole process, so only spans in this thread (the main
+# thread, or the one running profile_run) reset and record it
+_peak_thread = threading.main_thread().ident
+
+
+def peak_rss_mb():
+    """
+    Peak resident set size of this process in MB, or None where it cannot be measured.
+    """
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and in kilobytes elsewhere
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def span_log_path():
+    # Read on every write so the environment can switch the log per process
+    return os.environ.get('PIPELINE_SPAN_LOG', SPAN_LOG_PATH)
+
+
+class Span:
+    """
+    One timed step. Set `rows` or add fields with set() while it is open. Use it as a
+    context manager, or call start() and stop() around code that cannot be indented as
+    one block (such a span is not the parent of spans opened in between).
+    """
+
+    def __init__(self, name, rows=None, **fields):
+        self.name = name
+        self.rows = rows
+        self.fields = fields
+        self.id = uuid.uuid4().hex[:12]
+        self.parent = None
+        self.record = None
+        self._peak = 0
+
+    def set(self, **fields):
+        self.fields.update(fields)
+
+    def _note_peak(self, peak):
+        # tracemalloc keeps a single peak, so each span folds what it saw into its parent
+        self._peak = max(self._peak, peak)
+        if self.parent is not None:
+            self.parent._note_peak(self._peak)
+
+    def _measures_peak(self):
+        return tracemalloc.is_tracing() and threading.get_ident() == _peak_thread
+
+    def start(self):
+        self.parent = _current.get()
+        if self._measures_peak():
+            if self.parent is not None:
+                self.parent._note_peak(tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+        self._started = datetime.now()
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+        return self
+
+    def stop(self, exc_type=None):
+        wall = time.perf_counter() - self._wall
+        cpu = time.process_time() - self._cpu
+        peak_mb = None
+        if self._measures_peak():
+            self._note_peak(tracemalloc.get_traced_memory()[1])
+            peak_mb = round(self._peak / 2 ** 20, 2)
+
+        rss = peak_rss_mb()
+        self.record = {
+            'span': self.name,
+            'id': self.id,
+            'parent': self.parent.id if self.parent is not None else None,
+            'start': self._started.isoformat(timespec='milliseconds'),
+            'wall_s': round(wall, 6),
+            'cpu_s': round(cpu, 6),
+            'rows': self.rows,
+            'peak_mb': peak_mb,
+            'peak_rss_mb': round(rss, 1) if rss is not None else None,
+            'pid': os.getpid(),
+            **self.fields,
+        }
+        if exc_type is not None:
+            self.record['error'] = exc_type.__name__
+        write_span(self.record)
+        return self.record
+
+    def __enter__(self):
+        self.start()
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _current.reset(self._token)
+        self.stop(exc_type)
+        return False
+
+
+def span(name, rows=None, **fields):
+    """
+    Context manager timing the enclosed block; see the module docstring.
+    """
+    return Span(name, rows, **fields)
+
+
+def timed(name=None, rows=None):
+    """
+    Decorator running a function inside a span named after it. `rows` may be a function
+    of the return value, e.g. rows=len.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with Span(name or func.__name__) as s:
+                result = func(*args, **kwargs)
+                if rows is not None:
+                    s.rows = rows(result)
+                return result
+        return wrapper
+    return decorator
+
+
+def write_span(record, log_path=None):
+    log_path = span_log_path() if log_path is None else log_path
+    if not log_path:
+        return
+    line = json.dumps(record, default=str) + '\n'
+    with _write_lock:
+        os.makedirs(os.path.dirname(log_path), exist_ok=True)
+        try:
+            if os.path.getsize(log_path) + len(line) > SPAN_LOG_MAX_BYTES:
+                os.replace(log_path, f"{log_path}.1")
+        except FileNotFoundError:
+            pass
+        with open(log_path, 'a') as f:
+            f.write(line)
+
+
+def read_spans(log_path=None):
+    """
+    The span log (the rotated file, then the current one) as a DataFrame, one row per
+    span, oldest first.
+    """
+    import pandas as pd
+
+    log_path = span_log_path() if log_path is None else log_path
+    paths = [path for path in (f"{log_path}.1", log_path) if log_path and os.path.exists(path)]
+    if not paths:
+        return pd.DataFrame(columns=['span', 'id', 'parent', 'start', 'wall_s', 'cpu_s', 'rows', 'peak_mb',
+                                     'peak_rss_mb', 'pid'])
+    return pd.concat([pd.read_json(path, lines=True, convert_dates=['start']) for path in paths],
+                     ignore_index=True)
+
+
+def span_summary(spans, since=None):
+    """
+    Calls, total and mean wall time, total CPU time, rows and the largest memory peaks of
+    each span name, slowest total first. `since` keeps spans started at or after it.
+    """
+    if since is not None:
+        spans = spans[spans['start'] >= since]
+    grouped = spans.groupby('span')
+    summary = grouped.agg(calls=('wall_s', 'size'), wall_s=('wall_s', 'sum'), mean_wall_s=('wall_s', 'mean'),
+                          cpu_s=('cpu_s', 'sum'), rows=('rows', 'sum'), peak_mb=('peak_mb', 'max'),
+                          peak_rss_mb=('peak_rss_mb', 'max'))
+    return summary.sort_values('wall_s', ascending=False)
+
+
+@contextmanager
+def profile_run(output_dir=PROFILE_DIR, top=25):
+    """
+    Profile the enclosed block with cProfile and tracemalloc. Writes profile_<time>.prof
+    (open with pstats or snakeviz) and allocations_<time>.txt with the `top` allocation
+    sites still alive at the end and the peak of traced memory, and prints the slowest
+    functions by cumulative time.
+    """
+    global _peak_thread
+    profilers = [cProfile.Profile()]
+
+    def start_thread_profiler(*args):
+        # Called on the first event in each new thread: hand the thread over to its own profiler
+        sys.setprofile(None)
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:  # Python 3.12+ allows only one active profiler
+            return
+        profilers.append(profiler)
+
+    started_tracing = not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    threading.setprofile(start_thread_profiler)
+    previous_peak_thread, _peak_thread = _peak_thread, threading.get_ident()
+    profilers[0].enable()
+    try:
+        yield
+    finally:
+        threading.setprofile(None)
+        for profiler in profilers:
+            profiler.disable()
+        _peak_thread = previous_peak_thread
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        if started_tracing:
+            tracemalloc.stop()
+
+        os.makedirs(output_dir, exist_ok=True)
+        stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        stats = pstats.Stats(*profilers)
+        profile_path = os.path.join(output_dir, f"profile_{stamp}.prof")
+        stats.dump_stats(profile_path)
+
+        allocations_path = os.path.join(output_dir, f"allocations_{stamp}.txt")
+        with open(allocations_path, 'w') as f:
+            f.write(f"Peak traced memory: {peak / 2 ** 20:,.1f} MB\n\n")
+            for stat in snapshot.statistics('lineno')[:top]:
+                f.write(f"{stat}\n")
+
+        stats.sort_stats('cumulative').print_stats(top)
+        print(f"Profile written to {profile_path} and {allocations_path}")
@@ -0,0 +1,314 @@
+"""
+Read-only JSON API over the processed metrics.
+
+Endpoints (all GET, all optionally taking segment=<name>):
+
+    /health                                  data version and row count
+    /segments                                segment names, national first
+    /metrics?start=&end=&columns=&max_points=  base and derived metrics in a date range
+    /yoy?start=&end=                         year-over-year growth of the four base metrics
+    /correlations?start=&end=                correlation matrix of the base metrics
+    /seasonal                                seasonal index of each metric by month
+
+Dates are YYYY-MM or YYYY-MM-DD and both ends are inclusive. The metrics store is loaded
+once and each segment gets a RangeIndex, so a range is located with searchsorted and a
+correlation comes from prefix sums. The data is reloaded when cleaned_mobile_payments.csv
+changes.
+
+Every response carries an ETag derived from the data version, the normalised request and
+whether the client accepts gzip (a gzip and an identity body are different representations
+and get different tags, with Vary: Accept-Encoding), so a conditional request
+(If-None-Match) is answered with 304 before any work is done.
+Serialised bodies are kept in an LRU cache, gzip-compressed once when the client accepts it.
+"""
+import gzip
+import hashlib
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+import numpy as np
+import pandas as pd
+from cachetools import LRUCache
+from metrics_store import (CLEANED_DATA_PATH, NATIONAL, compact_frame, data_version, load_metrics, metric_slug,
+                           numeric_columns, segment_frame, segments)
+from range_index import RangeIndex
+
+# Bodies smaller than this are sent uncompressed
+GZIP_MIN_BYTES = 1024
+
+
+def _date(value, default):
+    if value is None:
+        return default
+    try:
+        return pd.Timestamp(value)
+    except ValueError:
+        raise ValueError(f"Invalid date: {value}")
+
+
+def _max_points(value):
+    try:
+        points = int(value)
+    except ValueError:
+        points = 0
+    if points < 1:
+        raise ValueError(f"Invalid max_points: {value}")
+    return points
+
+
+def _month_end(value, default):
+    # An end given as YYYY-MM covers the whole month
+    end = _date(value, default)
+    return end + pd.offsets.MonthEnd(0) if value is not None and len(value) <= 7 else end
+
+
+def frame_records(df):
+    """
+    Rows of a frame as JSON-ready dicts: dates as YYYY-MM-DD strings and missing values as None.
+    """
+    columns = {}
+    for col in df.columns:
+        series = df[col]
+        if pd.api.types.is_datetime64_any_dtype(series):
+            values = series.dt.strftime('%Y-%m-%d').astype(object)
+            columns[col] = values.where(series.notna(), None).tolist()
+        elif pd.api.types.is_float_dtype(series):
+            # float32 columns of the compact frame go through their shortest repr so 1.675
+            # is not sent as 1.6749999523162842
+            floats = series.to_numpy()
+            floats = floats.astype(str).astype(float) if floats.dtype == np.float32 else floats.astype(float)
+            values = floats.astype(object)
+            values[~np.isfinite(floats)] = None
+            columns[col] = values.tolist()
+        elif pd.api.types.is_numeric_dtype(series):
+            columns[col] = series.tolist()
+        else:
+            columns[col] = series.astype(object).where(series.notna(), None).tolist()
+    return [dict(zip(columns, row)) for row in zip(*columns.values())]
+
+
+def matrix_records(df):
+    """
+    A square frame (e.g. a correlation matrix) as {row: {column: value}} with NaN as None.
+    """
+    values = df.to_numpy(dtype=float).astype(object)
+    values[~np.isfinite(df.to_numpy(dtype=float))] = None
+    return {str(row): dict(zip(map(str, df.columns), cells)) for row, cells in zip(df.index, values.tolist())}
+
+
+def _json_default(value):
+    if isinstance(value, pd.Timestamp):
+        return value.strftime('%Y-%m-%d')
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Not JSON serializable: {type(value).__name__}")
+
+
+class MetricsService:
+    """
+    The metrics store with a RangeIndex and seasonal indices per segment, built on first
+    use and rebuilt when the source dataset changes.
+    """
+
+    def __init__(self, source_path=CLEANED_DATA_PATH, cache_size=256):
+        self.source_path = source_path
+        self._lock = threading.Lock()
+        self._stat = None
+        self.version = None
+        self._df = None
+        self._indexes = {}
+        self._seasonal = {}
+        self.responses = LRUCache(maxsize=cache_size)
+
+    def refresh(self):
+        """
+        Reload the metrics if the source file changed since the last load. Returns the data version.
+        """
+        stat = os.stat(self.source_path)
+        key = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            if key != self._stat:
+                version = data_version(self.source_path)
+                if version != self.version:
+                    self._df = load_metrics(source_path=self.source_path, compact=True)
+                    self._indexes, self._seasonal = {}, {}
+                    self.responses.clear()
+                    self.version = version
+                self._stat = key
+            return self.version
+
+    def segments(self):
+        return segments(self._df)
+
+    def index(self, segment=NATIONAL):
+        with self._lock:
+            if segment not in self._indexes:
+                if segment not in segments(self._df):
+                    raise KeyError(f"Unknown segment: {segment}")
+                self._indexes[segment] = RangeIndex(compact_frame(segment_frame(self._df, segment)))
+            return self._indexes[segment]
+
+    def seasonal(self, segment=NATIONAL):
+        from rolling import seasonal_index_frame
+
+        index = self.index(segment)
+        with self._lock:
+            if segment not in self._seasonal:
+                self._seasonal[segment] = seasonal_index_frame(index.df)
+            return self._seasonal[segment]
+
+    def _range(self, index, params):
+        dates = index.dates
+        start = _date(params.get('start'), pd.Timestamp(dates[0]) if len(dates) else pd.Timestamp.min)
+        end = _month_end(params.get('end'), pd.Timestamp(dates[-1]) if len(dates) else pd.Timestamp.max)
+        return start, end
+
+    def metrics(self, params):
+        from downsampling import downsample_frame
+
+        index = self.index(params.get('segment', NATIONAL))
+        start, end = self._range(index, params)
+        columns = params['columns'].split(',') if params.get('columns') else list(numeric_columns)
+        unknown = [col for col in columns if col not in index.df.columns]
+        if unknown:
+            raise ValueError(f"Unknown columns: {', '.join(unknown)}")
+
+        frame = index.slice(start, end)[['date'] + [col for col in columns if col != 'date']]
+        if params.get('max_points'):
+            frame = downsample_frame(frame, 'date', [col for col in frame.columns if col != 'date'],
+                                     _max_points(params['max_points']))
+        return {'start': start, 'end': end, 'rows': frame_records(frame)}
+
+    def yoy(self, params):
+        index = self.index(params.get('segment', NATIONAL))
+        start, end = self._range(index, params)
+        growth = {f'{metric_slug(col)}_yoy_growth': col for col in numeric_columns}
+        frame = index.slice(start, end)[['date'] + list(growth)].rename(columns=growth)
+        return {'start': start, 'end': end, 'unit': '%', 'rows': frame_records(frame)}
+
+    def correlations(self, params):
+        index = self.index(params.get('segment', NATIONAL))
+        start, end = self._range(index, params)
+        lo, hi = index.bounds(start, end)
+        return {'start': start, 'end': end, 'months': hi - lo,
+                'matrix': matrix_records(index.correlation(start, end))}
+
+    def seasonal_indices(self, params):
+        return {'indices': matrix_records(self.seasonal(params.get('segment', NATIONAL)))}
+
+    def response(self, path, params, gzipped=False):
+        """
+        Serialised (body, content encoding) of an endpoint, from the response cache when possible.
+        """
+        key = (path, tuple(sorted(params.items())), gzipped)
+        with self._lock:
+            cached = self.responses.get(key)
+        if cached is not None:
+            return cached
+
+        payload = getattr(self, ROUTES[path])(params)
+        body = json.dumps(payload, default=_json_default, separators=(',', ':')).encode()
+        encoding = None
+        if gzipped and len(body) >= GZIP_MIN_BYTES:
+            body, encoding = gzip.compress(body, compresslevel=6), 'gzip'
+        with self._lock:
+            self.responses[key] = (body, encoding)
+        return body, encoding
+
+    def health(self, params):
+        return {'status': 'ok', 'version': self.version, 'rows': len(self._df)}
+
+    def segment_names(self, params):
+        return {'segments': self.segments()}
+
+
+# Path -> MetricsService method producing the payload
+ROUTES = {
+    '/health': 'health',
+    '/segments': 'segment_names',
+    '/metrics': 'metrics',
+    '/yoy': 'yoy',
+    '/correlations': 'correlations',
+    '/seasonal': 'seasonal_indices',
+}
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """
+    Request handler for ROUTES; the service is set on the server.
+    """
+    protocol_version = 'HTTP/1.1'
+    server_version = 'MobileMoneyMetrics/1.0'
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path not in ROUTES:
+            return self._send_error(404, f"Unknown endpoint: {url.path}")
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        service = self.server.service
+
+        # The ETag depends only on the data version, the request and the content coding the
+        # client accepts, so it is known before any work
+        version = service.refresh()
+        gzipped = 'gzip' in self.headers.get('Accept-Encoding', '')
+        request_key = json.dumps([url.path, sorted(params.items())])
+        digest = hashlib.sha256(f"{version}:{request_key}".encode()).hexdigest()[:24]
+        etag = f'"{digest}-gzip"' if gzipped else f'"{digest}"'
+        if etag in [tag.strip().removeprefix('W/') for tag in self.headers.get('If-None-Match', '').split(',')]:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', 'no-cache')
+            self.send_header('Vary', 'Accept-Encoding')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        try:
+            body, encoding = service.response(url.path, params, gzipped)
+        except KeyError as e:
+            return self._send_error(404, e.args[0] if e.args else str(e))
+        except ValueError as e:
+            return self._send_error(400, str(e))
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('ETag', etag)
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Vary', 'Accept-Encoding')
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status, message):
+        body = json.dumps({'error': message}).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def make_server(host='127.0.0.1', port=8000, service=None):
+    """
+    A threading HTTP server for the API; call serve_forever() on it to start serving.
+    """
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    server.service = service or MetricsService()
+    server.service.refresh()
+    return server
+
+
+def serve(host='127.0.0.1', port=8000):
+    server = make_server(host, port)
+    print(f"Serving the metrics API on http://{host}:{server.server_address[1]} (Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Metrics API stopped")
+    finally:
+        server.server_close()
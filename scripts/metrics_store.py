@@ -0,0 +1,271 @@
+import hashlib
+import os
+import glob
+import numpy as np
+import pandas as pd
+from instrumentation import timed
+
+# The four base metrics every derived column is built from
+numeric_columns = ['Active Agents', 'Total Registered Mobile Money Accounts (Millions)',
+                   'Total Agent Cash in Cash Out (Volume Million)', 'Total Agent Cash in Cash Out (Value KSh billions)']
+
+# Default locations of the cleaned dataset and the derived-metrics store
+base_dir = os.path.dirname(os.path.abspath(__file__))
+CLEANED_DATA_PATH = os.path.abspath(os.path.join(base_dir, '..', 'data', 'processed', 'cleaned_mobile_payments.csv'))
+METRICS_DIR = os.path.abspath(os.path.join(base_dir, '..', 'data', 'processed', 'metrics'))
+
+# Optional segment dimension (operator, county, ...); frames without it are one national series
+SEGMENT_COLUMN = 'segment'
+NATIONAL = 'national'
+
+# Month abbreviations for monthly and seasonal tables, January first
+MONTH_LABELS = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun',
+                'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+
+# Columns left out of the compact in-memory layout; all three are derived from date
+COMPACT_DROPPED = ['Year', 'Month', 'year_month']
+
+
+def metric_slug(column):
+    """
+    Short column prefix used for derived metrics (e.g. 'Active_Agents', 'billions)').
+    """
+    return column.split(' ')[-1] if 'Total' in column else column.replace(' ', '_')
+
+
+def derived_columns():
+    """
+    Names of every column produced by derive_metrics, in output order.
+    """
+    columns = []
+    for suffix in ['yoy_diff', 'yoy_growth', 'monthly_growth']:
+        columns += [f"{metric_slug(col)}_{suffix}" for col in numeric_columns]
+    return columns + ['transactions_per_account', 'value_per_account', 'value_per_transaction',
+                      'transactions_per_agent', 'value_per_agent']
+
+
+def sort_frame(df):
+    """
+    Sort a frame by date, or by segment then date when it has a segment column, so each
+    series is a contiguous, date-ordered block of rows.
+    """
+    keys = [SEGMENT_COLUMN, 'date'] if SEGMENT_COLUMN in df.columns else ['date']
+    return df.sort_values(keys, kind='stable').reset_index(drop=True)
+
+
+def segment_codes(df):
+    """
+    Integer code of each row's segment (all zeros for a frame without a segment column).
+    """
+    if SEGMENT_COLUMN not in df.columns:
+        return np.zeros(len(df), dtype=np.int64)
+    return pd.factorize(df[SEGMENT_COLUMN])[0]
+
+
+def _shifted_change(values, periods, codes=None):
+    # Absolute and percentage change against the row `periods` back, NaN where no history
+    # exists; with segment codes, rows whose lag falls in another segment are NaN too
+    diff = np.full(values.shape, np.nan)
+    pct = np.full(values.shape, np.nan)
+    if len(values) > periods:
+        previous = values[:-periods]
+        diff[periods:] = values[periods:] - previous
+        if codes is not None:
+            diff[periods:][codes[periods:] != codes[:-periods]] = np.nan
+        with np.errstate(divide='ignore', invalid='ignore'):
+            pct[periods:] = diff[periods:] / previous * 100
+    return diff, pct
+
+
+def derive_metrics(df):
+    """
+    Compute every derived column (YoY diff/growth, monthly growth, per-account and
+    per-agent ratios) in one vectorized pass. The frame must be sorted with sort_frame;
+    with a segment column all segments are derived together, lags never crossing segments.
+    """
+    values = df[numeric_columns].to_numpy(dtype=float)
+    codes = segment_codes(df) if SEGMENT_COLUMN in df.columns else None
+
+    yoy_diff, yoy_pct = _shifted_change(values, 12, codes)
+    _, monthly_pct = _shifted_change(values, 1, codes)
+
+    agents, accounts, volume, value = values.T
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratios = np.column_stack([volume / accounts, value / accounts, value / volume,
+                                  volume / agents, value / agents])
+
+    data = np.hstack([yoy_diff, yoy_pct, monthly_pct, ratios])
+    return pd.DataFrame(data, index=df.index, columns=derived_columns())
+
+
+def segments(df):
+    """
+    Segment names in the frame, always starting with 'national' (the totals when the feed
+    has no national rows); ['national'] without a segment column.
+    """
+    if SEGMENT_COLUMN not in df.columns:
+        return [NATIONAL]
+    names = sorted(set(df[SEGMENT_COLUMN].unique().tolist()) - {NATIONAL})
+    return [NATIONAL] + names
+
+
+def segment_frame(df, segment=NATIONAL):
+    """
+    One date-sorted series from a (possibly segmented) frame. The national series is the
+    'national' rows when the feed has them, otherwise the sum of the base metrics over all
+    segments with its derived metrics recomputed. A frame without segments is returned as is.
+    """
+    if SEGMENT_COLUMN not in df.columns:
+        return df
+    rows = df[SEGMENT_COLUMN].to_numpy() == segment
+    if rows.any():
+        return df[rows].reset_index(drop=True)
+    if segment != NATIONAL:
+        raise KeyError(f"Unknown segment: {segment}")
+
+    totals = df.groupby('date', as_index=False, sort=True)[numeric_columns].sum()
+    totals.insert(0, 'Year', totals['date'].dt.year)
+    totals.insert(1, 'Month', totals['date'].dt.month)
+    totals['year_month'] = totals['date'].dt.strftime('%Y-%m')
+    totals[SEGMENT_COLUMN] = NATIONAL
+    return pd.concat([totals, derive_metrics(totals)], axis=1)
+
+
+def data_version(file_path=CLEANED_DATA_PATH):
+    """
+    Content hash of the source dataset, used to key the derived-metrics store.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()[:16]
+
+
+def frame_version(df, columns=None):
+    """
+    Content hash of the date, segment and metric columns of an in-memory frame.
+    """
+    columns = ['date'] + list(columns or numeric_columns)
+    if SEGMENT_COLUMN in df.columns:
+        columns.insert(1, SEGMENT_COLUMN)
+    hashed = pd.util.hash_pandas_object(df[columns], index=False).to_numpy()
+    return hashlib.sha256(hashed.tobytes()).hexdigest()[:16]
+
+
+def metrics_path(version, metrics_dir=METRICS_DIR):
+    return os.path.join(metrics_dir, f"derived_metrics_{version}.parquet")
+
+
+def _write_store(df, version, metrics_dir):
+    os.makedirs(metrics_dir, exist_ok=True)
+    file_path = metrics_path(version, metrics_dir)
+
+    # Write to a temporary file first so concurrent readers never see a partial file
+    tmp_path = f"{file_path}.{os.getpid()}.tmp"
+    df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, file_path)
+
+    for stale in glob.glob(os.path.join(metrics_dir, 'derived_metrics_*.parquet')):
+        if stale != file_path:
+            os.remove(stale)
+
+    print(f"Derived metrics saved to: {file_path}")
+
+
+@timed('derive', rows=len)
+def build_metrics(source_path=CLEANED_DATA_PATH, metrics_dir=METRICS_DIR):
+    """
+    Derive all metrics for the source dataset and persist them as Parquet.
+    Stale versions in the store are removed.
+    """
+    version = data_version(source_path)
+    df = pd.read_csv(source_path)
+    df['date'] = pd.to_datetime(df['date'])
+    df = sort_frame(df)
+    df = pd.concat([df, derive_metrics(df)], axis=1)
+
+    _write_store(df, version, metrics_dir)
+    return df
+
+
+@timed('derive', rows=len)
+def extend_metrics(new_rows, previous_version, source_path=CLEANED_DATA_PATH, metrics_dir=METRICS_DIR):
+    """
+    Derive metrics only for rows appended to the source dataset, using the last 12
+    stored months of each segment as context, and store the result under the new data
+    version. Falls back to a full build if the previous version is not in the store.
+    """
+    previous_path = metrics_path(previous_version, metrics_dir) if previous_version else None
+    if previous_path is None or not os.path.exists(previous_path):
+        return build_metrics(source_path, metrics_dir)
+
+    previous = pd.read_parquet(previous_path)
+    if SEGMENT_COLUMN in previous.columns:
+        context = previous.groupby(SEGMENT_COLUMN, sort=False)[list(new_rows.columns)].tail(12)
+    else:
+        context = previous[new_rows.columns].tail(12)
+    combined = pd.concat([context.assign(_new=False), new_rows.assign(_new=True)], ignore_index=True)
+    combined = sort_frame(combined)
+    derived = derive_metrics(combined)[combined['_new'].to_numpy()].reset_index(drop=True)
+
+    appended = pd.concat([combined[combined['_new'].to_numpy()].drop(columns='_new').reset_index(drop=True),
+                          derived], axis=1)
+    df = sort_frame(pd.concat([previous, appended], ignore_index=True))
+
+    _write_store(df, data_version(source_path), metrics_dir)
+    return df
+
+
+def load_metrics(columns=None, source_path=CLEANED_DATA_PATH, metrics_dir=METRICS_DIR, compact=False):
+    """
+    Load the base and derived metrics for the current version of the source dataset,
+    building the store first if this version has not been derived yet. With compact=True
+    the frame is returned in the compact layout of compact_frame.
+    """
+    file_path = metrics_path(data_version(source_path), metrics_dir)
+    if not os.path.exists(file_path):
+        df = build_metrics(source_path, metrics_dir)
+        df = df[columns] if columns is not None else df
+    else:
+        df = pd.read_parquet(file_path, columns=columns, memory_map=True)
+    return compact_frame(df) if compact else df
+
+
+def compact_frame(df):
+    """
+    A smaller copy of a metrics frame for long-lived, read-only use (the dashboard, the API):
+    Year, Month and year_month are dropped since they are derived from date, the segment
+    becomes a categorical, integer base metrics become int32 and derived metrics float32.
+    Float base metrics keep float64, so frame_version and the models keyed by it are
+    unchanged.
+    """
+    data = {}
+    for col in df.columns:
+        series = df[col]
+        if col in COMPACT_DROPPED:
+            continue
+        if col == SEGMENT_COLUMN:
+            series = series.astype('category')
+        elif col in numeric_columns:
+            if pd.api.types.is_integer_dtype(series) and np.abs(series.to_numpy()).max(initial=0) < 2 ** 31:
+                series = series.astype(np.int32)
+        elif pd.api.types.is_float_dtype(series):
+            series = series.astype(np.float32)
+        data[col] = series
+    return pd.DataFrame(data, index=df.index)
+
+
+def memory_report(df):
+    """
+    Memory used by each column of a frame: dtype, bytes (strings counted in full), bytes
+    per row and share of the total, largest first.
+    """
+    usage = df.memory_usage(deep=True, index=False)
+    report = pd.DataFrame({
+        'dtype': df.dtypes.astype(str),
+        'bytes': usage,
+        'bytes_per_row': usage / max(len(df), 1),
+        'share': usage / max(usage.sum(), 1),
+    })
+    return report.sort_values('bytes', ascending=False)
@@ -0,0 +1,136 @@
+import threading
+import numpy as np
+import pandas as pd
+from cachetools import LRUCache
+from metrics_store import numeric_columns
+
+
+class RangeIndex:
+    """
+    Date-range lookups over a date-sorted metrics frame.
+
+    Windows are located with searchsorted on the sorted dates instead of boolean masks,
+    and prefix sums of the metrics and their pairwise products give the mean and
+    correlation of any window without rescanning its rows. Missing values are skipped as
+    pandas does: prefix counts of the observed values give each mean its own count, and
+    each pair of metrics is correlated over the rows where both are observed. Results are
+    kept in a bounded LRU cache keyed by (start, end, metric) and shared between sessions.
+    """
+
+    def __init__(self, df, columns=None, maxsize=512):
+        self.columns = list(columns or numeric_columns)
+        # Already sorted frames with a default index are used as they are rather than copied
+        if not df['date'].is_monotonic_increasing:
+            df = df.sort_values('date', kind='stable')
+        if not df.index.equals(pd.RangeIndex(len(df))):
+            df = df.reset_index(drop=True)
+        self.df = df
+        self.dates = self.df['date'].to_numpy(dtype='datetime64[ns]')
+
+        # Center on the overall mean so the prefix sums of products stay well conditioned
+        values = self.df[self.columns].to_numpy(dtype=float)
+        self._values = values
+        self._center = np.nanmean(values, axis=0) if len(values) else np.zeros(len(self.columns))
+        # Missing values add nothing to the sums, and the counts leave them out
+        centered = np.nan_to_num(values - self._center)
+        observed = (~np.isnan(values)).astype(float)
+
+        self._count = self._prefix(observed)
+        self._sum = self._prefix(centered)
+        # [i, j] over the rows where metric j is observed, so each pair sums its common rows
+        self._pair_count = self._prefix(observed[:, :, None] * observed[:, None, :])
+        self._pair_sum = self._prefix(centered[:, :, None] * observed[:, None, :])
+        self._pair_square = self._prefix(centered[:, :, None] ** 2 * observed[:, None, :])
+        self._cross = self._prefix(centered[:, :, None] * centered[:, None, :])
+
+        self._cache = LRUCache(maxsize=maxsize)
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # Picklable with its cached results (e.g. in the dashboard snapshot); the lock is recreated
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def bounds(self, start, end):
+        """
+        Row positions [lo, hi) of the rows dated from start to end inclusive.
+        """
+        lo = np.searchsorted(self.dates, np.datetime64(pd.Timestamp(start), 'ns'), side='left')
+        hi = np.searchsorted(self.dates, np.datetime64(pd.Timestamp(end), 'ns'), side='right')
+        return int(lo), int(max(lo, hi))
+
+    def slice(self, start, end):
+        lo, hi = self.bounds(start, end)
+        return self.df.iloc[lo:hi]
+
+    @staticmethod
+    def _prefix(values):
+        # Cumulative sums over the rows with a leading row of zeros, so [hi] - [lo] sums rows lo..hi-1
+        prefix = np.zeros((len(values) + 1,) + values.shape[1:])
+        np.cumsum(values, axis=0, out=prefix[1:])
+        return prefix
+
+    def _mean(self, lo, hi):
+        # O(k) window mean of the observed values from the prefix sums; NaN without any
+        count = self._count[hi] - self._count[lo]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return (self._sum[hi] - self._sum[lo]) / count + self._center
+
+    def _corr(self, lo, hi):
+        # O(k^2) window correlation from the prefix sums, each pair over its common rows
+        count = self._pair_count[hi] - self._pair_count[lo]
+        total = self._pair_sum[hi] - self._pair_sum[lo]
+        square = self._pair_square[hi] - self._pair_square[lo]
+        cross = self._cross[hi] - self._cross[lo]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            cov = cross - total * total.T / count
+            var = square - total ** 2 / count
+            corr = np.clip(cov / np.sqrt(var * var.T), -1, 1)
+        corr[count < 2] = np.nan
+        return corr
+
+    def mean(self, start, end):
+        return self.get(start, end, 'mean')
+
+    def correlation(self, start, end):
+        return self.get(start, end, 'correlation')
+
+    def deltas(self, start, end):
+        return self.get(start, end, 'deltas')
+
+    def _compute(self, lo, hi, metric):
+        if metric == 'slice':
+            return self.df.iloc[lo:hi]
+        if metric == 'deltas':
+            # Change from the first to the last row of the window
+            if hi - lo < 1:
+                return pd.Series(np.nan, index=self.columns)
+            return pd.Series(self._values[hi - 1] - self._values[lo], index=self.columns)
+        if metric == 'mean':
+            if hi - lo < 1:
+                return pd.Series(np.nan, index=self.columns)
+            return pd.Series(self._mean(lo, hi), index=self.columns)
+        if metric == 'correlation':
+            corr = self._corr(lo, hi)
+            return pd.DataFrame(corr, index=self.columns, columns=self.columns)
+        raise ValueError(f"Unknown metric: {metric}")
+
+    def get(self, start, end, metric):
+        """
+        Cached result of `metric` ('slice', 'deltas', 'mean' or 'correlation') for a window.
+        """
+        lo, hi = self.bounds(start, end)
+        # Keyed on row positions so different dates that select the same rows share an entry
+        key = (lo, hi, metric)
+        with self._lock:
+            if key in self._cache:
+                return self._cache[key]
+        result = self._compute(lo, hi, metric)
+        with self._lock:
+            self._cache[key] = result
+        return result
@@ -0,0 +1,200 @@
+"""
+Excel report writer that streams rows straight into xlsxwriter.
+
+Values stay numeric and are displayed through column number formats instead of being
+formatted into strings first. The workbook is opened in constant_memory mode, so each
+row is flushed to disk as soon as the next one starts, and cell values are converted
+WRITE_CHUNK rows at a time, so memory does not grow with the size of the Raw Data sheet.
+Frames longer than Excel's row limit continue on numbered sheets ('Raw Data (2)', ...).
+Charts are built from cell ranges of the Raw Data sheet, and scenario fan charts from
+those of the Scenario Fan sheet.
+"""
+import numpy as np
+import pandas as pd
+import xlsxwriter
+from metrics_store import numeric_columns
+
+# Rows per sheet, leaving one for the header
+EXCEL_MAX_ROWS = 1_048_575
+# Rows converted to cell values at a time
+WRITE_CHUNK = 65_536
+EXCEL_EPOCH = np.datetime64('1899-12-30', 'ns')
+
+HEADER_FORMAT = {
+    'bold': True,
+    'text_wrap': True,
+    'valign': 'top',
+    'bg_color': '#D9E1F2',
+    'border': 1
+}
+NUMBER_FORMATS = {
+    'date': 'yyyy-mm-dd',
+    'integer': '#,##0',
+    'float': '#,##0.00',
+    'percent': '#,##0.00"%"',
+}
+CHART_TITLES = {
+    'Active Agents': 'Active Mobile Money Agents',
+    'Total Registered Mobile Money Accounts (Millions)': 'Mobile Money Account Growth',
+    'Total Agent Cash in Cash Out (Volume Million)': 'Transaction Volume',
+    'Total Agent Cash in Cash Out (Value KSh billions)': 'Transaction Value',
+}
+
+
+def column_kind(name, series):
+    """
+    Number format key for a column: date, integer, percent (names ending in %) or float.
+    Year and Month numbers keep the General format so they are not shown with separators.
+    """
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return 'date'
+    if name in ('Year', 'Month'):
+        return None
+    if pd.api.types.is_integer_dtype(series):
+        return 'integer'
+    if pd.api.types.is_float_dtype(series):
+        return 'percent' if str(name).endswith('%') else 'float'
+    return None
+
+
+def column_values(series):
+    """
+    Cell values of a column as a list: dates as Excel serial numbers and missing values as None.
+    """
+    if pd.api.types.is_datetime64_any_dtype(series):
+        serial = (series.to_numpy(dtype='datetime64[ns]') - EXCEL_EPOCH) / np.timedelta64(1, 'D')
+        values = serial.astype(object)
+        values[np.isnan(serial)] = None
+        return values.tolist()
+    if pd.api.types.is_float_dtype(series):
+        floats = series.to_numpy(dtype=float)
+        missing = ~np.isfinite(floats)
+        if missing.any():
+            values = floats.astype(object)
+            values[missing] = None
+            return values.tolist()
+        return floats.tolist()
+    if pd.api.types.is_numeric_dtype(series):
+        return series.tolist()
+    return series.astype(object).where(series.notna(), None).tolist()
+
+
+def write_frame(workbook, sheet_name, df, formats, header_format, index=False):
+    """
+    Stream a frame into one or more worksheets, row by row. Returns the names of the
+    sheets written, one per EXCEL_MAX_ROWS rows.
+    """
+    if index:
+        df = df.reset_index()
+    columns = [str(col) for col in df.columns]
+    kinds = [column_kind(col, df[col]) for col in df.columns]
+
+    sheet_names = []
+    for part in range(max(-(-len(df) // EXCEL_MAX_ROWS), 1)):
+        name = sheet_name if part == 0 else f"{sheet_name} ({part + 1})"
+        worksheet = workbook.add_worksheet(name)
+        sheet_names.append(name)
+
+        # Column formats apply to every cell written without its own format
+        for col, (header, kind) in enumerate(zip(columns, kinds)):
+            width = 12 if kind == 'date' else min(max(len(header), 10), 40)
+            worksheet.set_column(col, col, width, formats.get(kind))
+        worksheet.write_row(0, 0, columns, header_format)
+        worksheet.freeze_panes(1, 0)
+
+        # Cell values are built one chunk at a time so only WRITE_CHUNK rows are held as Python objects
+        first = part * EXCEL_MAX_ROWS
+        last = min(first + EXCEL_MAX_ROWS, len(df))
+        for start in range(first, last, WRITE_CHUNK):
+            chunk = df.iloc[start:min(start + WRITE_CHUNK, last)]
+            values = [column_values(chunk.iloc[:, col]) for col in range(len(columns))]
+            for row, cells in enumerate(zip(*values), start=start - first + 1):
+                worksheet.write_row(row, 0, cells)
+    return sheet_names
+
+
+def add_metric_charts(workbook, chart_sheet, data_sheet, df, columns=None):
+    """
+    One line chart per metric from cell ranges of data_sheet, laid out two per row.
+    """
+    columns = list(columns or numeric_columns)
+    last_row = min(len(df), EXCEL_MAX_ROWS)
+    date_col = df.columns.get_loc('date')
+
+    for i, col in enumerate(columns):
+        value_col = df.columns.get_loc(col)
+        chart = workbook.add_chart({'type': 'line'})
+        chart.add_series({
+            'name': [data_sheet, 0, value_col],
+            'categories': [data_sheet, 1, date_col, last_row, date_col],
+            'values': [data_sheet, 1, value_col, last_row, value_col],
+        })
+        chart.set_title({'name': CHART_TITLES.get(col, col)})
+        chart.set_x_axis({'name': 'Date', 'date_axis': True, 'num_format': 'yyyy'})
+        chart.set_y_axis({'name': col, 'num_format': NUMBER_FORMATS['float']})
+        chart.set_legend({'none': True})
+        chart_sheet.insert_chart(1 + (i // 2) * 22, 1 + (i % 2) * 9, chart, {'x_scale': 1.1, 'y_scale': 1.4})
+
+
+def add_fan_charts(workbook, chart_sheet, fan_sheet, fan):
+    """
+    One chart per metric of a percentile fan (columns (metric, percentile), written to
+    fan_sheet with the dates first): the median in bold, the outermost percentiles dashed.
+    """
+    last_row = min(len(fan), EXCEL_MAX_ROWS)
+    metrics = list(dict.fromkeys(fan.columns.get_level_values(0)))
+    for i, metric in enumerate(metrics):
+        chart = workbook.add_chart({'type': 'line'})
+        percentiles = list(fan[metric].columns)
+        for j, percentile in enumerate(percentiles):
+            col = 1 + fan.columns.get_loc((metric, percentile))
+            outer = j in (0, len(percentiles) - 1)
+            median = j == len(percentiles) // 2
+            chart.add_series({
+                'name': percentile,
+                'categories': [fan_sheet, 1, 0, last_row, 0],
+                'values': [fan_sheet, 1, col, last_row, col],
+                'line': {'color': '#1F4E79', 'width': 2.5 if median else 1,
+                         'dash_type': 'dash' if outer else 'solid'},
+            })
+        chart.set_title({'name': CHART_TITLES.get(metric, metric)})
+        chart.set_x_axis({'name': 'Date', 'date_axis': True, 'num_format': 'yyyy'})
+        chart.set_y_axis({'name': metric, 'num_format': NUMBER_FORMATS['float']})
+        chart.set_legend({'position': 'bottom'})
+        chart_sheet.insert_chart(1 + (i // 2) * 22, 1 + (i % 2) * 9, chart, {'x_scale': 1.1, 'y_scale': 1.4})
+
+
+def write_report(report_file, summary, df, extra_sheets=None, fan=None):
+    """
+    Write the Monthly Summary, Raw Data, any extra (indexed) frames and the metric
+    charts to report_file. extra_sheets maps sheet names to frames. fan is a scenario
+    percentile fan (see scenarios.fan_frame), written with its fan charts.
+    """
+    workbook = xlsxwriter.Workbook(report_file, {'constant_memory': True})
+    header_format = workbook.add_format(HEADER_FORMAT)
+    formats = {kind: workbook.add_format({'num_format': num_format})
+               for kind, num_format in NUMBER_FORMATS.items()}
+
+    # Write the report
+    write_frame(workbook, 'Monthly Summary', summary, formats, header_format)
+
+    # Write the raw data
+    data_sheets = write_frame(workbook, 'Raw Data', df, formats, header_format)
+
+    # Write the indexed frames such as seasonal indices and forecasts
+    for sheet_name, frame in (extra_sheets or {}).items():
+        write_frame(workbook, sheet_name, frame, formats, header_format, index=True)
+
+    if fan is not None:
+        flat = fan.copy()
+        flat.columns = [f"{metric} {percentile}" for metric, percentile in fan.columns]
+        fan_sheet = write_frame(workbook, 'Scenario Fan', flat, formats, header_format, index=True)[0]
+
+    # Create charts in Excel
+    chart_sheet = workbook.add_worksheet('Charts')
+    add_metric_charts(workbook, chart_sheet, data_sheets[0], df)
+    if fan is not None:
+        add_fan_charts(workbook, workbook.add_worksheet('Scenario Charts'), fan_sheet, fan)
+
+    workbook.close()
+    return report_file
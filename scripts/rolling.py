@@ -0,0 +1,149 @@
+"""
+Vectorized rolling-window analytics on strided views.
+
+The array functions take values shaped (..., time, series): a single (T, 4) block for the
+national metrics, or a stack of blocks such as (segments, T, 4) for per-county or
+per-operator series. Every window is a view from sliding_window_view, so all series and
+all windows are reduced in one NumPy call rather than a Python loop per column.
+Leading positions without a full window are NaN.
+"""
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+from metrics_store import MONTH_LABELS, numeric_columns, metric_slug
+
+
+def _windows(values, window):
+    # (..., T - window + 1, N, window) view over the time axis
+    return sliding_window_view(values, window, axis=-2)
+
+
+def _pad(result, length, window, center=False):
+    # Put window results back on the original time axis, NaN where no full window exists
+    out = np.full(result.shape[:-2] + (length,) + result.shape[-1:], np.nan)
+    offset = window // 2 if center else window - 1
+    out[..., offset:offset + result.shape[-2], :] = result
+    return out
+
+
+def rolling_mean(values, window):
+    values = np.asarray(values, dtype=float)
+    if values.shape[-2] < window:
+        return np.full(values.shape, np.nan)
+    return _pad(_windows(values, window).mean(axis=-1), values.shape[-2], window)
+
+
+def rolling_std(values, window, ddof=1):
+    values = np.asarray(values, dtype=float)
+    if values.shape[-2] < window:
+        return np.full(values.shape, np.nan)
+    return _pad(_windows(values, window).std(axis=-1, ddof=ddof), values.shape[-2], window)
+
+
+def log_growth(values):
+    """
+    Month-on-month log growth; the first month is NaN.
+    """
+    values = np.asarray(values, dtype=float)
+    growth = np.full(values.shape, np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        growth[..., 1:, :] = np.diff(np.log(values), axis=-2)
+    return growth
+
+
+def rolling_volatility(values, window, annualize=True):
+    """
+    Rolling standard deviation of monthly log growth, annualized by sqrt(12) by default.
+    """
+    volatility = rolling_std(log_growth(values), window)
+    return volatility * np.sqrt(12) if annualize else volatility
+
+
+def rolling_corr(values, window):
+    """
+    Rolling correlation between every pair of series, shaped (..., T, N, N).
+    """
+    values = np.asarray(values, dtype=float)
+    n_series = values.shape[-1]
+    out = np.full(values.shape[:-1] + (n_series, n_series), np.nan)
+    if values.shape[-2] < window:
+        return out
+
+    windows = _windows(values, window)
+    centered = windows - windows.mean(axis=-1, keepdims=True)
+    cov = np.einsum('...iw,...jw->...ij', centered, centered)
+    std = np.sqrt(np.einsum('...iw,...iw->...i', centered, centered))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        corr = cov / (std[..., :, None] * std[..., None, :])
+
+    out[..., window - 1:, :, :] = corr
+    return out
+
+
+def centered_moving_average(values, period=12):
+    """
+    Centered 2x`period` moving average used as the trend for seasonal decomposition.
+    """
+    values = np.asarray(values, dtype=float)
+    weights = np.ones(period + 1)
+    weights[[0, -1]] = 0.5
+    weights /= period
+    if values.shape[-2] <= period:
+        return np.full(values.shape, np.nan)
+    trend = _windows(values, period + 1) @ weights
+    return _pad(trend, values.shape[-2], period + 1, center=True)
+
+
+def seasonal_indices(values, months, period=12):
+    """
+    Multiplicative seasonal index per month of year: the average ratio of each value to
+    its centered moving-average trend, normalized so the indices of a series average 1.
+    Returns (..., period, N); `months` gives the 1-based month of each time step.
+    """
+    values = np.asarray(values, dtype=float)
+    ratio = values / centered_moving_average(values, period)
+
+    # One-hot month membership turns the per-month average into a single contraction
+    membership = np.eye(period)[np.asarray(months) - 1]
+    valid = ~np.isnan(ratio)
+    totals = np.einsum('tm,...tn->...mn', membership, np.where(valid, ratio, 0.0))
+    counts = np.einsum('tm,...tn->...mn', membership, valid.astype(float))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        indices = totals / counts
+    return indices / np.nanmean(indices, axis=-2, keepdims=True)
+
+
+def rolling_frame(df, window=12, columns=None):
+    """
+    Rolling mean, rolling std and annualized volatility of each metric as a frame aligned with df.
+    """
+    columns = list(columns or numeric_columns)
+    values = df[columns].to_numpy(dtype=float)
+    blocks = {
+        f'rolling_mean_{window}': rolling_mean(values, window),
+        f'rolling_std_{window}': rolling_std(values, window),
+        f'volatility_{window}': rolling_volatility(values, window),
+    }
+    data = {f"{metric_slug(col)}_{name}": block[:, i] for name, block in blocks.items()
+            for i, col in enumerate(columns)}
+    return pd.DataFrame(data, index=df.index)
+
+
+def rolling_corr_frame(df, window=12, columns=None):
+    """
+    Rolling correlation of every pair of metrics, one column per pair.
+    """
+    columns = list(columns or numeric_columns)
+    corr = rolling_corr(df[columns].to_numpy(dtype=float), window)
+    rows, cols = np.triu_indices(len(columns), k=1)
+    data = {f"{metric_slug(columns[i])}~{metric_slug(columns[j])}": corr[:, i, j] for i, j in zip(rows, cols)}
+    return pd.DataFrame(data, index=df.index)
+
+
+def seasonal_index_frame(df, columns=None):
+    """
+    Seasonal index of each metric by month of year (Jan..Dec rows).
+    """
+    columns = list(columns or numeric_columns)
+    indices = seasonal_indices(df[columns].to_numpy(dtype=float), df['date'].dt.month.to_numpy())
+    return pd.DataFrame(indices, index=MONTH_LABELS, columns=columns)
@@ -0,0 +1,167 @@
+"""
+Monte Carlo scenarios of the metrics' future paths.
+
+Each metric is split in logs into its multiplicative seasonal factors (the seasonal
+indices from rolling.seasonal_indices) and a deseasonalized series. Over the last
+HISTORY months the deseasonalized month-on-month growth has a mean (the drift) and
+residuals around it. A path continues the last deseasonalized value and puts the
+seasonal factors back:
+
+    log value(h) = level + sum over k <= h of (growth * drift + volatility * residual_k)
+                   + seasonality * log factor(month of h)
+
+where residual_k is a historical month drawn with replacement. A draw takes the same
+month for all metrics, which keeps their co-movement. Scenarios (SCENARIOS) scale the
+drift, the residuals and the seasonal factors.
+
+All paths are one NumPy array shaped (paths, horizon, metrics). The month draws are made
+up front from a seeded generator as small integer indices; the float work then runs in
+chunks of CHUNK paths into a float32 result, so temporary memory does not grow with the
+number of paths. The same seed gives the same paths whatever the chunk size.
+"""
+import numpy as np
+import pandas as pd
+from metrics_store import numeric_columns
+from rolling import seasonal_indices
+
+# Months of growth the drift and residuals are taken from
+HISTORY = 60
+HORIZON = 60
+PATHS = 10_000
+# Paths simulated per chunk
+CHUNK = 2_000
+PERCENTILES = (5, 25, 50, 75, 95)
+# Metrics measured per month (summed over a year); the others are stocks (year-end level)
+FLOW_COLUMNS = ['Total Agent Cash in Cash Out (Volume Million)', 'Total Agent Cash in Cash Out (Value KSh billions)']
+
+# Multipliers of the historical drift, residuals and seasonal factors
+SCENARIOS = {
+    'baseline': {'growth': 1.0, 'volatility': 1.0, 'seasonality': 1.0},
+    'slowdown': {'growth': 0.5, 'volatility': 1.0, 'seasonality': 1.0},
+    'acceleration': {'growth': 1.5, 'volatility': 1.0, 'seasonality': 1.0},
+    'volatile': {'growth': 1.0, 'volatility': 2.0, 'seasonality': 1.5},
+}
+DEFAULT_SCENARIO = 'baseline'
+
+
+def fit_scenario_model(df, columns=None, history=HISTORY):
+    """
+    Starting level, drift, growth residuals and log seasonal factors of each metric.
+    Metrics without a value in the last month (such as the accounts of a transaction feed
+    without account ids) are left out.
+    """
+    columns = list(columns or numeric_columns)
+    df = df.sort_values('date')
+    columns = [col for col in columns if df[col].iloc[-1] > 0]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        values = np.log(df[columns].to_numpy(dtype=float))
+    months = df['date'].dt.month.to_numpy()
+
+    # Months without a seasonal index (too little history) count as average months
+    factors = np.log(seasonal_indices(np.exp(values), months))
+    factors = np.where(np.isfinite(factors), factors, 0.0)
+    adjusted = values - factors[months - 1]
+
+    growth = np.diff(adjusted[-(history + 1):], axis=0)
+    growth = growth[np.isfinite(growth).all(axis=1)]
+    if not len(growth):
+        raise ValueError("Not enough history to fit the scenario model")
+    drift = growth.mean(axis=0)
+    return {
+        'columns': columns,
+        'last_date': df['date'].iloc[-1],
+        'level': adjusted[-1],
+        'drift': drift,
+        'residuals': growth - drift,
+        'log_factors': factors,
+    }
+
+
+def simulate(model, horizon=HORIZON, paths=PATHS, seed=0, growth=1.0, volatility=1.0, seasonality=1.0,
+             chunk=CHUNK):
+    """
+    Simulated paths of every metric, shaped (paths, horizon, metrics) as float32, and
+    their month-start dates.
+    """
+    dates = pd.date_range(model['last_date'] + pd.DateOffset(months=1), periods=horizon, freq='MS')
+    residuals = model['residuals']
+    draws = np.random.default_rng(seed).integers(0, len(residuals), size=(paths, horizon), dtype=np.int32)
+
+    step = growth * model['drift']
+    season = model['level'] + seasonality * model['log_factors'][dates.month.to_numpy() - 1]
+    out = np.empty((paths, horizon, len(model['columns'])), dtype=np.float32)
+    for start in range(0, paths, chunk):
+        block = residuals[draws[start:start + chunk]]
+        block *= volatility
+        block += step
+        np.cumsum(block, axis=1, out=block)
+        block += season
+        np.exp(block, out=out[start:start + chunk])
+    return out, dates
+
+
+def fan_frame(paths, dates, columns, percentiles=PERCENTILES):
+    """
+    Percentiles of simulated paths by month: one column per (metric, percentile).
+    """
+    bands = np.percentile(paths, percentiles, axis=0)
+    header = pd.MultiIndex.from_product([columns, [f"p{q}" for q in percentiles]], names=['metric', 'percentile'])
+    data = np.moveaxis(bands, 0, -1).reshape(len(dates), -1)
+    return pd.DataFrame(data, index=pd.DatetimeIndex(dates, name='date'), columns=header)
+
+
+def annual_frame(paths, dates, columns, history=None, percentiles=PERCENTILES):
+    """
+    Percentiles of each metric per calendar year: the year's total for FLOW_COLUMNS and
+    the December level for the others. A year the paths start in mid-way is completed
+    with the months of `history` (a frame with a date column) when given, else left out;
+    a year the paths end in mid-way is left out.
+    """
+    dates = pd.DatetimeIndex(dates)
+    flows = np.isin(columns, FLOW_COLUMNS)
+    rows, index = [], []
+    for year in np.unique(dates.year):
+        in_year = dates.year == year
+        observed = 0.0
+        if dates[in_year][-1].month != 12:
+            continue
+        if dates[in_year][0].month != 1:
+            if history is None:
+                continue
+            earlier = history[history['date'].dt.year == year]
+            if len(earlier) != dates[in_year][0].month - 1:
+                continue
+            observed = earlier[columns].to_numpy(dtype=float).sum(axis=0)
+
+        totals = paths[:, in_year].sum(axis=1, dtype=np.float64) + observed
+        value = np.where(flows, totals, paths[:, np.flatnonzero(in_year)[-1]])
+        rows.append(np.percentile(value, percentiles, axis=0).T)
+        index.extend((col, year) for col in columns)
+
+    if not rows:
+        return pd.DataFrame(columns=[f"p{q}" for q in percentiles],
+                            index=pd.MultiIndex.from_tuples([], names=['metric', 'year']))
+    order = np.argsort([columns.index(col) for col, _ in index], kind='stable')
+    return pd.DataFrame(np.concatenate(rows)[order], columns=[f"p{q}" for q in percentiles],
+                        index=pd.MultiIndex.from_tuples([index[i] for i in order], names=['metric', 'year']))
+
+
+def scenario_fan(df, scenario=DEFAULT_SCENARIO, horizon=HORIZON, paths=PATHS, seed=0, model=None):
+    """
+    Percentile fan of every metric under one of the SCENARIOS.
+    """
+    model = model or fit_scenario_model(df)
+    sims, dates = simulate(model, horizon, paths, seed, **SCENARIOS[scenario])
+    return fan_frame(sims, dates, model['columns'])
+
+
+def scenario_summary(df, scenarios=None, horizon=HORIZON, paths=PATHS, seed=0):
+    """
+    Annual percentiles of every metric under each scenario, indexed by (scenario, metric, year).
+    """
+    model = fit_scenario_model(df)
+    frames = {}
+    for name in scenarios or SCENARIOS:
+        sims, dates = simulate(model, horizon, paths, seed, **SCENARIOS[name])
+        frames[name] = annual_frame(sims, dates, model['columns'], history=df)
+    return pd.concat(frames, names=['scenario'])
@@ -0,0 +1,271 @@
+"""
+Dependency-aware pipeline scheduler.
+
+The reporting pipeline is a small DAG:
+
+    ingest -> derive --> forecast --> excel -> email
+                     |            \\-> warm
+                     \\-> charts
+
+Stages whose dependencies have finished run concurrently (forecast and charts run side
+by side); warm prebuilds the dashboard's start-up snapshot once the models are fitted.
+Each stage's inputs are fingerprinted from the raw feed's content hash, its upstream
+stages' outputs and its own options; a stage whose fingerprint matches the last
+successful run and whose output files still exist is skipped. Run state is saved to
+PIPELINE_STATE_PATH after every stage, so a run that fails part way resumes from the
+failed stage and does not redo the expensive ones before it.
+
+run_pipeline() runs the DAG once; run_daemon() re-runs it on an interval, which is cheap
+when nothing has changed since every stage is skipped.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime
+from instrumentation import span
+
+# Default location of the persisted run state
+base_dir = os.path.dirname(os.path.abspath(__file__))
+PIPELINE_STATE_PATH = os.path.abspath(os.path.join(base_dir, '..', 'data', 'processed', 'pipeline_state.json'))
+REPORTS_DIR = os.path.abspath(os.path.join(base_dir, '..', 'reports'))
+
+
+def run_ingest(options, results):
+    from ingest import ingest
+    from metrics_store import CLEANED_DATA_PATH, data_version
+
+    ingest(options['raw_path'])
+    return {'version': data_version(CLEANED_DATA_PATH), 'paths': [CLEANED_DATA_PATH]}
+
+
+def run_derive(options, results):
+    from metrics_store import CLEANED_DATA_PATH, data_version, load_metrics, metrics_path
+    from sqlite_store import sync_store
+
+    # ingest keeps both stores current; this rebuilds whichever is missing or stale
+    load_metrics(columns=['date'])
+    db_path = sync_store()
+    version = data_version(CLEANED_DATA_PATH)
+    return {'version': version, 'paths': [metrics_path(version), db_path]}
+
+
+def run_forecast(options, results):
+    from forecasting import load_models, models_path
+    from metrics_store import frame_version, load_metrics, segment_frame
+
+    df = segment_frame(load_metrics())
+    load_models(df)
+    version = frame_version(df)
+    return {'version': version, 'paths': [models_path(version)]}
+
+
+# The only stage that imports matplotlib: it runs beside forecast and excel in other threads,
+# and matplotlib.use() fails on a pyplot another thread is still importing, so no other
+# stage may import it (tests/test_scheduler.py checks this)
+def run_charts(options, results):
+    from visualisation import ASSETS_DIR, chart_jobs, main
+    from metrics_store import load_metrics, segment_frame
+
+    main(workers=options.get('workers'))
+    files = [os.path.join(ASSETS_DIR, job[0]) for job in chart_jobs(segment_frame(load_metrics()))]
+    return {'paths': files}
+
+
+def run_warm(options, results):
+    from dashboard_cache import warm
+
+    return {'paths': [warm()]}
+
+
+def run_excel(options, results):
+    from automated_analysis import write_analysis_report
+    from metrics_store import derived_columns, load_metrics
+
+    # The report is built from the derive stage's metrics store rather than the raw feed, so
+    # the feed is not parsed (or quarantined) again and the forecast stage's models are reused
+    df = load_metrics().drop(columns=derived_columns())
+    report_file = write_analysis_report(df, output_dir=options['report_dir'])
+    return {'paths': [os.path.abspath(report_file)]}
+
+
+def run_email(options, results):
+    from delivery import deliver_report
+
+    records = deliver_report(results['excel']['paths'][0], options['recipients'])
+    failed = [record for record in records if not record['ok']]
+    if failed:
+        raise RuntimeError(f"{len(failed)} of {len(records)} messages could not be delivered")
+    return {'messages': len(records)}
+
+
+# Stage name -> (upstream stages, function); the order is a valid topological order
+STAGES = {
+    'ingest': ([], run_ingest),
+    'derive': (['ingest'], run_derive),
+    'forecast': (['derive'], run_forecast),
+    'charts': (['derive'], run_charts),
+    'warm': (['forecast'], run_warm),
+    'excel': (['derive', 'forecast'], run_excel),
+    'email': (['excel'], run_email),
+}
+
+
+def file_hash(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()[:16]
+
+
+def fingerprint(name, upstream, options):
+    """
+    Hash of everything a stage's result depends on: its upstream outputs and the options it reads.
+    """
+    parts = {dep: upstream[dep] for dep in STAGES[name][0]}
+    if name == 'ingest':
+        parts['raw'] = file_hash(options['raw_path'])
+    elif name == 'excel':
+        parts['report_dir'] = options['report_dir']
+    elif name == 'email':
+        parts['recipients'] = sorted(options['recipients'])
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+def load_run_state(state_path=PIPELINE_STATE_PATH):
+    if not os.path.exists(state_path):
+        return {}
+    with open(state_path) as f:
+        return json.load(f)
+
+
+def save_run_state(state, state_path=PIPELINE_STATE_PATH):
+    os.makedirs(os.path.dirname(state_path), exist_ok=True)
+    tmp_path = f"{state_path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, state_path)
+
+
+def _is_current(record, digest):
+    # A stage is up to date if it last succeeded on the same inputs and its files still exist
+    return (record is not None and record.get('status') == 'done' and record.get('fingerprint') == digest
+            and all(os.path.exists(path) for path in record.get('output', {}).get('paths', [])))
+
+
+def run_pipeline(raw_path=None, report_dir=REPORTS_DIR, recipients=None, force=(), workers=None,
+                 state_path=PIPELINE_STATE_PATH, max_parallel=2):
+    """
+    Run every stage of the DAG whose inputs changed since its last successful run.
+    Stages in `force` (and everything downstream of them) run regardless. The email
+    stage is skipped when there are no recipients. Returns the run state by stage.
+    """
+    from ingest import RAW_DATA_PATH
+
+    options = {
+        'raw_path': raw_path or RAW_DATA_PATH,
+        'report_dir': report_dir,
+        'recipients': list(recipients or []),
+        'workers': workers,
+    }
+    state = load_run_state(state_path)
+    lock = threading.Lock()
+    # Outputs and output fingerprints of finished or skipped stages, as seen by their dependents
+    results = {}
+    outputs = {}
+    forced = set(force)
+    status = {}
+    pending = {}
+
+    def execute(name):
+        start = time.perf_counter()
+        with span(f'stage.{name}'):
+            output = STAGES[name][1](options, results)
+        return output, time.perf_counter() - start
+
+    def finish(name, record):
+        with lock:
+            state[name] = record
+            save_run_state(state, state_path)
+
+    started = datetime.now()
+    print(f"Pipeline run started at {started:%Y-%m-%d %H:%M:%S}")
+    with ThreadPoolExecutor(max_workers=max_parallel) as executor:
+        running = {}
+        while True:
+            # Start every stage whose dependencies have finished
+            for name, (deps, _) in STAGES.items():
+                if name in status or name in running.values():
+                    continue
+                if any(status.get(dep) in ('failed', 'blocked') for dep in deps):
+                    status[name] = 'blocked'
+                    print(f"{name}: blocked by a failed dependency")
+                    continue
+                if not all(status.get(dep) in ('done', 'skipped') for dep in deps):
+                    continue
+
+                digest = fingerprint(name, outputs, options)
+                if any(dep in forced for dep in deps):
+                    forced.add(name)
+                if name == 'email' and not options['recipients']:
+                    status[name] = 'skipped'
+                    print("email: no recipients, skipped")
+                elif name not in forced and _is_current(state.get(name), digest):
+                    status[name] = 'skipped'
+                    results[name] = state[name]['output']
+                    outputs[name] = state[name]['output_fingerprint']
+                    print(f"{name}: inputs unchanged, skipped")
+                else:
+                    print(f"{name}: running")
+                    running[executor.submit(execute, name)] = name
+                    pending[name] = digest
+
+            if not running:
+                break
+
+            done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                digest = pending.pop(name)
+                try:
+                    output, seconds = future.result()
+                except Exception as e:
+                    status[name] = 'failed'
+                    print(f"{name}: failed: {type(e).__name__}: {e}")
+                    finish(name, {'status': 'failed', 'fingerprint': digest, 'error': f"{type(e).__name__}: {e}",
+                                  'finished': datetime.now().isoformat(timespec='seconds')})
+                    continue
+
+                status[name] = 'done'
+                results[name] = output
+                outputs[name] = hashlib.sha256(json.dumps(output, sort_keys=True).encode()).hexdigest()[:16]
+                print(f"{name}: done in {seconds:.1f}s")
+                finish(name, {'status': 'done', 'fingerprint': digest, 'output': output,
+                              'output_fingerprint': outputs[name], 'seconds': round(seconds, 3),
+                              'finished': datetime.now().isoformat(timespec='seconds')})
+
+    failed = [name for name, value in status.items() if value in ('failed', 'blocked')]
+    print(f"Pipeline run finished in {(datetime.now() - started).total_seconds():.1f}s"
+          + (f" with failures: {', '.join(failed)}" if failed else ""))
+    return status
+
+
+def run_daemon(interval=3600, **kwargs):
+    """
+    Run the pipeline every `interval` seconds until interrupted. Failures are reported
+    and retried on the next tick, resuming from the failed stage.
+    """
+    print(f"Scheduler started, running every {interval}s (Ctrl+C to stop)")
+    try:
+        while True:
+            tick = time.monotonic()
+            try:
+                run_pipeline(**kwargs)
+            except Exception as e:
+                print(f"Pipeline run failed: {type(e).__name__}: {e}")
+            time.sleep(max(0.0, interval - (time.monotonic() - tick)))
+    except KeyboardInterrupt:
+        print("Scheduler stopped")
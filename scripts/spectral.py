@@ -0,0 +1,216 @@
+"""
+FFT-based lead/lag and spectral seasonality analysis.
+
+cross_correlation() gives the correlation of every pair of series at every lag in one
+batch: the sums behind a Pearson correlation over the months two series share (sum of
+products, sums, sums of squares and the overlap count) are each a cross-correlation of
+zero-filled series, so all of them come from a handful of FFTs of length about 2T
+instead of one shifted .corr() per pair and lag. Missing months (NaN) are masked out
+exactly as pandas' pairwise-complete .corr() would, which also lets segments of
+different lengths share one (segments, months, metrics) block.
+
+periodogram() gives the power of each series at frequencies k/T cycles per month;
+dominant_periods() and seasonal_share() read seasonal periods off it.
+
+By default both work on month-on-month log growth rather than levels: levels of
+trending series correlate at every lag and put nearly all their power at the lowest
+frequencies, which hides both the lead/lag structure and the seasonality.
+"""
+import numpy as np
+import pandas as pd
+from metrics_store import numeric_columns, NATIONAL, SEGMENT_COLUMN
+from rolling import log_growth
+
+# Fewest overlapping months a lagged correlation is computed from
+MIN_PERIODS = 12
+# Seasonal cycle in months; its harmonics (12, 6, 4, 3, 2.4 and 2 months) count as seasonal
+SEASON = 12
+
+
+def _fft_len(n):
+    # Zero padding to at least 2n - 1 keeps the circular correlation from wrapping around
+    return 1 << (2 * n - 2).bit_length() if n > 1 else 1
+
+
+def transform_values(values, transform='growth'):
+    if transform == 'growth':
+        return log_growth(values)
+    if transform == 'level':
+        return np.asarray(values, dtype=float)
+    raise ValueError(f"Unknown transform: {transform}")
+
+
+def cross_correlation(values, max_lag=24, min_periods=MIN_PERIODS):
+    """
+    Correlation of every pair of series at lags -max_lag..max_lag, for values shaped
+    (..., T, N); returns (..., N, N, 2 * max_lag + 1). Entry [i, j, max_lag + k] is the
+    correlation of series i in month t with series j in month t + k over the months
+    where both exist, i.e. x_i.corr(x_j.shift(-k)), so a peak at a positive k means
+    series i leads series j by k months. Lags with fewer than min_periods overlapping
+    months are NaN.
+    """
+    values = np.asarray(values, dtype=float)
+    n = values.shape[-2]
+    max_lag = max(min(max_lag, n - 1), 0)
+    lags = np.r_[-max_lag:0, 0:max_lag + 1]
+
+    # Center each series on its own mean so the sums below keep their precision
+    mask = ~np.isnan(values)
+    counts = mask.sum(axis=-2, keepdims=True)
+    means = np.where(mask, values, 0.0).sum(axis=-2, keepdims=True) / np.maximum(counts, 1)
+    centered = np.moveaxis(np.where(mask, values - means, 0.0), -1, -2)
+    present = np.moveaxis(mask.astype(float), -1, -2)
+
+    size = _fft_len(n)
+    spectra = {name: np.fft.rfft(block, size, axis=-1)
+               for name, block in [('x', centered), ('xx', centered ** 2), ('m', present)]}
+
+    def lagged(a, b):
+        # [i, j, k] = sum over t of a_i(t) * b_j(t + k), for all pairs and the selected lags
+        product = np.conj(spectra[a])[..., :, None, :] * spectra[b][..., None, :, :]
+        return np.fft.irfft(product, size, axis=-1)[..., lags % size]
+
+    overlap = np.rint(lagged('m', 'm'))
+    sum_xy, sum_x, sum_y = lagged('x', 'x'), lagged('x', 'm'), lagged('m', 'x')
+    sum_xx, sum_yy = lagged('xx', 'm'), lagged('m', 'xx')
+
+    cov = overlap * sum_xy - sum_x * sum_y
+    var_x = overlap * sum_xx - sum_x ** 2
+    var_y = overlap * sum_yy - sum_y ** 2
+    # FFT round-off leaves constant series with a tiny variance instead of zero
+    valid = ((overlap >= max(min_periods, 2)) & (var_x > 1e-10 * overlap * sum_xx)
+             & (var_y > 1e-10 * overlap * sum_yy))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        corr = np.where(valid, cov / np.sqrt(var_x * var_y), np.nan)
+    return np.clip(corr, -1, 1)
+
+
+def periodogram(values, taper=True):
+    """
+    Power of each series at k/T cycles per month for k = 1..T//2, for values shaped
+    (..., T, N). Returns (periods in months, power shaped (..., T//2, N)). Series are
+    centered, missing months count as zero and a Hann taper limits leakage between
+    frequencies.
+    """
+    values = np.asarray(values, dtype=float)
+    n = values.shape[-2]
+    mask = ~np.isnan(values)
+    means = np.where(mask, values, 0.0).sum(axis=-2, keepdims=True) / np.maximum(mask.sum(axis=-2, keepdims=True), 1)
+    centered = np.where(mask, values - means, 0.0)
+    if taper:
+        centered = centered * np.hanning(n)[:, None]
+
+    power = np.abs(np.fft.rfft(centered, axis=-2)) ** 2 / n
+    frequencies = np.arange(n // 2 + 1) / n
+    return 1 / frequencies[1:], power[..., 1:, :]
+
+
+def seasonal_share(periods, power, season=SEASON):
+    """
+    Share of each series' power within one frequency step of the seasonal harmonics,
+    shaped like power without its frequency axis. periods and power are the full output
+    of periodogram(), whose first frequency is the step.
+    """
+    frequencies = 1 / periods
+    step = frequencies[0] if len(frequencies) else 0.0
+    harmonics = np.arange(1, season // 2 + 1) / season
+    seasonal = np.abs(frequencies[:, None] - harmonics).min(axis=1) <= step + 1e-12
+    total = power.sum(axis=-2)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(total > 0, power[..., seasonal, :].sum(axis=-2) / total, np.nan)
+
+
+def monthly_blocks(df, columns=None):
+    """
+    The metrics of every segment on one gap-free monthly axis, shaped (segments, months,
+    metrics) with NaN for months a segment lacks. Returns (segment names, month starts, values).
+    """
+    columns = list(columns or numeric_columns)
+    if SEGMENT_COLUMN in df.columns:
+        codes, names = pd.factorize(df[SEGMENT_COLUMN], sort=True)
+        names = pd.Index(np.asarray(names, dtype=object), name=SEGMENT_COLUMN)
+    else:
+        codes, names = np.zeros(len(df), dtype=np.int64), pd.Index([NATIONAL], name=SEGMENT_COLUMN)
+
+    month = (df['date'].dt.year * 12 + df['date'].dt.month - 1).to_numpy()
+    first = month.min() if len(month) else 0
+    n_months = month.max() - first + 1 if len(month) else 0
+    values = np.full((len(names), n_months, len(columns)), np.nan)
+    values[codes, month - first] = df[columns].to_numpy(dtype=float)
+    dates = pd.date_range(pd.Timestamp(year=first // 12, month=first % 12 + 1, day=1), periods=n_months,
+                          freq='MS') if n_months else pd.DatetimeIndex([])
+    return names, dates, values
+
+
+def cross_correlation_frame(df, max_lag=24, columns=None, transform='growth', min_periods=MIN_PERIODS):
+    """
+    Lagged correlations of every ordered pair of metrics for every segment: one row per
+    lag (-max_lag..max_lag) and one column per (segment, leader, follower). A positive
+    lag pairs the leader's month t with the follower's month t + lag.
+    """
+    columns = list(columns or numeric_columns)
+    names, _, values = monthly_blocks(df, columns)
+    corr = cross_correlation(transform_values(values, transform), max_lag, min_periods)
+    max_lag = (corr.shape[-1] - 1) // 2
+    data = corr.reshape(-1, corr.shape[-1]).T
+    header = pd.MultiIndex.from_product([names, columns, columns], names=[SEGMENT_COLUMN, 'leader', 'follower'])
+    return pd.DataFrame(data, index=pd.RangeIndex(-max_lag, max_lag + 1, name='lag'), columns=header)
+
+
+def lead_lag_table(df, max_lag=12, columns=None, transform='growth', min_periods=MIN_PERIODS):
+    """
+    For every segment and pair of metrics: the correlation at lag 0 and the lag with the
+    strongest correlation. best_lag > 0 means `metric` leads `other` by that many months.
+    """
+    columns = list(columns or numeric_columns)
+    names, _, values = monthly_blocks(df, columns)
+    corr = cross_correlation(transform_values(values, transform), max_lag, min_periods)
+    max_lag = (corr.shape[-1] - 1) // 2
+    rows, cols = np.triu_indices(len(columns), k=1)
+    pairs = corr[:, rows, cols, :]
+
+    # Lags where no correlation could be computed never win
+    strength = np.where(np.isnan(pairs), -1.0, np.abs(pairs))
+    best = strength.argmax(axis=-1)
+    best_corr = np.take_along_axis(pairs, best[..., None], axis=-1)[..., 0]
+    best_lag = np.where(np.isnan(best_corr), 0, best - max_lag)
+
+    index = pd.MultiIndex.from_product([names, range(len(rows))], names=[SEGMENT_COLUMN, None])
+    table = pd.DataFrame({
+        'metric': np.tile(np.asarray(columns, dtype=object)[rows], len(names)),
+        'other': np.tile(np.asarray(columns, dtype=object)[cols], len(names)),
+        'lag0_corr': pairs[..., max_lag].ravel(),
+        'best_lag': best_lag.ravel(),
+        'best_corr': best_corr.ravel(),
+    }, index=index)
+    return table.droplevel(1).set_index(['metric', 'other'], append=True)
+
+
+def dominant_periods(df, top=3, columns=None, transform='growth', min_period=2, min_cycles=3):
+    """
+    The `top` strongest periods (in months) of each metric for every segment, with each
+    period's share of the series' power and the share of all seasonal harmonics. Periods
+    seen fewer than min_cycles times in the data are slow drifts rather than cycles and
+    are left out.
+    """
+    columns = list(columns or numeric_columns)
+    names, dates, values = monthly_blocks(df, columns)
+    periods, power = periodogram(transform_values(values, transform))
+    # The seasonal share is taken over every frequency, before the slow drifts are dropped
+    seasonal = seasonal_share(periods, power)
+    keep = (periods >= min_period) & (periods <= len(dates) / min_cycles)
+    periods, power = periods[keep], power[..., keep, :]
+    total = power.sum(axis=-2, keepdims=True)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        share = np.where(total > 0, power / total, np.nan)
+
+    order = np.argsort(-np.nan_to_num(share, nan=-1.0), axis=-2)[..., :top, :]
+    top_periods = periods[order]
+    top_share = np.take_along_axis(share, order, axis=-2)
+    ranks = np.arange(1, order.shape[-2] + 1)
+    index = pd.MultiIndex.from_product([names, columns, ranks], names=[SEGMENT_COLUMN, 'metric', 'rank'])
+    return pd.DataFrame({
+        'period_months': np.moveaxis(top_periods, -1, -2).ravel(),
+        'share': np.moveaxis(top_share, -1, -2).ravel(),
+        'seasonal_share': np.repeat(seasonal.ravel(), len(ranks)),
+    }, index=index)
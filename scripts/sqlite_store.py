@@ -0,0 +1,314 @@
+"""
+Indexed SQLite copy of the processed metrics for ad-hoc slicing.
+
+The database at STORE_PATH has one table per kind of data:
+
+- base: the numeric_columns of every segment and month
+- derived: the derive_metrics columns of every segment and month
+- summaries: MoM, QoQ, YoY and YTD changes (summary.summary_history) per segment, month and metric
+- meta: the data version the tables were built from
+
+base and derived are keyed on (segment, date) and stored WITHOUT ROWID, so the rows of a
+segment lie together in date order and a segment and date-range lookup is one index
+range scan; a second index on date serves range lookups across all segments. Dates are
+ISO 'YYYY-MM-DD' text and feeds without segments are stored as the 'national' segment
+(segmented feeds without national rows also get the segment totals as 'national').
+
+ingest() updates the tables in one transaction per run: a full build replaces every row,
+an incremental run upserts only the new months (and their summaries) when the stored
+version is the one the run started from. The database runs in WAL mode, so readers see
+either the previous or the new version and are not blocked while it is written.
+
+MetricsDB reads them back, returning only the rows and columns asked for:
+
+    with MetricsDB() as db:
+        db.metrics(['Active Agents'], start='2024-01', end='2024-12', segments=['national'])
+        db.summaries(start='2024-12', measures=['YoY'])
+"""
+import os
+import sqlite3
+import numpy as np
+import pandas as pd
+from metrics_store import (CLEANED_DATA_PATH, NATIONAL, SEGMENT_COLUMN, data_version, derived_columns,
+                           load_metrics, numeric_columns, segment_frame, sort_frame)
+from summary import MEASURES, summary_columns, summary_history
+from instrumentation import timed
+
+# Default location of the database
+base_dir = os.path.dirname(os.path.abspath(__file__))
+STORE_PATH = os.path.abspath(os.path.join(base_dir, '..', 'data', 'processed', 'metrics.sqlite'))
+
+# Base metrics holding whole numbers; every other metric is REAL
+INTEGER_COLUMNS = ['Active Agents']
+TABLE_COLUMNS = {
+    'base': list(numeric_columns),
+    'derived': derived_columns(),
+}
+
+
+def _quote(name):
+    # Metric names contain spaces and parentheses, so every column name is quoted
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _schema():
+    statements = []
+    for table, columns in TABLE_COLUMNS.items():
+        definitions = ', '.join(f"{_quote(col)} {'INTEGER' if col in INTEGER_COLUMNS else 'REAL'}"
+                                for col in columns)
+        statements += [
+            f"CREATE TABLE IF NOT EXISTS {table} (segment TEXT NOT NULL, date TEXT NOT NULL, {definitions}, "
+            f"PRIMARY KEY (segment, date)) WITHOUT ROWID",
+            f"CREATE INDEX IF NOT EXISTS {table}_date ON {table} (date)",
+        ]
+    definitions = ', '.join(f"{_quote(col)} REAL" for col in summary_columns())
+    statements += [
+        f"CREATE TABLE IF NOT EXISTS summaries (segment TEXT NOT NULL, date TEXT NOT NULL, metric TEXT NOT NULL, "
+        f"{definitions}, PRIMARY KEY (segment, date, metric)) WITHOUT ROWID",
+        "CREATE INDEX IF NOT EXISTS summaries_date ON summaries (date)",
+        "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)",
+    ]
+    return statements
+
+
+def connect(db_path=STORE_PATH):
+    """
+    A read-write connection to the database, creating its tables if needed.
+    """
+    os.makedirs(os.path.dirname(db_path), exist_ok=True)
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    for statement in _schema():
+        conn.execute(statement)
+    return conn
+
+
+def _iso(value):
+    return pd.Timestamp(value).strftime('%Y-%m-%d')
+
+
+def _records(frame, columns):
+    # Plain Python rows for executemany, with NaN as NULL
+    values = []
+    for col in columns:
+        column = frame[col]
+        if pd.api.types.is_datetime64_any_dtype(column):
+            values.append(np.datetime_as_string(column.to_numpy(dtype='datetime64[D]')).tolist())
+        elif pd.api.types.is_float_dtype(column):
+            data = column.to_numpy(dtype=float).astype(object)
+            data[np.isnan(column.to_numpy(dtype=float))] = None
+            values.append(data.tolist())
+        elif pd.api.types.is_integer_dtype(column):
+            values.append(column.astype(object).tolist())
+        else:
+            values.append(column.astype(object).where(column.notna(), None).tolist())
+    return list(zip(*values))
+
+
+def _with_national(df):
+    # Every stored row has a segment; feeds without national rows get the totals as national
+    if SEGMENT_COLUMN not in df.columns:
+        return df.assign(**{SEGMENT_COLUMN: NATIONAL})
+    if (df[SEGMENT_COLUMN] == NATIONAL).any():
+        return df
+    return pd.concat([segment_frame(df), df], ignore_index=True)
+
+
+def _summary_frame(df):
+    # summary_history of a frame that always has a segment column, as flat columns in
+    # primary-key order, which is the fastest order to insert in
+    history = summary_history(df).reset_index().rename(columns={'Metric': 'metric'})
+    return history.sort_values([SEGMENT_COLUMN, 'date', 'metric'], kind='stable')
+
+
+def _upsert(conn, df, summaries):
+    for table, columns in TABLE_COLUMNS.items():
+        names = [SEGMENT_COLUMN, 'date'] + columns
+        conn.executemany(f"INSERT OR REPLACE INTO {table} VALUES ({', '.join('?' * len(names))})",
+                         _records(df, names))
+    names = [SEGMENT_COLUMN, 'date', 'metric'] + summary_columns()
+    conn.executemany(f"INSERT OR REPLACE INTO summaries VALUES ({', '.join('?' * len(names))})",
+                     _records(summaries, names))
+
+
+def _set_version(conn, version):
+    conn.execute("INSERT OR REPLACE INTO meta VALUES ('data_version', ?)", (version,))
+
+
+def stored_version(db_path=STORE_PATH):
+    """
+    Data version the database was built from, or None if it has not been built.
+    """
+    if not os.path.exists(db_path):
+        return None
+    conn = connect(db_path)
+    try:
+        row = conn.execute("SELECT value FROM meta WHERE key = 'data_version'").fetchone()
+    finally:
+        conn.close()
+    return row[0] if row else None
+
+
+@timed('store', rows=len)
+def write_store(df, version, db_path=STORE_PATH):
+    """
+    Replace every row with the metrics frame df (base and derived columns, as from
+    load_metrics) and its summaries, in one transaction. Returns the stored frame.
+    """
+    df = sort_frame(_with_national(df))
+    summaries = _summary_frame(df)
+    conn = connect(db_path)
+    try:
+        with conn:
+            # DROP INDEX would otherwise be committed on its own before the first DELETE
+            conn.execute("BEGIN")
+            # The date indexes are rebuilt once after the bulk insert rather than row by row
+            for table in list(TABLE_COLUMNS) + ['summaries']:
+                conn.execute(f"DROP INDEX IF EXISTS {table}_date")
+                conn.execute(f"DELETE FROM {table}")
+            _upsert(conn, df, summaries)
+            for statement in _schema():
+                conn.execute(statement)
+            _set_version(conn, version)
+    finally:
+        conn.close()
+    print(f"Metrics database saved to: {db_path}")
+    return df
+
+
+@timed('store', rows=len)
+def update_store(df, since, previous_version, version, db_path=STORE_PATH):
+    """
+    Upsert the months of df from `since` on, and their summaries, in one transaction.
+    df is the full metrics frame after an incremental ingest; the 12 months before
+    `since` are the context of the summaries. Falls back to write_store when the database
+    is not at previous_version. Returns the upserted rows.
+    """
+    if previous_version is None or stored_version(db_path) != previous_version:
+        return write_store(df, version, db_path)
+
+    since = pd.Timestamp(since)
+    context = _with_national(df[df['date'] >= since - pd.DateOffset(months=12)].reset_index(drop=True))
+    new = context[context['date'] >= since]
+    summaries = _summary_frame(context)
+    summaries = summaries[summaries['date'] >= since]
+
+    conn = connect(db_path)
+    try:
+        with conn:
+            _upsert(conn, new, summaries)
+            _set_version(conn, version)
+    finally:
+        conn.close()
+    print(f"Metrics database updated with {len(new)} rows: {db_path}")
+    return new
+
+
+def sync_store(source_path=CLEANED_DATA_PATH, db_path=STORE_PATH):
+    """
+    Rebuild the database if it is not at the current version of the source dataset.
+    Returns the database path.
+    """
+    version = data_version(source_path)
+    if stored_version(db_path) != version:
+        write_store(load_metrics(source_path=source_path), version, db_path)
+    return db_path
+
+
+class MetricsDB:
+    """
+    Read-only queries of the metrics database. Each query reads only the requested rows
+    (by segment and inclusive date range) and columns through the table indexes and
+    returns a DataFrame sorted by segment and date.
+    """
+
+    def __init__(self, db_path=STORE_PATH):
+        if not os.path.exists(db_path):
+            raise FileNotFoundError(f"No metrics database at {db_path}; run `python scripts/cli.py ingest` first")
+        self.conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, check_same_thread=False)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def version(self):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'data_version'").fetchone()
+        return row[0] if row else None
+
+    def segments(self):
+        rows = self.conn.execute("SELECT DISTINCT segment FROM base ORDER BY segment").fetchall()
+        names = [row[0] for row in rows]
+        return [NATIONAL] + [name for name in names if name != NATIONAL] if NATIONAL in names else names
+
+    def _where(self, start, end, segments, alias):
+        clauses, params = [], []
+        if segments is not None:
+            segments = [segments] if isinstance(segments, str) else list(segments)
+            clauses.append(f"{alias}.segment IN ({', '.join('?' * len(segments))})")
+            params += segments
+        if start is not None:
+            clauses.append(f"{alias}.date >= ?")
+            params.append(_iso(start))
+        if end is not None:
+            clauses.append(f"{alias}.date <= ?")
+            params.append(_iso(end))
+        return (' WHERE ' + ' AND '.join(clauses) if clauses else ''), params
+
+    def _frame(self, sql, params, columns):
+        # Columns go straight to NumPy: ISO dates parse as datetime64 and NULL metrics become NaN
+        rows = self.conn.execute(sql, params).fetchall()
+        data = {}
+        for name, values in zip(columns, zip(*rows) if rows else [()] * len(columns)):
+            if name == 'date':
+                data[name] = np.array(values, dtype='datetime64[D]').astype('datetime64[ns]')
+            elif name in (SEGMENT_COLUMN, 'metric'):
+                data[name] = np.array(values, dtype=object)
+            else:
+                column = np.array(values)
+                data[name] = column if column.dtype != object else np.array(values, dtype=float)
+        return pd.DataFrame(data, copy=False)
+
+    def metrics(self, columns=None, start=None, end=None, segments=None):
+        """
+        Base and derived metrics (all of them by default) of the given segments (all by
+        default) between start and end, with segment and date columns first.
+        """
+        columns = list(dict.fromkeys(columns or TABLE_COLUMNS['base'] + TABLE_COLUMNS['derived']))
+        unknown = [col for col in columns if col not in TABLE_COLUMNS['base'] + TABLE_COLUMNS['derived']]
+        if unknown:
+            raise KeyError(f"Unknown metrics: {unknown}")
+
+        # Derived columns come from a join on the primary key, only when one is asked for
+        selected = [f"{'b' if col in TABLE_COLUMNS['base'] else 'd'}.{_quote(col)}" for col in columns]
+        source = 'base b'
+        if any(col in TABLE_COLUMNS['derived'] for col in columns):
+            source += ' JOIN derived d ON d.segment = b.segment AND d.date = b.date'
+        where, params = self._where(start, end, segments, 'b')
+        sql = f"SELECT b.segment, b.date, {', '.join(selected)} FROM {source}{where} ORDER BY b.segment, b.date"
+        return self._frame(sql, params, [SEGMENT_COLUMN, 'date'] + columns)
+
+    def summaries(self, start=None, end=None, segments=None, metrics=None, measures=None):
+        """
+        Summary rows (segment, date, metric, current value and the changes of `measures`,
+        all of MEASURES by default) between start and end.
+        """
+        columns = ['Current Value']
+        for measure in measures or MEASURES:
+            if measure not in MEASURES:
+                raise KeyError(f"Unknown measure: {measure}")
+            columns += [f'{measure} Change', f'{measure} %']
+
+        where, params = self._where(start, end, segments, 's')
+        if metrics is not None:
+            metrics = [metrics] if isinstance(metrics, str) else list(metrics)
+            where += (' AND ' if where else ' WHERE ') + f"s.metric IN ({', '.join('?' * len(metrics))})"
+            params += metrics
+        sql = (f"SELECT s.segment, s.date, s.metric, {', '.join(f's.{_quote(col)}' for col in columns)} "
+               f"FROM summaries s{where} ORDER BY s.segment, s.date, s.metric")
+        return self._frame(sql, params, [SEGMENT_COLUMN, 'date', 'metric'] + columns)
@@ -0,0 +1,127 @@
+import os
+import shutil
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from metrics_store import SEGMENT_COLUMN, sort_frame
+
+# Default locations of the typed processed dataset
+base_dir = os.path.dirname(os.path.abspath(__file__))
+PROCESSED_DATASET_DIR = os.path.abspath(os.path.join(base_dir, '..', 'data', 'processed', 'mobile_payments'))
+ARROW_SNAPSHOT_PATH = f"{PROCESSED_DATASET_DIR}.arrow"
+
+# Explicit schema of the processed data; year_month is not stored since it is derived from date
+SCHEMA = pa.schema([
+    ('date', pa.date32()),
+    ('Year', pa.int32()),
+    ('Month', pa.int32()),
+    ('Active Agents', pa.int32()),
+    ('Total Registered Mobile Money Accounts (Millions)', pa.float32()),
+    ('Total Agent Cash in Cash Out (Volume Million)', pa.float32()),
+    ('Total Agent Cash in Cash Out (Value KSh billions)', pa.float32()),
+])
+# Feeds with a segment dimension store it as an extra string column
+SEGMENTED_SCHEMA = SCHEMA.append(pa.field(SEGMENT_COLUMN, pa.string()))
+
+PARTITIONING = ds.partitioning(pa.schema([('Year', pa.int32())]), flavor='hive')
+
+
+def to_table(df):
+    """
+    Convert a processed frame to an Arrow table with the explicit schema.
+    """
+    schema = SEGMENTED_SCHEMA if SEGMENT_COLUMN in df.columns else SCHEMA
+    df = df.assign(date=pd.to_datetime(df['date']).dt.date)
+    return pa.Table.from_pandas(df[schema.names], schema=schema, preserve_index=False)
+
+
+def dataset_schema(dataset_dir=PROCESSED_DATASET_DIR):
+    """
+    SEGMENTED_SCHEMA if the stored dataset has a segment column, otherwise SCHEMA.
+    """
+    names = ds.dataset(dataset_dir, format='parquet', partitioning=PARTITIONING).schema.names
+    return SEGMENTED_SCHEMA if SEGMENT_COLUMN in names else SCHEMA
+
+
+def to_frame(table):
+    """
+    Convert an Arrow table back to the processed frame layout (datetime date column,
+    year_month added when the date is present, rows ordered by segment and date).
+    """
+    df = table.to_pandas(date_as_object=False)
+    if 'date' in df.columns:
+        df['date'] = df['date'].astype('datetime64[ns]')
+        df = sort_frame(df)
+        df['year_month'] = df['date'].dt.strftime('%Y-%m')
+    return df
+
+
+def write_processed(df, dataset_dir=PROCESSED_DATASET_DIR):
+    """
+    Write the full processed dataset as Parquet partitioned by year, replacing any
+    existing dataset, plus an uncompressed Arrow snapshot (<dataset_dir>.arrow) for
+    memory-mapped reads.
+    """
+    if os.path.exists(dataset_dir):
+        shutil.rmtree(dataset_dir)
+    table = to_table(df)
+    pq.write_to_dataset(table, dataset_dir, partitioning=PARTITIONING,
+                        basename_template='part-{i}.parquet')
+    write_snapshot(table, f"{dataset_dir}.arrow")
+
+
+def append_processed(new_rows, dataset_dir=PROCESSED_DATASET_DIR):
+    """
+    Append rows to the dataset, rewriting only the year partitions they fall in.
+    """
+    years = sorted(new_rows['Year'].unique().tolist())
+    existing = read_processed(years=years, dataset_dir=dataset_dir, memory_map=False)
+    keys = [SEGMENT_COLUMN, 'date'] if SEGMENT_COLUMN in new_rows.columns else 'date'
+    combined = pd.concat([existing, new_rows], ignore_index=True).drop_duplicates(keys, keep='last')
+
+    pq.write_to_dataset(to_table(combined), dataset_dir, partitioning=PARTITIONING,
+                        basename_template='part-{i}.parquet', existing_data_behavior='delete_matching')
+    write_snapshot(read_table(dataset_dir=dataset_dir), f"{dataset_dir}.arrow")
+
+
+def read_table(columns=None, years=None, dataset_dir=PROCESSED_DATASET_DIR, memory_map=True):
+    """
+    Read the dataset as an Arrow table, optionally limited to some columns and years.
+    """
+    filters = [('Year', 'in', list(years))] if years is not None else None
+    return pq.read_table(dataset_dir, columns=columns, filters=filters, schema=dataset_schema(dataset_dir),
+                         partitioning=PARTITIONING, memory_map=memory_map)
+
+
+def read_processed(columns=None, years=None, dataset_dir=PROCESSED_DATASET_DIR, memory_map=True):
+    """
+    Read the processed dataset from the partitioned Parquet store.
+    """
+    if columns is not None:
+        columns = [col for col in columns if col != 'year_month']
+    return to_frame(read_table(columns, years, dataset_dir, memory_map))
+
+
+def write_snapshot(table, snapshot_path=ARROW_SNAPSHOT_PATH):
+    tmp_path = f"{snapshot_path}.{os.getpid()}.tmp"
+    with pa.OSFile(tmp_path, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, snapshot_path)
+
+
+def read_snapshot(columns=None, snapshot_path=ARROW_SNAPSHOT_PATH):
+    """
+    Memory-map the Arrow snapshot; only the selected columns are paged in.
+    """
+    # The mapping stays alive for as long as the table's buffers reference it
+    source = pa.memory_map(snapshot_path, 'r')
+    table = pa.ipc.open_file(source).read_all()
+    if columns is not None:
+        table = table.select([col for col in columns if col != 'year_month'])
+    return to_frame(table)
+
+
+def processed_exists(dataset_dir=PROCESSED_DATASET_DIR):
+    return os.path.isdir(dataset_dir) and any(os.scandir(dataset_dir))
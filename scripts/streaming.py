@@ -0,0 +1,173 @@
+"""
+Streaming aggregation of transaction-level or agent-level records into the monthly schema.
+
+Transaction records have one row per cash-in/cash-out with columns `date`, `agent_id`,
+`amount` (KSh) and optionally `account_id`. Agent records have one row per agent and
+period with `date`, `agent_id`, `transactions` and `value` (KSh). Input is read in
+chunks (CSV) or record batches (Parquet) and reduced per month and agent, so memory is
+bounded by the agents and accounts seen in the months still open rather than by the
+size of the file. With sorted_input=True months are closed as soon as the feed has
+moved past them, which keeps memory flat for time-ordered logs.
+"""
+import os
+import time
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+from instrumentation import peak_rss_mb
+from metrics_store import numeric_columns
+
+# Number of partial per-agent frames kept for a month before they are combined
+COMPACT_EVERY = 16
+
+
+def iter_batches(file_path, columns, batch_rows=1_000_000):
+    """
+    Yield the selected columns of a CSV or Parquet file as DataFrames of at most batch_rows rows.
+    """
+    if file_path.endswith('.parquet'):
+        parquet_file = pq.ParquetFile(file_path)
+        for batch in parquet_file.iter_batches(batch_size=batch_rows, columns=columns):
+            yield batch.to_pandas()
+    else:
+        id_types = {col: str for col in ('agent_id', 'account_id') if col in columns}
+        yield from pd.read_csv(file_path, usecols=columns, dtype=id_types, chunksize=batch_rows)
+
+
+class MonthlyAggregator:
+    """
+    Running per-month, per-agent totals that are reduced to one monthly row when a month closes.
+    """
+
+    def __init__(self, agent_writer=None):
+        self.open_months = {}
+        self.monthly_rows = []
+        self.agent_writer = agent_writer
+
+    def add(self, months, agent_ids, transactions, value, account_ids=None):
+        batch = pd.DataFrame({'month': months, 'agent_id': agent_ids,
+                              'transactions': transactions, 'value': value})
+        per_agent = batch.groupby(['month', 'agent_id'], sort=False)[['transactions', 'value']].sum()
+        # Every month of the batch is opened first: rows without an agent id still count accounts
+        for month in batch['month'].unique():
+            self.open_months.setdefault(month, {'agents': [], 'accounts': []})
+
+        for month, frame in per_agent.groupby(level='month', sort=False):
+            state = self.open_months[month]
+            state['agents'].append(frame.droplevel('month'))
+            if len(state['agents']) >= COMPACT_EVERY:
+                state['agents'] = [self._combine(state['agents'])]
+
+        if account_ids is not None:
+            # Accounts are tracked as 64-bit hashes so ids of any type cost 8 bytes each
+            hashed = pd.DataFrame({'month': months, 'account': pd.util.hash_array(np.asarray(account_ids))})
+            for month, accounts in hashed.drop_duplicates().groupby('month', sort=False)['account']:
+                state = self.open_months[month]
+                state['accounts'].append(accounts.to_numpy())
+                if len(state['accounts']) >= COMPACT_EVERY:
+                    state['accounts'] = [np.unique(np.concatenate(state['accounts']))]
+
+    @staticmethod
+    def _combine(frames):
+        return pd.concat(frames).groupby(level=0).sum()
+
+    def close(self, before=None):
+        """
+        Reduce every open month (or only months earlier than `before`) to its monthly row.
+        """
+        for month in sorted(self.open_months):
+            if before is not None and month >= before:
+                continue
+            state = self.open_months.pop(month)
+            agents = (self._combine(state['agents']) if state['agents']
+                      else pd.DataFrame({'transactions': [], 'value': []}))
+            accounts = len(np.unique(np.concatenate(state['accounts']))) if state['accounts'] else np.nan
+
+            self.monthly_rows.append({
+                'date': pd.Timestamp(month),
+                'Active Agents': len(agents),
+                'Total Registered Mobile Money Accounts (Millions)': accounts / 1e6,
+                'Total Agent Cash in Cash Out (Volume Million)': agents['transactions'].sum() / 1e6,
+                'Total Agent Cash in Cash Out (Value KSh billions)': agents['value'].sum() / 1e9,
+            })
+            if self.agent_writer is not None:
+                self.agent_writer(pd.Timestamp(month), agents)
+
+    def result(self):
+        df = pd.DataFrame(self.monthly_rows, columns=['date'] + numeric_columns)
+        df = df.sort_values('date').reset_index(drop=True)
+        df.insert(0, 'Year', df['date'].dt.year)
+        df.insert(1, 'Month', df['date'].dt.month)
+        df['year_month'] = df['date'].dt.strftime('%Y-%m')
+        return df
+
+
+def _agent_writer(output_dir):
+    # Writes each closed month's per-agent totals to its own Parquet file
+    os.makedirs(output_dir, exist_ok=True)
+
+    def write(month, agents):
+        agents.reset_index().to_parquet(os.path.join(output_dir, f"agents_{month:%Y-%m}.parquet"), index=False)
+    return write
+
+
+def aggregate_stream(file_path, record_type='transaction', batch_rows=1_000_000,
+                     sorted_input=False, agent_output=None):
+    """
+    Aggregate a transaction-level or agent-level file into the monthly schema with the
+    four numeric_columns. Per-agent monthly totals are written to `agent_output`
+    (a directory of Parquet files, one per month) when given.
+    Returns (monthly frame, stats) where stats has rows, batches, seconds and peak RSS.
+
+    Accounts are counted as distinct account_id values active in the month, since
+    registrations cannot be derived from transactions; they are NaN if account_id is absent,
+    and the report then leaves accounts out of its forecasts and scenarios.
+    """
+    if record_type == 'transaction':
+        columns = ['date', 'agent_id', 'amount']
+    elif record_type == 'agent':
+        columns = ['date', 'agent_id', 'transactions', 'value']
+    else:
+        raise ValueError(f"Unknown record type: {record_type}")
+
+    # account_id is optional, so check the header before asking for it
+    if file_path.endswith('.parquet'):
+        available = pq.ParquetFile(file_path).schema_arrow.names
+    else:
+        available = pd.read_csv(file_path, nrows=0).columns
+    if 'account_id' in available:
+        columns.append('account_id')
+    else:
+        print("No account_id column: registered accounts are left empty")
+
+    aggregator = MonthlyAggregator(_agent_writer(agent_output) if agent_output is not None else None)
+    start = time.perf_counter()
+    rows = batches = 0
+
+    for chunk in iter_batches(file_path, columns, batch_rows):
+        months = pd.to_datetime(chunk['date']).to_numpy().astype('datetime64[M]')
+        if record_type == 'transaction':
+            transactions, value = np.ones(len(chunk)), chunk['amount'].to_numpy(dtype=float)
+        else:
+            transactions, value = chunk['transactions'].to_numpy(dtype=float), chunk['value'].to_numpy(dtype=float)
+
+        aggregator.add(months, chunk['agent_id'].to_numpy(), transactions, value,
+                       chunk['account_id'].to_numpy() if 'account_id' in chunk else None)
+
+        if sorted_input and len(months):
+            aggregator.close(before=months.min())
+
+        rows += len(chunk)
+        batches += 1
+
+    aggregator.close()
+    stats = {
+        'rows': rows,
+        'batches': batches,
+        'seconds': time.perf_counter() - start,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+    peak = f"{stats['peak_rss_mb']:,.0f} MB" if stats['peak_rss_mb'] is not None else "n/a"
+    print(f"Aggregated {rows:,} records in {batches} batches into {len(aggregator.monthly_rows)} months "
+          f"in {stats['seconds']:.1f}s (peak RSS: {peak})")
+    return aggregator.result(), stats
@@ -0,0 +1,109 @@
+"""
+Period-over-period summaries of the metrics for any number of "as of" months at once.
+
+The metrics are laid out on a date-indexed frame with one row per calendar month
+(missing months are NaN rows), so the MoM, QoQ and YoY bases are plain row shifts and
+the YTD base is the previous December, found by shifting each row by its month number.
+Every change is computed for every month, metric and segment in one array pass;
+summary_as_of() then selects the months asked for.
+"""
+import numpy as np
+import pandas as pd
+from metrics_store import numeric_columns, SEGMENT_COLUMN
+
+# Months back to the comparison base of each fixed-lag measure
+PERIODS = {'MoM': 1, 'QoQ': 3, 'YoY': 12}
+MEASURES = list(PERIODS) + ['YTD']
+
+
+def summary_columns():
+    """
+    Column names of a summary table, in output order.
+    """
+    columns = ['Current Value']
+    for measure in MEASURES:
+        columns += [f'{measure} Change', f'{measure} %']
+    return columns
+
+
+def monthly_frame(df, columns=None):
+    """
+    The metrics indexed by date on a complete monthly calendar. With a segment column the
+    columns are (segment, metric) pairs so every segment shares the same calendar.
+    """
+    columns = list(columns or numeric_columns)
+    if SEGMENT_COLUMN in df.columns:
+        wide = df.pivot(index='date', columns=SEGMENT_COLUMN, values=columns).swaplevel(axis=1)
+        names = sorted(df[SEGMENT_COLUMN].unique())
+        wide = wide.reindex(columns=pd.MultiIndex.from_product([names, columns]))
+    else:
+        wide = df.set_index('date')[columns]
+    months = pd.date_range(wide.index.min(), wide.index.max(), freq='MS')
+    return wide.reindex(months).rename_axis('date')
+
+
+def _base_rows(months):
+    # Row of the comparison base for each measure; negative where it precedes the data
+    rows = np.arange(len(months))
+    bases = {measure: rows - periods for measure, periods in PERIODS.items()}
+    bases['YTD'] = rows - months.month.to_numpy()
+    return bases
+
+
+def summary_history(df, columns=None):
+    """
+    Current value, change and % change for every measure (MoM, QoQ, YoY, YTD), for every
+    month and metric (and segment). Returns a long frame indexed by (date, [segment,] Metric).
+    A % change is 0 where the base value is 0 and NaN where no base exists.
+    """
+    wide = monthly_frame(df, columns)
+    values = wide.to_numpy(dtype=float)
+    n_months, n_series = values.shape
+
+    blocks = [values]
+    for measure, base in _base_rows(wide.index).items():
+        previous = np.full(values.shape, np.nan)
+        valid = base >= 0
+        previous[valid] = values[base[valid]]
+        change = values - previous
+        with np.errstate(divide='ignore', invalid='ignore'):
+            pct = np.where(previous == 0, 0.0, change / previous * 100)
+        blocks += [change, pct]
+
+    # (month, series, column) flattened to one row per month and series
+    data = np.stack(blocks, axis=-1).reshape(n_months * n_series, len(blocks))
+    levels = [np.repeat(wide.index.to_numpy(), n_series)]
+    names = ['date']
+    if isinstance(wide.columns, pd.MultiIndex):
+        levels += [np.tile(wide.columns.get_level_values(i).to_numpy(), n_months) for i in range(2)]
+        names += [SEGMENT_COLUMN, 'Metric']
+    else:
+        levels.append(np.tile(wide.columns.to_numpy(), n_months))
+        names.append('Metric')
+
+    history = pd.DataFrame(data, index=pd.MultiIndex.from_arrays(levels, names=names), columns=summary_columns())
+    return history[history['Current Value'].notna().to_numpy()]
+
+
+def summary_as_of(df, dates=None, columns=None):
+    """
+    Summary tables as of the given dates (the latest month by default). Each date is
+    matched to the latest month on or before it; dates before the data are dropped.
+    """
+    history = summary_history(df, columns)
+    months = history.index.get_level_values('date')
+    available = months.unique()
+    if dates is None:
+        selected = available[-1:]
+    else:
+        requested = pd.to_datetime(pd.Index(np.atleast_1d(dates)))
+        positions = np.searchsorted(available.to_numpy(), requested.to_numpy(), side='right') - 1
+        selected = available[positions[positions >= 0]]
+    return history[months.isin(selected)]
+
+
+def latest_summary(df, columns=None):
+    """
+    Summary table for the latest month, one row per metric (and segment).
+    """
+    return summary_as_of(df, columns=columns).droplevel('date').reset_index()
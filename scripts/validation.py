@@ -0,0 +1,205 @@
+"""
+Vectorized validation of parsed monthly rows.
+
+Every check runs on the whole (rows x metrics) block at once, for all segments together:
+
+    errors (the row is quarantined)
+        period     Year/Month could not be read
+        missing    a metric is empty or not a number
+        negative   a metric is below zero
+        future     the month is after the current month
+    warnings (the row is kept and reported)
+        duplicate  a later row has the same segment and month
+        decline    agents or accounts fell by more than DECLINE_TOLERANCE % in a month
+        outlier    monthly log growth is a robust z-score outlier against the segment's
+                   trailing median growth and at least doubles or halves against it
+        seasonal   the growth residual is such an outlier after removing the segment's
+                   usual growth for that calendar month
+
+Growth-based checks can be given the preceding history (e.g. the last two years of the
+processed dataset), so a single new month is judged against its own segment's past.
+Rows with errors are appended with their reasons to QUARANTINE_PATH instead of aborting
+the run.
+"""
+import os
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from metrics_store import numeric_columns, SEGMENT_COLUMN, segment_codes
+
+# Default location of quarantined raw rows
+base_dir = os.path.dirname(os.path.abspath(__file__))
+QUARANTINE_PATH = os.path.abspath(os.path.join(base_dir, '..', 'data', 'processed', 'quarantine.csv'))
+
+# Stock metrics that should rarely fall from one month to the next
+MONOTONIC_COLUMNS = ['Active Agents', 'Total Registered Mobile Money Accounts (Millions)']
+DECLINE_TOLERANCE = 20.0
+# Robust z-score above which growth is flagged, and the trailing window it is compared with.
+# Series as steady as agents and accounts have a tiny MAD, so growth must also differ from
+# the trend by MIN_DEVIATION (log growth: a doubling or halving) to be flagged; the real
+# history's largest residual is about 0.46 while a misplaced digit is 2.3
+Z_THRESHOLD = 5.0
+MIN_DEVIATION = np.log(2)
+TREND_WINDOW = 12
+MIN_HISTORY = 6
+
+ISSUE_COLUMNS = ['row', 'date', SEGMENT_COLUMN, 'check', 'severity', 'column', 'value']
+
+
+def parse_numeric(series):
+    """
+    Parse a column of numbers written with thousands separators; unreadable cells become NaN.
+    Whole-number columns without missing cells stay integers.
+    """
+    if pd.api.types.is_numeric_dtype(series):
+        return series
+    return pd.to_numeric(series.str.replace(',', '', regex=False), errors='coerce')
+
+
+def _robust_z(values, codes):
+    # 0.6745 * (x - median) / MAD with the median and MAD taken per segment
+    frame = pd.DataFrame(values)
+    median = frame.groupby(codes).transform('median').to_numpy()
+    mad = pd.DataFrame(np.abs(values - median)).groupby(codes).transform('median').to_numpy()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(mad > 0, 0.6745 * (values - median) / mad, np.nan)
+
+
+def _trailing_median(values, codes, window=TREND_WINDOW, min_periods=MIN_HISTORY):
+    # Median of the previous `window` rows of the same segment, NaN with too little history.
+    # The rolling median runs over a copy with `window` empty rows before each segment, so
+    # no window crosses segments
+    starts = np.r_[True, codes[1:] != codes[:-1]] if len(codes) else np.zeros(0, dtype=bool)
+    positions = np.arange(len(values)) + window * np.cumsum(starts)
+    padded = np.full((len(values) + window * int(starts.sum()), values.shape[1]), np.nan)
+    padded[positions] = values
+    median = pd.DataFrame(padded).rolling(window, min_periods=min_periods).median().to_numpy()
+    return median[positions - 1]
+
+
+def growth_checks(df, columns=None):
+    """
+    Boolean (rows x columns) masks of the decline, outlier and seasonal checks for a frame
+    sorted with sort_frame. Rows without enough history are never flagged.
+    """
+    columns = list(columns or numeric_columns)
+    values = df[columns].to_numpy(dtype=float)
+    codes = segment_codes(df)
+
+    # Month-on-month change within each segment
+    previous = np.full(values.shape, np.nan)
+    previous[1:] = values[:-1]
+    previous[1:][codes[1:] != codes[:-1]] = np.nan
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pct = (values / previous - 1) * 100
+        growth = np.log(np.where(values > 0, values, np.nan) / np.where(previous > 0, previous, np.nan))
+
+    monotonic = np.isin(columns, MONOTONIC_COLUMNS)
+    decline = (pct < -DECLINE_TOLERANCE) & monotonic
+
+    # Growth against the segment's recent trend, then against its usual growth for the month
+    residual = growth - _trailing_median(growth, codes)
+    outlier = (np.abs(_robust_z(residual, codes)) > Z_THRESHOLD) & (np.abs(residual) > MIN_DEVIATION)
+
+    months = df['date'].dt.month.to_numpy()
+    seasonal_keys = codes * 13 + months
+    seasonal = pd.DataFrame(residual).groupby(seasonal_keys).transform('median').to_numpy()
+    deseasonalised = residual - seasonal
+    seasonal_outlier = ((np.abs(_robust_z(deseasonalised, codes)) > Z_THRESHOLD)
+                        & (np.abs(deseasonalised) > MIN_DEVIATION))
+    return {'decline': decline, 'outlier': outlier, 'seasonal': seasonal_outlier}
+
+
+def _issues(mask, check, severity, df, columns, values):
+    # One issue per flagged (row, column) cell
+    rows, cols = np.nonzero(mask)
+    segments = df[SEGMENT_COLUMN].to_numpy()[rows] if SEGMENT_COLUMN in df.columns else None
+    return pd.DataFrame({
+        'row': df.index.to_numpy()[rows],
+        'date': df['date'].to_numpy()[rows],
+        SEGMENT_COLUMN: segments,
+        'check': check,
+        'severity': severity,
+        'column': np.asarray(columns, dtype=object)[cols],
+        'value': values[rows, cols],
+    }, columns=ISSUE_COLUMNS)
+
+
+def validate(df, history=None, columns=None, today=None):
+    """
+    Run every check on parsed rows (Year, Month, date, the metrics and an optional segment
+    column; unreadable values NaN/NaT). history holds earlier valid rows that growth checks
+    compare against but that are not themselves reported. Returns a boolean array of the
+    rows without errors and a frame of issues, one per failed check and column.
+    """
+    columns = list(columns or numeric_columns)
+    missing_columns = [col for col in ['Year', 'Month', 'date'] + columns if col not in df.columns]
+    if missing_columns:
+        raise ValueError(f"Missing columns: {', '.join(missing_columns)}")
+
+    values = df[columns].to_numpy(dtype=float)
+    period = df['date'].isna().to_numpy()
+    period_values = np.column_stack([df['Year'].to_numpy(dtype=float), df['Month'].to_numpy(dtype=float)])
+    current_month = pd.Timestamp(today or datetime.now()).to_period('M').to_timestamp()
+
+    checks = [
+        ('period', period[:, None], ['Year/Month'], period_values[:, :1]),
+        ('missing', np.isnan(values), columns, values),
+        ('negative', values < 0, columns, values),
+        ('future', (df['date'] > current_month).to_numpy()[:, None], ['date'], period_values[:, :1]),
+    ]
+    issues = [_issues(mask, check, 'error', df, check_columns, check_values)
+              for check, mask, check_columns, check_values in checks]
+    passed = ~np.column_stack([mask.any(axis=1) for _, mask, _, _ in checks]).any(axis=1)
+
+    keys = [SEGMENT_COLUMN, 'date'] if SEGMENT_COLUMN in df.columns else ['date']
+    duplicate = (df.duplicated(keys, keep='last').to_numpy() & passed)[:, None]
+    issues.append(_issues(duplicate, 'duplicate', 'warning', df, ['date'], period_values[:, :1]))
+
+    # Growth checks on the valid rows, with any history placed before them
+    valid = df[passed & ~duplicate[:, 0]]
+    if len(valid):
+        context = valid.assign(_new=True)
+        if history is not None and len(history):
+            context = pd.concat([history.assign(_new=False), context], ignore_index=False)
+        sort_keys = [SEGMENT_COLUMN, 'date'] if SEGMENT_COLUMN in context.columns else ['date']
+        context = context.sort_values(sort_keys, kind='stable')
+        new = context['_new'].to_numpy(dtype=bool)
+        context_values = context[columns].to_numpy(dtype=float)
+        for check, mask in growth_checks(context, columns).items():
+            issues.append(_issues(mask & new[:, None], check, 'warning', context, columns, context_values))
+
+    issues = pd.concat([issue for issue in issues if len(issue)] or [pd.DataFrame(columns=ISSUE_COLUMNS)],
+                       ignore_index=True)
+    if SEGMENT_COLUMN not in df.columns:
+        issues = issues.drop(columns=SEGMENT_COLUMN)
+    return passed, issues
+
+
+def report_issues(issues):
+    """
+    Print the number of issues per severity and check.
+    """
+    if issues.empty:
+        return
+    counts = issues.groupby(['severity', 'check']).size()
+    for (severity, check), count in counts.items():
+        rows = issues.loc[(issues['severity'] == severity) & (issues['check'] == check), 'row'].nunique()
+        print(f"Validation {severity}: {check} in {rows} rows ({count} values)")
+
+
+def quarantine(raw, issues, quarantine_path=QUARANTINE_PATH):
+    """
+    Append the raw rows with errors, and the checks they failed, to the quarantine CSV.
+    Returns the number of rows quarantined.
+    """
+    errors = issues[issues['severity'] == 'error']
+    if errors.empty:
+        return 0
+    reasons = (errors['check'] + ': ' + errors['column']).groupby(errors['row'], sort=False).agg('; '.join)
+    rows = raw.loc[reasons.index].assign(checks=reasons.to_numpy(),
+                                         quarantined_at=datetime.now().isoformat(timespec='seconds'))
+    os.makedirs(os.path.dirname(quarantine_path), exist_ok=True)
+    rows.to_csv(quarantine_path, mode='a', header=not os.path.exists(quarantine_path), index=False)
+    print(f"Quarantined {len(rows)} rows to {quarantine_path}")
+    return len(rows)
@@ -1,11 +1,29 @@
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
+import matplotlib
+matplotlib.use('Agg')  # Headless rendering, charts are only written to disk
 import matplotlib.pyplot as plt
 import seaborn as sns
-from data_exploration import numeric_columns, df
-from data_analysis import monthly_patterns, correlation
+from data_exploration import numeric_columns
+from instrumentation import span
+from metrics_store import metric_slug
+
+# Default output directory for the report charts
+base_dir = os.path.dirname(os.path.abspath(__file__))
+ASSETS_DIR = os.path.abspath(os.path.join(base_dir, '..', 'reports', 'assests'))
+MANIFEST_NAME = '.chart_manifest.json'
+
+# Set visualization style
+def set_style():
+    plt.style.use('seaborn-v0_8-whitegrid')
+    sns.set_palette("deep")
 
 # Function to create time series plots
-def plot_time_series(df, column, title, y_label, color='blue'):
+def plot_time_series(df, column, title, y_label, color='blue', output_dir='.'):
     plt.figure(figsize=(12, 6))
     plt.plot(df['date'], df[column], color=color, linewidth=2)
     plt.title(title, fontsize=16)
@@ -13,86 +31,179 @@ def plot_time_series(df, column, title, y_label, color='blue'):
     plt.ylabel(y_label, fontsize=12)
     plt.grid(True, alpha=0.3)
     plt.tight_layout()
-    plt.savefig(f"{title.lower().replace(' ', '_')}.png", dpi=300)
-    plt.show()
-
-# Create individual plots for each metric
-plot_time_series(df, 'Active Agents', 'Growth in Mobile Money Agents', 'Number of Active Agents', 'green')
-plot_time_series(df, 'Total Registered Mobile Money Accounts (Millions)', 'Mobile Money Account Adoption', 'Number of Accounts', 'blue')
-plot_time_series(df, 'Total Agent Cash in Cash Out (Volume Million)', 'Transaction Volume Growth', 'Number of Transactions', 'orange')
-plot_time_series(df, 'Total Agent Cash in Cash Out (Value KSh billions)', 'Transaction Value Growth', 'Value (KES)', 'red')
+    file_path = os.path.join(output_dir, f"{title.lower().replace(' ', '_')}.png")
+    plt.savefig(file_path, dpi=300)
+    plt.close()
+    return file_path
 
 # Function to create comparative growth visualizations
-def plot_comparative_growth(df, base_year=2010):
+def plot_comparative_growth(df, base_year=2010, output_dir='.'):
     # Filter data starting from base_year
     start_date = pd.Timestamp(year=base_year, month=1, day=1)
     filtered_df = df[df['date'] >= start_date].copy()
-    
+
     # Calculate relative growth with first period as base (=100)
     for col in numeric_columns:
         base_value = filtered_df[col].iloc[0]
         filtered_df[f"{col}_indexed"] = filtered_df[col] / base_value * 100
-    
+
     # Plot indexed growth
     plt.figure(figsize=(14, 8))
-    
+
     for col in numeric_columns:
         indexed_col = f"{col}_indexed"
         label = col.replace('Total ', '').replace(' ', '_')
         plt.plot(filtered_df['date'], filtered_df[indexed_col], linewidth=2, label=label)
-    
+
     plt.title(f'Relative Growth Since {base_year} (Indexed to 100)', fontsize=16)
     plt.xlabel('Year', fontsize=12)
     plt.ylabel('Growth Index (Base=100)', fontsize=12)
     plt.grid(True, alpha=0.3)
     plt.legend(fontsize=10)
     plt.tight_layout()
-    plt.savefig(f"comparative_growth_since_{base_year}.png", dpi=300)
-    plt.show()
-
-# Plot comparative growth
-plot_comparative_growth(df, base_year=2010)
+    file_path = os.path.join(output_dir, f"comparative_growth_since_{base_year}.png")
+    plt.savefig(file_path, dpi=300)
+    plt.close()
+    return file_path
 
 # Create YoY growth rate visualization
-plt.figure(figsize=(14, 8))
-for column in numeric_columns:
-    col_name = column.split(' ')[-1] if 'Total' in column else column.replace(' ', '_')
-    pct_col = f"{col_name}_yoy_growth"
-    
-    # Skip the first year which will have NaN values
-    plt.plot(df['date'][12:], df[pct_col][12:], linewidth=2, 
-             label=column.replace('Total ', '').replace(' ', '_'))
-
-plt.title('Year-over-Year Growth Rates', fontsize=16)
-plt.xlabel('Year', fontsize=12)
-plt.ylabel('Growth Rate (%)', fontsize=12)
-plt.grid(True, alpha=0.3)
-plt.legend(fontsize=10)
-plt.tight_layout()
-plt.savefig("yoy_growth_rates.png", dpi=300)
-plt.show()
+def plot_yoy_growth(df, output_dir='.'):
+    plt.figure(figsize=(14, 8))
+    for column in numeric_columns:
+        pct_col = f"{metric_slug(column)}_yoy_growth"
+
+        # Skip the first year which will have NaN values
+        plt.plot(df['date'][12:], df[pct_col][12:], linewidth=2,
+                 label=column.replace('Total ', '').replace(' ', '_'))
+
+    plt.title('Year-over-Year Growth Rates', fontsize=16)
+    plt.xlabel('Year', fontsize=12)
+    plt.ylabel('Growth Rate (%)', fontsize=12)
+    plt.grid(True, alpha=0.3)
+    plt.legend(fontsize=10)
+    plt.tight_layout()
+    file_path = os.path.join(output_dir, "yoy_growth_rates.png")
+    plt.savefig(file_path, dpi=300)
+    plt.close()
+    return file_path
 
 # Create a heatmap of the correlation matrix
-plt.figure(figsize=(10, 8))
-sns.heatmap(correlation, annot=True, cmap='coolwarm', vmin=-1, vmax=1, fmt='.2f')
-plt.title('Correlation Matrix of Key Metrics', fontsize=16)
-plt.tight_layout()
-plt.savefig("correlation_heatmap.png", dpi=300)
-plt.show()
+def plot_correlation_heatmap(correlation, output_dir='.'):
+    plt.figure(figsize=(10, 8))
+    sns.heatmap(correlation, annot=True, cmap='coolwarm', vmin=-1, vmax=1, fmt='.2f')
+    plt.title('Correlation Matrix of Key Metrics', fontsize=16)
+    plt.tight_layout()
+    file_path = os.path.join(output_dir, "correlation_heatmap.png")
+    plt.savefig(file_path, dpi=300)
+    plt.close()
+    return file_path
 
 # Create seasonal patterns visualization
-plt.figure(figsize=(14, 8))
-for column in numeric_columns:
-    # Normalize to make all metrics comparable
-    normalized = monthly_patterns[column] / monthly_patterns[column].max()
-    plt.plot(monthly_patterns.index, normalized, linewidth=2, marker='o',
-             label=column.replace('Total ', '').replace(' ', '_'))
-
-plt.title('Seasonal Patterns in Mobile Money Metrics', fontsize=16)
-plt.xlabel('Month', fontsize=12)
-plt.ylabel('Relative Magnitude (Normalized)', fontsize=12)
-plt.grid(True, alpha=0.3)
-plt.legend(fontsize=10)
-plt.tight_layout()
-plt.savefig("seasonal_patterns.png", dpi=300)
-plt.show()
\ No newline at end of file
+def plot_seasonal_patterns(monthly_patterns, output_dir='.'):
+    plt.figure(figsize=(14, 8))
+    for column in numeric_columns:
+        # Normalize to make all metrics comparable
+        normalized = monthly_patterns[column] / monthly_patterns[column].max()
+        plt.plot(monthly_patterns.index, normalized, linewidth=2, marker='o',
+                 label=column.replace('Total ', '').replace(' ', '_'))
+
+    plt.title('Seasonal Patterns in Mobile Money Metrics', fontsize=16)
+    plt.xlabel('Month', fontsize=12)
+    plt.ylabel('Relative Magnitude (Normalized)', fontsize=12)
+    plt.grid(True, alpha=0.3)
+    plt.legend(fontsize=10)
+    plt.tight_layout()
+    file_path = os.path.join(output_dir, "seasonal_patterns.png")
+    plt.savefig(file_path, dpi=300)
+    plt.close()
+    return file_path
+
+# Describe every report chart as (file name, plot function, input data, extra arguments)
+def chart_jobs(df):
+    from data_analysis import correlation_matrix, seasonal_patterns
+
+    jobs = []
+    time_series = [
+        ('Active Agents', 'Growth in Mobile Money Agents', 'Number of Active Agents', 'green'),
+        ('Total Registered Mobile Money Accounts (Millions)', 'Mobile Money Account Adoption', 'Number of Accounts', 'blue'),
+        ('Total Agent Cash in Cash Out (Volume Million)', 'Transaction Volume Growth', 'Number of Transactions', 'orange'),
+        ('Total Agent Cash in Cash Out (Value KSh billions)', 'Transaction Value Growth', 'Value (KES)', 'red'),
+    ]
+    for column, title, y_label, color in time_series:
+        jobs.append((f"{title.lower().replace(' ', '_')}.png", plot_time_series,
+                     df[['date', column]], (column, title, y_label, color)))
+
+    jobs.append(('comparative_growth_since_2010.png', plot_comparative_growth, df[['date'] + numeric_columns], (2010,)))
+
+    yoy_columns = [f"{metric_slug(col)}_yoy_growth" for col in numeric_columns]
+    jobs.append(('yoy_growth_rates.png', plot_yoy_growth, df[['date'] + yoy_columns], ()))
+    jobs.append(('correlation_heatmap.png', plot_correlation_heatmap, correlation_matrix(df), ()))
+    jobs.append(('seasonal_patterns.png', plot_seasonal_patterns, seasonal_patterns(df), ()))
+    return jobs
+
+# Hash of a chart's input data and arguments, used to skip unchanged charts
+def job_hash(plot, data, args):
+    digest = hashlib.sha256(plot.__name__.encode())
+    digest.update(repr(args).encode())
+    digest.update(repr(list(data.columns)).encode())
+    digest.update(pd.util.hash_pandas_object(data, index=True).to_numpy().tobytes())
+    return digest.hexdigest()[:16]
+
+# Render a single chart in a worker process and time it
+def render_chart(plot, data, args, output_dir):
+    set_style()
+    start = time.perf_counter()
+    with span('chart', rows=len(data), chart=plot.__name__):
+        file_path = plot(data, *args, output_dir=output_dir)
+    return file_path, time.perf_counter() - start
+
+def _load_manifest(output_dir):
+    manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path) as f:
+        return json.load(f)
+
+def _save_manifest(output_dir, manifest):
+    with open(os.path.join(output_dir, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+# Render all charts over a process pool, skipping charts whose inputs have not changed
+def render_all(df, output_dir=ASSETS_DIR, workers=None, force=False):
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = _load_manifest(output_dir)
+
+    pending = {}
+    for file_name, plot, data, args in chart_jobs(df):
+        digest = job_hash(plot, data, args)
+        if not force and manifest.get(file_name) == digest and os.path.exists(os.path.join(output_dir, file_name)):
+            print(f"{file_name}: unchanged, skipped")
+            continue
+        pending[file_name] = (digest, plot, data, args)
+
+    timings = {}
+    if pending:
+        try:
+            with span('charts', rows=len(df), rendered=len(pending)), \
+                    ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = {file_name: executor.submit(render_chart, plot, data, args, output_dir)
+                           for file_name, (digest, plot, data, args) in pending.items()}
+                for file_name, future in futures.items():
+                    _, seconds = future.result()
+                    timings[file_name] = seconds
+                    manifest[file_name] = pending[file_name][0]
+                    print(f"{file_name}: rendered in {seconds:.2f}s")
+        finally:
+            # Record whatever rendered so a failed chart does not force the others to re-render
+            _save_manifest(output_dir, manifest)
+
+    return timings
+
+# Render every chart for the current processed dataset
+def main(output_dir=ASSETS_DIR, workers=None, force=False):
+    from metrics_store import load_metrics, segment_frame
+
+    return render_all(segment_frame(load_metrics()), output_dir, workers, force)
+
+if __name__ == "__main__":
+    main()
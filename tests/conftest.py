@@ -0,0 +1,57 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+import pytest
+
+# The pipeline modules are flat scripts imported by name, as the CLI and the dashboard do
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'scripts')))
+
+from metrics_store import SEGMENT_COLUMN, derive_metrics, numeric_columns, sort_frame  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def no_span_log(monkeypatch):
+    # Spans of the code under test are not appended to the project's span log
+    monkeypatch.setenv('PIPELINE_SPAN_LOG', '')
+
+
+def make_metrics(segments=('a', 'b'), months=30, seed=0):
+    """
+    A segmented metrics frame (base and derived columns, as from load_metrics) of
+    steadily growing series without national rows.
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range('2020-01-01', periods=months, freq='MS')
+    frames = []
+    for i, segment in enumerate(segments):
+        growth = rng.normal(0.02, 0.01, size=(months, len(numeric_columns)))
+        values = np.exp(np.log([1000.0 * (i + 1), 5.0, 50.0, 20.0]) + np.cumsum(growth, axis=0))
+        frame = pd.DataFrame(values, columns=numeric_columns)
+        frame['Active Agents'] = frame['Active Agents'].round().astype(np.int64)
+        frame.insert(0, 'date', dates)
+        frame.insert(0, SEGMENT_COLUMN, segment)
+        frames.append(frame)
+    df = sort_frame(pd.concat(frames, ignore_index=True))
+    return pd.concat([df, derive_metrics(df)], axis=1)
+
+
+@pytest.fixture
+def metrics_frame():
+    return make_metrics()
+
+
+def write_raw(df, file_path, extra_rows=()):
+    """
+    Write the base metrics of a metrics frame as a raw feed (month names, thousands
+    separators, a segment column if the frame has one) followed by extra_rows, given as
+    dicts of raw cell strings.
+    """
+    raw = pd.DataFrame({'Year': df['date'].dt.year.astype(str), 'Month': df['date'].dt.strftime('%B')})
+    for col in numeric_columns:
+        raw[col] = df[col].map('{:,}'.format if col == 'Active Agents' else '{:.4f}'.format)
+    if SEGMENT_COLUMN in df.columns:
+        raw.insert(0, SEGMENT_COLUMN, df[SEGMENT_COLUMN])
+    raw = pd.concat([raw, pd.DataFrame(list(extra_rows), columns=raw.columns)], ignore_index=True)
+    raw.to_csv(file_path, index=False)
+    return file_path
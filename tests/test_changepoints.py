@@ -0,0 +1,86 @@
+import numpy as np
+import pandas as pd
+import changepoints
+from changepoints import MIN_SIZE, PENALTY, boundaries, detect_phases, growth_phases, noise_variance
+
+
+def beta_of(series, penalty=PENALTY):
+    # The boundary penalty detect_phases uses for a fully observed series
+    return penalty * noise_variance(series[:, None])[0] * np.log(len(series))
+
+
+def sse(values):
+    return float(((values - values.mean()) ** 2).sum())
+
+
+def optimal_cost(series, beta, min_size=MIN_SIZE):
+    # Exhaustive dynamic programme over every last-phase start, without pruning
+    n = len(series)
+    best = np.full(n + 1, np.inf)
+    best[0] = -beta
+    for t in range(min_size, n + 1):
+        best[t] = min(best[s] + sse(series[s:t]) + beta for s in range(0, t - min_size + 1))
+    return best[n]
+
+
+def labelled_cost(series, labels, beta):
+    phases = np.unique(labels)
+    return sum(sse(series[labels == phase]) for phase in phases) + beta * (len(phases) - 1)
+
+
+def test_pelt_is_optimal():
+    rng = np.random.default_rng(0)
+    for _ in range(5):
+        means = rng.choice([0.0, 0.02, 0.05, -0.01], size=4)
+        series = np.repeat(means, rng.integers(12, 30, size=4))
+        series = series + rng.normal(0, 0.01, size=len(series))
+        labels = detect_phases(series[:, None])[:, 0]
+
+        # Phases are numbered in order, contiguous and at least MIN_SIZE months long
+        assert labels[0] == 0 and np.all(np.diff(labels) >= 0) and np.all(np.diff(labels) <= 1)
+        assert np.bincount(labels).min() >= MIN_SIZE
+        beta = beta_of(series)
+        assert np.isclose(labelled_cost(series, labels, beta), optimal_cost(series, beta))
+
+
+def test_planted_shift():
+    rng = np.random.default_rng(1)
+    growth = np.r_[np.full(40, 0.01), np.full(40, 0.05)] + rng.normal(0, 0.005, size=80)
+    labels = detect_phases(growth[:, None])[:, 0]
+    np.testing.assert_array_equal(labels, np.repeat([0, 1], 40))
+
+    # Steady growth is one phase
+    steady = 0.02 + rng.normal(0, 0.005, size=80)
+    assert not detect_phases(steady[:, None]).any()
+
+
+def test_batches_and_missing_months(monkeypatch):
+    rng = np.random.default_rng(2)
+    growth = rng.normal(0, 0.002, size=(5, 72, 3))
+    growth[..., 36:, 0] += 0.05
+    growth[1, :24] = np.nan
+    growth[2, :, 1] = np.nan
+    expected = detect_phases(growth)
+
+    # Series solved in small batches get the same phases
+    monkeypatch.setattr(changepoints, 'BATCH', 2)
+    np.testing.assert_array_equal(detect_phases(growth), expected)
+    assert np.all(expected[:, 36:, 0] == 1) and np.all(expected[:, :36, 0][~np.isnan(growth[:, :36, 0])] == 0)
+    # A series without observations stays in phase 0
+    assert not expected[2, :, 1].any()
+
+
+def test_growth_phases():
+    dates = pd.date_range('2015-01-01', periods=60, freq='MS')
+    rng = np.random.default_rng(3)
+    growth = np.r_[np.full(30, 0.01), np.full(30, 0.04)] + rng.normal(0, 0.002, size=60)
+    df = pd.DataFrame({'date': dates, 'm': 100 * np.exp(np.cumsum(growth))})
+    phases = growth_phases(df, columns=['m'])
+
+    assert phases.index.get_level_values('phase').tolist() == [1, 2]
+    assert phases['start'].tolist() == [dates[0], dates[30]]
+    assert phases['end'].tolist() == [dates[29], dates[59]]
+    assert phases['months'].sum() == 60
+    assert boundaries(phases).loc[('national', 'm')] == [dates[30]]
+    # Phase growth is annualised from the mean monthly log growth
+    assert phases['annualized_growth_%'].iloc[1] > phases['annualized_growth_%'].iloc[0] * 3
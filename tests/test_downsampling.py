@@ -0,0 +1,128 @@
+import numpy as np
+import pandas as pd
+import pytest
+from downsampling import (FrameLevels, SeriesLevels, downsample_frame, lttb_indices, minmax_indices, select,
+                          union_within)
+
+
+def reference_lttb(x, y, n_out):
+    # Largest-Triangle-Three-Buckets as published (Steinarsson, 2013), one point at a time
+    n = len(x)
+    every = (n - 2) / (n_out - 2)
+    selected, a = [0], 0
+    for i in range(n_out - 2):
+        start, end = int(i * every) + 1, int((i + 1) * every) + 1
+        next_start, next_end = end, min(int((i + 2) * every) + 1, n)
+        if i + 1 < n_out - 2:
+            cx, cy = np.mean(x[next_start:next_end]), np.mean(y[next_start:next_end])
+        else:
+            cx, cy = x[n - 1], y[n - 1]
+        areas = [abs((x[a] - cx) * (y[j] - y[a]) - (x[a] - x[j]) * (cy - y[a])) for j in range(start, end)]
+        a = start + int(np.argmax(areas))
+        selected.append(a)
+    return np.array(selected + [n - 1])
+
+
+@pytest.mark.parametrize('n, n_out', [(1000, 50), (997, 101), (30, 3), (100, 99)])
+def test_lttb_matches_reference(n, n_out):
+    rng = np.random.default_rng(n)
+    x = np.cumsum(rng.uniform(0.5, 1.5, n))
+    y = np.cumsum(rng.normal(size=n))
+    np.testing.assert_array_equal(lttb_indices(x, y, n_out), reference_lttb(x, y, n_out))
+
+
+def test_lttb_small_budgets():
+    y = np.arange(10.0)
+    np.testing.assert_array_equal(lttb_indices(np.arange(10), y, 20), np.arange(10))
+    np.testing.assert_array_equal(lttb_indices(np.arange(10), y, 2), np.arange(10))
+
+
+def test_minmax_keeps_extremes():
+    rng = np.random.default_rng(1)
+    y = rng.normal(size=10_000)
+    y[1234], y[8765] = 50.0, -50.0
+    chosen = minmax_indices(y, 100)
+
+    assert len(chosen) <= 2 * 100 + 2
+    assert chosen[0] == 0 and chosen[-1] == len(y) - 1
+    assert np.all(np.diff(chosen) > 0)
+    assert {1234, 8765} <= set(chosen.tolist())
+    # Every bucket's own minimum and maximum are kept
+    for bucket in np.array_split(np.arange(len(y)), 100)[:3]:
+        assert {bucket[y[bucket].argmin()], bucket[y[bucket].argmax()]} <= set(chosen.tolist())
+
+
+def test_select():
+    x = np.arange(100)
+    y = np.sin(x / 5.0)
+    y[[10, 50]] = np.nan
+
+    for method in ['lttb', 'minmax']:
+        chosen = select(x, y, 20, method)
+        assert len(chosen) <= 20
+        assert not np.isnan(y[chosen]).any()
+    # Budgets too small for buckets keep the ends of the series
+    np.testing.assert_array_equal(select(x, y, 2), [0, 99])
+    np.testing.assert_array_equal(select(x, y, 1, 'minmax'), [0])
+    with pytest.raises(ValueError):
+        select(x, y, 20, 'median')
+
+
+def test_union_within_uses_the_budget():
+    rng = np.random.default_rng(2)
+    x = np.arange(5000)
+    values = {i: np.cumsum(rng.normal(size=len(x))) for i in range(27)}
+    rows = union_within(lambda col, budget: select(x, values[col], budget), list(values), 200)
+
+    # An even split would give each of the 27 columns 7 points; the search fills the budget
+    assert 150 < len(rows) <= 200
+    assert np.all(np.diff(rows) > 0)
+
+
+def test_downsample_frame():
+    rng = np.random.default_rng(3)
+    df = pd.DataFrame({'date': pd.date_range('2000-01-01', periods=20_000, freq='h')})
+    columns = [f"m{i}" for i in range(5)]
+    for col in columns:
+        df[col] = np.cumsum(rng.normal(size=len(df)))
+
+    assert len(downsample_frame(df.iloc[:500], 'date', columns, 1000)) == 500
+    for method in ['lttb', 'minmax']:
+        sampled = downsample_frame(df, 'date', columns, 1000, method)
+        assert 500 < len(sampled) <= 1000
+        assert sampled.index[0] == 0 and sampled.index[-1] == len(df) - 1
+
+
+def test_series_levels():
+    rng = np.random.default_rng(4)
+    y = np.cumsum(rng.normal(size=100_000))
+    y[54_321] = y.max() + 1000
+    levels = SeriesLevels(np.arange(len(y)), y, base_points=500)
+
+    # Coarsest level first, each within its budget, the finest the full series
+    for i, level in enumerate(levels.levels[:-1]):
+        assert len(level) <= 500 * 2 ** i
+    assert len(levels.levels[-1]) == len(y)
+    full = levels.indices(0, len(y), 500)
+    assert len(full) <= 500 and 54_321 in full
+    # A short range is served at full resolution
+    np.testing.assert_array_equal(levels.indices(1000, 1300, 500), np.arange(1000, 1300))
+    # A budget below the coarsest level is reduced further
+    assert len(levels.indices(0, len(y), 100)) <= 100
+
+
+def test_frame_levels():
+    rng = np.random.default_rng(5)
+    df = pd.DataFrame({'date': pd.date_range('2000-01-01', periods=50_000, freq='h')})
+    columns = ['a', 'b', 'c']
+    for col in columns:
+        df[col] = np.cumsum(rng.normal(size=len(df)))
+    levels = FrameLevels(df, columns, base_points=200)
+
+    start, end = df['date'].iloc[1000], df['date'].iloc[40_000]
+    frame = levels.frame(columns, start, end, max_points=400)
+    assert len(frame) <= 400
+    assert frame['date'].min() >= start and frame['date'].max() <= end
+    # Both ends of a short range are included in full
+    short = levels.frame(columns, df['date'].iloc[100], df['date'].iloc[299], max_points=400)
+    pd.testing.assert_frame_equal(short, df.iloc[100:300])
@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+import pytest
+from conftest import make_metrics
+from metrics_store import numeric_columns, segment_frame
+from forecasting import (backtest, backtest_summary, fit_regression, fit_seasonal_baseline, predict_regression,
+                         predict_seasonal_baseline)
+
+
+def test_batched_backtest_matches_per_cutoff_fits():
+    df = segment_frame(make_metrics(months=84))
+    horizon = 6
+    results = backtest(df, horizon=horizon)
+    log_values = np.log(df[numeric_columns].to_numpy(dtype=float))
+    months = df['date'].dt.month.to_numpy()
+
+    cutoffs = results['cutoff'].unique()
+    # Every cutoff with a full regression window and a full horizon after it
+    assert len(cutoffs) == 84 - 60 - horizon + 1
+    for cutoff in cutoffs[::5]:
+        c = int(np.flatnonzero(df['date'] == cutoff)[0]) + 1
+        future_months = months[c:c + horizon]
+        for i, metric in enumerate(numeric_columns):
+            rows = results[(results['cutoff'] == cutoff) & (results['metric'] == metric)]
+            baseline = predict_seasonal_baseline(fit_seasonal_baseline(log_values[:c, i]), horizon)
+            regression = predict_regression(fit_regression(log_values[:c, i], months[:c]), horizon, future_months)
+            for model, expected in [('seasonal_baseline', baseline), ('regression', regression)]:
+                got = rows[rows['model'] == model].sort_values('horizon')
+                np.testing.assert_allclose(got['forecast'], np.exp(expected), rtol=1e-6)
+                np.testing.assert_allclose(got['actual'], df[metric].to_numpy()[c:c + horizon])
+
+
+def test_backtest_cutoffs_and_summary():
+    df = segment_frame(make_metrics(months=84))
+    # Cutoffs are matched to the last month on or before them, and cutoffs without room are dropped
+    results = backtest(df, cutoffs=['2025-03-15', '2020-06-01', '2026-12-01'], horizon=3)
+    assert results['cutoff'].unique().tolist() == [pd.Timestamp('2025-03-01')]
+
+    summary = backtest_summary(results)
+    assert list(summary.columns) == [1, 2, 3]
+    assert summary.loc[('regression', numeric_columns[0]), 1] == pytest.approx(
+        results.query("model == 'regression' and horizon == 1 and metric == @numeric_columns[0]")['ape'].mean())
@@ -0,0 +1,102 @@
+import functools
+import glob
+import numpy as np
+import pandas as pd
+import pytest
+import ingest as ingest_module
+import metrics_store
+from conftest import make_metrics, write_raw
+from ingest import ingest, load_state
+from metrics_store import sort_frame
+from sqlite_store import MetricsDB
+from storage import read_processed
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    # Every output of an ingest under tmp_path, including the derived metrics
+    def run(raw_path, name='store'):
+        metrics_dir = str(tmp_path / f'{name}_metrics')
+        monkeypatch.setattr(ingest_module, 'build_metrics',
+                            functools.partial(metrics_store.build_metrics, metrics_dir=metrics_dir))
+        monkeypatch.setattr(ingest_module, 'extend_metrics',
+                            functools.partial(metrics_store.extend_metrics, metrics_dir=metrics_dir))
+        paths = {
+            'processed_path': str(tmp_path / f'{name}.csv'),
+            'state_path': str(tmp_path / f'{name}_state.json'),
+            'dataset_dir': str(tmp_path / f'{name}_dataset'),
+            'db_path': str(tmp_path / f'{name}.sqlite'),
+            'quarantine_path': str(tmp_path / f'{name}_quarantine.csv'),
+        }
+        return ingest(str(raw_path), **paths), paths
+    return run
+
+
+def test_quarantined_rows_are_quarantined_once(tmp_path, store):
+    df = make_metrics(months=30)
+    bad = [
+        {'segment': 'a', 'Year': '2021', 'Month': 'Smarch', 'Active Agents': '1,000',
+         'Total Registered Mobile Money Accounts (Millions)': '1', 'Total Agent Cash in Cash Out (Volume Million)': '1',
+         'Total Agent Cash in Cash Out (Value KSh billions)': '1'},
+        {'segment': 'b', 'Year': '2022', 'Month': 'July', 'Active Agents': '-5',
+         'Total Registered Mobile Money Accounts (Millions)': '1', 'Total Agent Cash in Cash Out (Volume Million)': '1',
+         'Total Agent Cash in Cash Out (Value KSh billions)': '1'},
+    ]
+    raw_path = write_raw(df[df['date'] < '2022-01-01'], tmp_path / 'raw.csv', bad)
+    new, paths = store(raw_path)
+    assert len(new) == 2 * 24
+    assert len(pd.read_csv(paths['quarantine_path'])) == 2
+
+    # Later runs, with and without new months, skip the rows already quarantined
+    write_raw(df, raw_path, bad)
+    new, _ = store(raw_path)
+    assert len(new) == 2 * 6
+    assert store(raw_path)[0].empty
+    quarantined = pd.read_csv(paths['quarantine_path'])
+    assert quarantined['Month'].tolist() == ['Smarch', 'July']
+    assert len(load_state(paths['state_path'])['quarantined']) == 2
+
+    # A corrected row is new content and is ingested
+    fixed = dict(bad[1], **{'Active Agents': '5'})
+    write_raw(df, raw_path, [bad[0], fixed])
+    new, _ = store(raw_path)
+    assert len(new) == 1 and new['date'].iloc[0] == pd.Timestamp('2022-07-01')
+    assert len(pd.read_csv(paths['quarantine_path'])) == 2
+
+
+def test_incremental_ingest_matches_full_build(tmp_path, store):
+    df = make_metrics(months=36)
+    raw_path = write_raw(df, tmp_path / 'full.csv')
+    _, full = store(raw_path, 'full')
+
+    # The same feed arriving in three deliveries
+    start = df['date'].min()
+    for end in ['2021-01-01', '2022-03-01', '2023-01-01']:
+        write_raw(df[df['date'] < end], tmp_path / 'partial.csv')
+        new, incremental = store(tmp_path / 'partial.csv', 'incremental')
+        # Only the months after the previous delivery are parsed and appended
+        assert new['date'].min() == start and len(new) == 2 * new['date'].nunique()
+        start = pd.Timestamp(end)
+    assert store(tmp_path / 'partial.csv', 'incremental')[0].empty
+
+    # The processed CSV is append-only, so a segmented feed's rows are in delivery order
+    def processed(paths):
+        return sort_frame(pd.read_csv(paths['processed_path'], parse_dates=['date']))
+
+    pd.testing.assert_frame_equal(processed(incremental), processed(full))
+    pd.testing.assert_frame_equal(sort_frame(read_processed(dataset_dir=incremental['dataset_dir'])),
+                                  sort_frame(read_processed(dataset_dir=full['dataset_dir'])))
+    state, expected = load_state(incremental['state_path']), load_state(full['state_path'])
+    for key in ['first_date', 'high_water_mark', 'rows']:
+        assert state[key] == expected[key]
+    np.testing.assert_allclose(state['tail'], expected['tail'])
+    for col, aggregates in expected['aggregates'].items():
+        assert state['aggregates'][col] == pytest.approx(aggregates)
+    # Metrics derived month by month with their trailing context equal a full derivation
+    def derived(name):
+        return sort_frame(pd.read_parquet(glob.glob(str(tmp_path / f'{name}_metrics' / '*.parquet'))[0]))
+
+    pd.testing.assert_frame_equal(derived('incremental'), derived('full'), check_dtype=False)
+    with MetricsDB(incremental['db_path']) as a, MetricsDB(full['db_path']) as b:
+        pd.testing.assert_frame_equal(a.metrics(), b.metrics())
+        pd.testing.assert_frame_equal(a.summaries(), b.summaries())
@@ -0,0 +1,68 @@
+import json
+import os
+import pstats
+import threading
+import tracemalloc
+import instrumentation
+from instrumentation import profile_run, read_spans, span, write_span
+
+
+def test_spans_in_other_threads_keep_the_peak():
+    records = {}
+
+    def other():
+        with span('other') as s:
+            pass
+        records['other'] = s.record
+
+    tracemalloc.start()
+    try:
+        with span('main') as s:
+            block = bytearray(20 * 2 ** 20)
+            del block
+            # A span starting in another thread would have reset the process-wide peak
+            thread = threading.Thread(target=other)
+            thread.start()
+            thread.join()
+    finally:
+        tracemalloc.stop()
+    assert s.record['peak_mb'] >= 20
+    assert records['other']['peak_mb'] is None
+
+
+def test_profile_run_profiles_threads_and_restores_the_peak_thread(tmp_path):
+    records = {}
+
+    def worker_step():
+        with span('worker') as s:
+            pass
+        records['worker'] = s.record
+
+    with profile_run(output_dir=str(tmp_path)):
+        with span('main') as main:
+            thread = threading.Thread(target=worker_step)
+            thread.start()
+            thread.join()
+        assert instrumentation._peak_thread == threading.get_ident()
+    assert instrumentation._peak_thread == threading.main_thread().ident
+
+    # Only the profiled thread records peaks, and the worker's profile is part of the dump
+    assert main.record['peak_mb'] is not None and records['worker']['peak_mb'] is None
+    profile_path = [os.path.join(tmp_path, name) for name in os.listdir(tmp_path) if name.endswith('.prof')][0]
+    functions = {name for _, _, name in pstats.Stats(profile_path).stats}
+    assert 'worker_step' in functions
+
+
+def test_span_log_rotation(tmp_path, monkeypatch):
+    log_path = str(tmp_path / 'spans.jsonl')
+    monkeypatch.setattr(instrumentation, 'SPAN_LOG_MAX_BYTES', 1000)
+    for i in range(30):
+        write_span({'span': 'step', 'start': '2026-01-01T00:00:00', 'wall_s': 0.1, 'i': i}, log_path)
+
+    # The log and its one rotated copy stay bounded and are read back in order
+    assert os.path.getsize(log_path) <= 1000 and os.path.getsize(f"{log_path}.1") <= 1000
+    assert not os.path.exists(f"{log_path}.2")
+    spans = read_spans(log_path)
+    assert spans['i'].tolist() == list(range(30 - len(spans), 30))
+    with open(log_path) as f:
+        assert json.loads(f.readlines()[-1])['i'] == 29
@@ -0,0 +1,69 @@
+import functools
+import gzip
+import http.client
+import json
+import threading
+import pytest
+import metrics_api
+from metrics_store import SEGMENT_COLUMN, load_metrics, numeric_columns
+from metrics_api import MetricsService, make_server
+
+
+@pytest.fixture
+def server(metrics_frame, tmp_path, monkeypatch):
+    source_path = tmp_path / 'cleaned.csv'
+    metrics_frame[[SEGMENT_COLUMN, 'date'] + numeric_columns].to_csv(source_path, index=False)
+    # The derived metrics are stored next to the test data rather than in data/processed
+    monkeypatch.setattr(metrics_api, 'load_metrics', functools.partial(load_metrics, metrics_dir=str(tmp_path)))
+
+    server = make_server(port=0, service=MetricsService(str(source_path)))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def get(server, path, **headers):
+    conn = http.client.HTTPConnection(*server.server_address)
+    try:
+        conn.request('GET', path, headers=headers)
+        response = conn.getresponse()
+        return response.status, dict(response.getheaders()), response.read()
+    finally:
+        conn.close()
+
+
+def test_gzip_and_identity_etags(server):
+    status, identity, body = get(server, '/metrics?segment=a')
+    assert status == 200 and 'Content-Encoding' not in identity
+    status, gzipped, compressed = get(server, '/metrics?segment=a', **{'Accept-Encoding': 'gzip'})
+    assert status == 200 and gzipped['Content-Encoding'] == 'gzip'
+    assert json.loads(gzip.decompress(compressed)) == json.loads(body)
+
+    # The two representations have their own tags, and each only revalidates itself
+    assert identity['ETag'] != gzipped['ETag']
+    assert identity['Vary'] == gzipped['Vary'] == 'Accept-Encoding'
+    status, _, _ = get(server, '/metrics?segment=a', **{'If-None-Match': identity['ETag']})
+    assert status == 304
+    status, _, _ = get(server, '/metrics?segment=a', **{'If-None-Match': identity['ETag'], 'Accept-Encoding': 'gzip'})
+    assert status == 200
+
+
+def test_conditional_requests(server):
+    _, headers, _ = get(server, '/segments')
+    status, not_modified, body = get(server, '/segments', **{'If-None-Match': f"W/{headers['ETag']}, \"other\""})
+    assert status == 304 and body == b''
+    assert not_modified['ETag'] == headers['ETag'] and not_modified['Vary'] == 'Accept-Encoding'
+    # Another request has another tag
+    status, _, _ = get(server, '/segments?segment=a', **{'If-None-Match': headers['ETag']})
+    assert status == 200
+
+
+def test_errors(server):
+    assert get(server, '/missing')[0] == 404
+    assert get(server, '/metrics?segment=nowhere')[0] == 404
+    for max_points in ['0', '-3', 'many']:
+        status, _, body = get(server, f'/metrics?max_points={max_points}')
+        assert status == 400 and b'max_points' in body
+    assert get(server, '/metrics?max_points=1')[0] == 200
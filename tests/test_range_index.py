@@ -0,0 +1,40 @@
+import numpy as np
+import pandas as pd
+import pytest
+from metrics_store import numeric_columns, segment_frame
+from range_index import RangeIndex
+
+
+@pytest.fixture
+def national(metrics_frame):
+    df = segment_frame(metrics_frame)[['date'] + numeric_columns]
+    df[numeric_columns] = df[numeric_columns].astype(float)
+    # Gaps of different lengths in different metrics, and one metric never observed late on
+    df.loc[[3, 4, 11], numeric_columns[1]] = np.nan
+    df.loc[[7], numeric_columns[2]] = np.nan
+    df.loc[20:, numeric_columns[3]] = np.nan
+    return df
+
+
+def test_windows_match_direct_slicing(national):
+    index = RangeIndex(national.sample(frac=1, random_state=0))
+    windows = [('2020-01-01', '2022-06-01'), ('2020-03-15', '2021-02-01'), ('2021-06-01', '2022-12-01'),
+               ('2020-05-01', '2020-07-01'), ('2020-02-01', '2020-02-01'), ('2019-01-01', '2019-12-01')]
+    for start, end in windows:
+        direct = national[national['date'].between(start, end)]
+        pd.testing.assert_frame_equal(index.slice(start, end).reset_index(drop=True), direct.reset_index(drop=True))
+
+        # Means and correlations skip missing values as pandas does
+        pd.testing.assert_series_equal(index.mean(start, end), direct[numeric_columns].mean(), check_names=False)
+        pd.testing.assert_frame_equal(index.correlation(start, end), direct[numeric_columns].corr(),
+                                      check_names=False, atol=1e-9)
+
+
+def test_cached_results(national):
+    index = RangeIndex(national)
+    assert index.mean('2020-01-01', '2021-01-01') is index.mean('2020-01-01', '2021-01-31')
+    deltas = index.deltas('2020-01-01', '2020-12-01')
+    np.testing.assert_allclose(deltas[numeric_columns[0]],
+                               national[numeric_columns[0]].iloc[11] - national[numeric_columns[0]].iloc[0])
+    with pytest.raises(ValueError):
+        index.get('2020-01-01', '2020-12-01', 'median')
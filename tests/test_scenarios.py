@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+import pytest
+from conftest import make_metrics
+from metrics_store import numeric_columns, segment_frame
+from scenarios import (FLOW_COLUMNS, PERCENTILES, annual_frame, fan_frame, fit_scenario_model, scenario_summary,
+                       simulate)
+
+
+@pytest.fixture
+def history():
+    # Ends in June, so the first simulated year is completed from the history
+    return segment_frame(make_metrics(months=66))
+
+
+def test_paths_do_not_depend_on_the_chunk_size(history):
+    model = fit_scenario_model(history)
+    paths, dates = simulate(model, horizon=18, paths=500, seed=3)
+    assert paths.shape == (500, 18, len(numeric_columns)) and paths.dtype == np.float32
+    assert dates[0] == pd.Timestamp('2025-07-01')
+    np.testing.assert_array_equal(simulate(model, horizon=18, paths=500, seed=3, chunk=64)[0], paths)
+
+    # Without residuals every path is the drift and the seasonal factors from the last level
+    calm, _ = simulate(model, horizon=18, paths=4, volatility=0.0)
+    steps = np.arange(1, 19)[:, None]
+    expected = np.exp(model['level'] + steps * model['drift'] + model['log_factors'][dates.month - 1])
+    np.testing.assert_allclose(calm, np.broadcast_to(expected, calm.shape), rtol=1e-5)
+
+
+def test_fan_frame_matches_percentiles(history):
+    model = fit_scenario_model(history)
+    paths, dates = simulate(model, horizon=12, paths=1000)
+    fan = fan_frame(paths, dates, model['columns'])
+
+    assert fan.shape == (12, len(numeric_columns) * len(PERCENTILES))
+    for i, col in enumerate(model['columns']):
+        for q in PERCENTILES:
+            np.testing.assert_allclose(fan[(col, f'p{q}')], np.percentile(paths[:, :, i], q, axis=0), rtol=1e-6)
+        # Bands are ordered and widen with the horizon
+        bands = fan[col].to_numpy()
+        assert np.all(np.diff(bands, axis=1) >= 0)
+        assert bands[-1, -1] - bands[-1, 0] > bands[0, -1] - bands[0, 0]
+
+
+def test_annual_frame_matches_percentiles(history):
+    model = fit_scenario_model(history)
+    paths, dates = simulate(model, horizon=27, paths=1000)
+    annual = annual_frame(paths, dates, model['columns'], history=history)
+
+    # 2025 is completed from January to June of the history; 2027 is cut off in September
+    assert sorted(annual.index.get_level_values('year').unique()) == [2025, 2026]
+    flow, stock = FLOW_COLUMNS[0], numeric_columns[0]
+    i, j = model['columns'].index(flow), model['columns'].index(stock)
+    observed = history.loc[history['date'].dt.year == 2025, flow].sum()
+    totals = paths[:, :6, i].sum(axis=1, dtype=np.float64) + observed
+    np.testing.assert_allclose(annual.loc[(flow, 2025)], np.percentile(totals, PERCENTILES), rtol=1e-6)
+    december = paths[:, list(dates).index(pd.Timestamp('2026-12-01')), j]
+    np.testing.assert_allclose(annual.loc[(stock, 2026)], np.percentile(december, PERCENTILES), rtol=1e-6)
+
+    # Without the history the partial first year is left out
+    assert annual_frame(paths, dates, model['columns']).index.get_level_values('year').unique().tolist() == [2026]
+
+
+def test_scenarios_shift_the_quantiles(history):
+    summary = scenario_summary(history, scenarios=['slowdown', 'baseline', 'acceleration', 'volatile'],
+                               horizon=30, paths=2000)
+    agents = summary.xs((numeric_columns[0], 2026), level=['metric', 'year'])
+    assert agents.loc['slowdown', 'p50'] < agents.loc['baseline', 'p50'] < agents.loc['acceleration', 'p50']
+    spread = agents['p95'] / agents['p5']
+    assert spread['volatile'] > spread['baseline']
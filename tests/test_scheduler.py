@@ -0,0 +1,78 @@
+import os
+import subprocess
+import sys
+import scheduler
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+SCRIPTS_DIR = os.path.abspath(os.path.join(TESTS_DIR, '..', 'scripts'))
+
+
+def test_only_the_charts_stage_imports_matplotlib(tmp_path):
+    # The excel and charts stages run in parallel threads, and matplotlib.use() in the charts
+    # stage fails on a pyplot that another thread is still importing. Run what every other
+    # stage imports, and the excel stage's report, in a fresh interpreter
+    code = f"""
+import functools, sys
+sys.path[:0] = {[SCRIPTS_DIR, TESTS_DIR]!r}
+import automated_analysis, changepoints, dashboard_cache, delivery, downsampling, forecasting
+import ingest, range_index, scenarios, scheduler, sqlite_store
+from conftest import make_metrics
+automated_analysis.load_models = functools.partial(forecasting.load_models, models_dir={str(tmp_path)!r}, n_jobs=1)
+automated_analysis.write_analysis_report(make_metrics(), output_dir={str(tmp_path)!r})
+assert 'matplotlib' not in sys.modules
+"""
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True,
+                            env={**os.environ, 'PIPELINE_SPAN_LOG': ''})
+    assert result.returncode == 0, result.stderr
+
+
+def test_skip_and_resume(tmp_path, monkeypatch):
+    raw_path = tmp_path / 'raw.csv'
+    raw_path.write_text('v1')
+    calls, failing = [], set()
+
+    def stage(name):
+        def run(options, results):
+            calls.append(name)
+            if name in failing:
+                raise RuntimeError(f"{name} broke")
+            # Each output depends on the raw feed, so a new feed changes every downstream input
+            path = tmp_path / f'{name}.out'
+            path.write_text(raw_path.read_text())
+            return {'paths': [str(path)], 'raw': raw_path.read_text()}
+        return run
+
+    stages = {name: (deps, stage(name)) for name, (deps, _) in scheduler.STAGES.items()}
+    monkeypatch.setattr(scheduler, 'STAGES', stages)
+    state_path = str(tmp_path / 'state.json')
+
+    def run(**kwargs):
+        calls.clear()
+        return scheduler.run_pipeline(raw_path=str(raw_path), report_dir=str(tmp_path), state_path=state_path,
+                                      **kwargs)
+
+    status = run()
+    assert calls and set(calls) == set(scheduler.STAGES) - {'email'}
+    assert status['email'] == 'skipped'
+    # Nothing changed, so nothing runs
+    assert set(run().values()) == {'skipped'} and calls == []
+
+    # A new feed reruns everything; the failed stage blocks its dependents but not its siblings
+    raw_path.write_text('v2')
+    failing.add('excel')
+    status = run(recipients=['ops@example.com'])
+    assert status['excel'] == 'failed' and status['email'] == 'blocked' and status['warm'] == 'done'
+    assert scheduler.load_run_state(state_path)['excel']['status'] == 'failed'
+
+    # The next run resumes from the failed stage
+    failing.clear()
+    status = run(recipients=['ops@example.com'])
+    assert sorted(calls) == ['email', 'excel']
+    assert status['forecast'] == 'skipped' and status['email'] == 'done'
+
+    # A stage whose output file is gone reruns, and forcing a stage reruns everything downstream of it
+    os.remove(tmp_path / 'charts.out')
+    run(recipients=['ops@example.com'])
+    assert calls == ['charts']
+    run(recipients=['ops@example.com'], force=['forecast'])
+    assert sorted(calls) == ['email', 'excel', 'forecast', 'warm']
@@ -0,0 +1,86 @@
+import numpy as np
+import pandas as pd
+import pytest
+from spectral import (cross_correlation, dominant_periods, lead_lag_table, monthly_blocks, periodogram,
+                      seasonal_share)
+
+
+def test_cross_correlation_matches_pandas():
+    rng = np.random.default_rng(0)
+    values = rng.normal(size=(60, 3))
+    values[:5, 1] = np.nan
+    values[[20, 33], 2] = np.nan
+    values[:, 2] += 0.5 * np.roll(values[:, 0], 2)
+    frame = pd.DataFrame(values)
+    max_lag = 10
+
+    corr = cross_correlation(values, max_lag=max_lag, min_periods=12)
+    assert corr.shape == (3, 3, 2 * max_lag + 1)
+    for i in range(3):
+        for j in range(3):
+            for k in range(-max_lag, max_lag + 1):
+                expected = frame[i].corr(frame[j].shift(-k), min_periods=12)
+                assert corr[i, j, max_lag + k] == pytest.approx(expected, abs=1e-9, nan_ok=True)
+
+
+def test_cross_correlation_min_periods_and_batches():
+    rng = np.random.default_rng(1)
+    values = rng.normal(size=(2, 20, 2))
+    corr = cross_correlation(values, max_lag=15, min_periods=10)
+
+    # Lags leaving fewer than min_periods overlapping months are NaN
+    assert np.isnan(corr[..., :5]).all() and np.isnan(corr[..., -5:]).all()
+    assert not np.isnan(corr[..., 5:-5]).any()
+    # Each block of a batch is correlated on its own
+    np.testing.assert_allclose(corr[1], cross_correlation(values[1], max_lag=15, min_periods=10))
+
+
+def test_lead_lag_table_finds_the_lead():
+    rng = np.random.default_rng(2)
+    leader = rng.normal(size=120)
+    df = pd.DataFrame({
+        'date': pd.date_range('2010-01-01', periods=120, freq='MS'),
+        'leader': leader,
+        'follower': np.r_[rng.normal(size=3), leader[:-3]] + 0.1 * rng.normal(size=120),
+    })
+    table = lead_lag_table(df, max_lag=6, columns=['leader', 'follower'], transform='level')
+
+    row = table.loc[('national', 'leader', 'follower')]
+    assert row['best_lag'] == 3
+    assert row['best_corr'] > 0.9
+    assert abs(row['lag0_corr']) < 0.3
+
+
+def test_periodogram_and_seasonal_share():
+    months = np.arange(120)
+    seasonal = np.sin(2 * np.pi * months / 12) + 0.5 * np.sin(2 * np.pi * months / 4)
+    noise = np.random.default_rng(3).normal(size=120)
+    periods, power = periodogram(np.column_stack([seasonal, noise]))
+
+    assert len(periods) == 60 and power.shape == (60, 2)
+    assert periods[power[:, 0].argmax()] == pytest.approx(12)
+    share = seasonal_share(periods, power)
+    assert share[0] > 0.95
+    # White noise spreads its power evenly, so only the bins near the harmonics count
+    assert share[1] < 0.5
+
+
+def test_monthly_blocks_and_dominant_periods():
+    dates = pd.date_range('2010-01-01', periods=96, freq='MS')
+    months = np.arange(96)
+    growth = 0.02 + 0.01 * np.sin(2 * np.pi * months / 12)
+    level = 100 * np.exp(np.cumsum(growth))
+    df = pd.DataFrame({
+        'segment': np.repeat(['a', 'b'], [96, 60]),
+        'date': np.r_[dates, dates[36:]],
+        'm': np.r_[level, level[36:]],
+    })
+
+    names, block_dates, values = monthly_blocks(df, ['m'])
+    assert list(names) == ['a', 'b']
+    assert values.shape == (2, 96, 1)
+    assert np.isnan(values[1, :36]).all() and not np.isnan(values[1, 36:]).any()
+
+    periods = dominant_periods(df, top=2, columns=['m'])
+    assert periods.loc[('a', 'm', 1), 'period_months'] == pytest.approx(12)
+    assert periods.loc[('a', 'm', 1), 'seasonal_share'] > 0.9
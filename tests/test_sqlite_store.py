@@ -0,0 +1,132 @@
+import sqlite3
+import numpy as np
+import pandas as pd
+import pytest
+import sqlite_store
+from metrics_store import NATIONAL, SEGMENT_COLUMN, data_version, derived_columns, numeric_columns, segment_frame
+from sqlite_store import TABLE_COLUMNS, MetricsDB, stored_version, sync_store, update_store, write_store
+from summary import summary_history
+
+
+def test_metrics_round_trip(metrics_frame, tmp_path):
+    db_path = str(tmp_path / 'metrics.sqlite')
+    write_store(metrics_frame, 'v1', db_path)
+
+    with MetricsDB(db_path) as db:
+        assert db.version() == 'v1'
+        # The segment totals are stored as the national series
+        assert db.segments() == [NATIONAL, 'a', 'b']
+        stored = db.metrics()
+
+    columns = numeric_columns + derived_columns()
+    assert list(stored.columns) == [SEGMENT_COLUMN, 'date'] + columns
+    for segment in ['a', 'b', NATIONAL]:
+        expected = segment_frame(metrics_frame, segment)[['date'] + columns]
+        actual = stored[stored[SEGMENT_COLUMN] == segment].drop(columns=SEGMENT_COLUMN).reset_index(drop=True)
+        pd.testing.assert_frame_equal(actual, expected, check_dtype=False)
+
+
+def test_metrics_filters(metrics_frame, tmp_path):
+    db_path = str(tmp_path / 'metrics.sqlite')
+    write_store(metrics_frame, 'v1', db_path)
+    column = derived_columns()[0]
+
+    with MetricsDB(db_path) as db:
+        rows = db.metrics(['Active Agents', column], start='2021-02', end='2021-06-01', segments='b')
+        with pytest.raises(KeyError):
+            db.metrics(['Not a metric'])
+
+    # Both ends of the date range are inclusive
+    expected = metrics_frame[(metrics_frame[SEGMENT_COLUMN] == 'b')
+                             & metrics_frame['date'].between('2021-02-01', '2021-06-01')]
+    assert list(rows.columns) == [SEGMENT_COLUMN, 'date', 'Active Agents', column]
+    assert rows['date'].tolist() == expected['date'].tolist()
+    np.testing.assert_array_equal(rows['Active Agents'], expected['Active Agents'])
+    np.testing.assert_allclose(rows[column], expected[column])
+
+
+def test_summaries(metrics_frame, tmp_path):
+    db_path = str(tmp_path / 'metrics.sqlite')
+    write_store(metrics_frame, 'v1', db_path)
+    metric = numeric_columns[2]
+
+    with MetricsDB(db_path) as db:
+        rows = db.summaries(start='2021-12-01', end='2021-12-01', segments=['a'], metrics=metric, measures=['YoY'])
+        with pytest.raises(KeyError):
+            db.summaries(measures=['WoW'])
+
+    assert list(rows.columns) == [SEGMENT_COLUMN, 'date', 'metric', 'Current Value', 'YoY Change', 'YoY %']
+    assert len(rows) == 1
+    expected = summary_history(metrics_frame).loc[(pd.Timestamp('2021-12-01'), 'a', metric)]
+    for col in ['Current Value', 'YoY Change', 'YoY %']:
+        assert rows[col].iloc[0] == pytest.approx(expected[col])
+
+
+def test_update_store_matches_full_build(metrics_frame, tmp_path):
+    since = pd.Timestamp('2022-04-01')
+    updated, rebuilt = str(tmp_path / 'updated.sqlite'), str(tmp_path / 'rebuilt.sqlite')
+    write_store(metrics_frame[metrics_frame['date'] < since], 'v1', updated)
+    new = update_store(metrics_frame, since, 'v1', 'v2', updated)
+    write_store(metrics_frame, 'v2', rebuilt)
+
+    # Only the new months of every segment (and the national totals) are upserted
+    assert len(new) == 3 * 3
+    with MetricsDB(updated) as a, MetricsDB(rebuilt) as b:
+        assert a.version() == b.version() == 'v2'
+        pd.testing.assert_frame_equal(a.metrics(), b.metrics())
+        pd.testing.assert_frame_equal(a.summaries(), b.summaries())
+
+
+def test_update_store_rebuilds_another_version(metrics_frame, tmp_path):
+    db_path = str(tmp_path / 'metrics.sqlite')
+    write_store(metrics_frame.iloc[:10], 'v0', db_path)
+
+    # The database is not at the version the update starts from, so every row is rewritten
+    stored = update_store(metrics_frame, '2022-04-01', 'v1', 'v2', db_path)
+    assert len(stored) == len(metrics_frame) + metrics_frame['date'].nunique()
+    with MetricsDB(db_path) as db:
+        assert db.version() == 'v2'
+        assert len(db.metrics()) == len(stored)
+
+
+def test_failed_write_keeps_the_database(metrics_frame, tmp_path, monkeypatch):
+    db_path = str(tmp_path / 'metrics.sqlite')
+    write_store(metrics_frame, 'v1', db_path)
+
+    def fail(*args):
+        raise RuntimeError("insert failed")
+
+    monkeypatch.setattr(sqlite_store, '_upsert', fail)
+    with pytest.raises(RuntimeError):
+        write_store(metrics_frame, 'v2', db_path)
+
+    # The dropped indexes are rolled back with the deleted rows
+    conn = sqlite3.connect(db_path)
+    try:
+        indexes = {name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    finally:
+        conn.close()
+    assert indexes >= {f"{table}_date" for table in list(TABLE_COLUMNS) + ['summaries']}
+    with MetricsDB(db_path) as db:
+        assert db.version() == 'v1'
+        assert len(db.metrics()) == len(metrics_frame) + metrics_frame['date'].nunique()
+
+
+def test_sync_store_skips_current_version(metrics_frame, tmp_path, monkeypatch):
+    source_path = tmp_path / 'cleaned.csv'
+    metrics_frame[[SEGMENT_COLUMN, 'date'] + numeric_columns].to_csv(source_path, index=False)
+    db_path = str(tmp_path / 'metrics.sqlite')
+    write_store(metrics_frame, data_version(str(source_path)), db_path)
+
+    def rebuild(*args, **kwargs):
+        raise AssertionError("the database is already current")
+
+    monkeypatch.setattr(sqlite_store, 'write_store', rebuild)
+    assert sync_store(str(source_path), db_path) == db_path
+    assert stored_version(db_path) == data_version(str(source_path))
+
+
+def test_missing_database(tmp_path):
+    assert stored_version(str(tmp_path / 'missing.sqlite')) is None
+    with pytest.raises(FileNotFoundError):
+        MetricsDB(str(tmp_path / 'missing.sqlite'))
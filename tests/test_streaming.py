@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+import pytest
+from streaming import MonthlyAggregator, aggregate_stream
+
+
+def test_aggregate_stream_matches_pandas(tmp_path):
+    rng = np.random.default_rng(0)
+    n = 5000
+    records = pd.DataFrame({
+        'date': pd.Timestamp('2021-01-01') + pd.to_timedelta(rng.integers(0, 120, size=n), unit='D'),
+        'agent_id': rng.integers(0, 300, size=n),
+        'amount': rng.uniform(10, 1000, size=n).round(2),
+        'account_id': rng.integers(0, 2000, size=n),
+    }).sort_values('date')
+    file_path = str(tmp_path / 'transactions.csv')
+    records.to_csv(file_path, index=False)
+    df, stats = aggregate_stream(file_path, batch_rows=700, sorted_input=True)
+
+    month = records['date'].dt.to_period('M')
+    expected = records.groupby(month).agg(agents=('agent_id', 'nunique'), accounts=('account_id', 'nunique'),
+                                          transactions=('amount', 'size'), value=('amount', 'sum'))
+    assert stats['rows'] == n and stats['batches'] == 8
+    assert df['year_month'].tolist() == expected.index.strftime('%Y-%m').tolist()
+    np.testing.assert_array_equal(df['Active Agents'], expected['agents'])
+    np.testing.assert_allclose(df['Total Registered Mobile Money Accounts (Millions)'], expected['accounts'] / 1e6)
+    np.testing.assert_allclose(df['Total Agent Cash in Cash Out (Volume Million)'], expected['transactions'] / 1e6)
+    np.testing.assert_allclose(df['Total Agent Cash in Cash Out (Value KSh billions)'], expected['value'] / 1e9)
+
+
+def test_month_without_agent_ids():
+    aggregator = MonthlyAggregator()
+    months = np.array(['2021-01', '2021-02', '2021-02'], dtype='datetime64[M]')
+    # Every February row lacks an agent id, but its accounts still count
+    aggregator.add(months, np.array([1.0, np.nan, np.nan]), np.ones(3), np.array([5.0, 7.0, 9.0]),
+                   account_ids=np.array([10, 11, 12]))
+    aggregator.close()
+    df = aggregator.result()
+
+    assert df['Active Agents'].tolist() == [1, 0]
+    assert df['Total Registered Mobile Money Accounts (Millions)'].tolist() == pytest.approx([1e-6, 2e-6])
+    assert df['Total Agent Cash in Cash Out (Value KSh billions)'].tolist() == pytest.approx([5e-9, 0.0])
@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+import pytest
+from conftest import make_metrics
+from metrics_store import SEGMENT_COLUMN, numeric_columns
+from summary import MEASURES, latest_summary, summary_as_of
+
+
+def direct_summary(df, date, segment, metric):
+    # The summary row of one month looked up date by date, without the monthly calendar
+    values = df[df[SEGMENT_COLUMN] == segment].set_index('date')[metric]
+    date = pd.Timestamp(date)
+    bases = {'MoM': date - pd.DateOffset(months=1), 'QoQ': date - pd.DateOffset(months=3),
+             'YoY': date - pd.DateOffset(months=12), 'YTD': pd.Timestamp(date.year - 1, 12, 1)}
+    current = values[date]
+    row = {'Current Value': current}
+    for measure in MEASURES:
+        base = values.get(bases[measure], np.nan)
+        row[f'{measure} Change'] = current - base
+        row[f'{measure} %'] = 0.0 if base == 0 else (current - base) / base * 100
+    return row
+
+
+@pytest.fixture
+def gappy_metrics():
+    df = make_metrics(months=40)
+    df = df[[SEGMENT_COLUMN, 'date'] + numeric_columns]
+    # Segment b misses a month, and one of its bases is zero
+    df = df[~((df[SEGMENT_COLUMN] == 'b') & (df['date'] == '2021-03-01'))].reset_index(drop=True)
+    df.loc[(df[SEGMENT_COLUMN] == 'b') & (df['date'] == '2021-12-01'), numeric_columns[1]] = 0.0
+    return df
+
+
+def test_summary_as_of_matches_direct_lookups(gappy_metrics):
+    dates = ['2020-02-01', '2021-04-15', '2022-02-01', '2019-06-01']
+    summaries = summary_as_of(gappy_metrics, dates)
+
+    # Dates are matched to the latest month on or before them, and dates before the data dropped
+    assert sorted(summaries.index.get_level_values('date').unique()) == [
+        pd.Timestamp('2020-02-01'), pd.Timestamp('2021-04-01'), pd.Timestamp('2022-02-01')]
+    for date in ['2020-02-01', '2021-04-01', '2022-02-01']:
+        for segment in ['a', 'b']:
+            for metric in numeric_columns:
+                expected = direct_summary(gappy_metrics, date, segment, metric)
+                actual = summaries.loc[(pd.Timestamp(date), segment, metric)]
+                for col, value in expected.items():
+                    assert actual[col] == pytest.approx(value, nan_ok=True), (date, segment, metric, col)
+
+
+def test_latest_summary(gappy_metrics):
+    latest = latest_summary(gappy_metrics)
+    assert list(latest.columns[:2]) == [SEGMENT_COLUMN, 'Metric'] and len(latest) == 2 * len(numeric_columns)
+
+    last = gappy_metrics['date'].max()
+    row = latest[(latest[SEGMENT_COLUMN] == 'a') & (latest['Metric'] == numeric_columns[0])].iloc[0]
+    for col, value in direct_summary(gappy_metrics, last, 'a', numeric_columns[0]).items():
+        assert row[col] == pytest.approx(value)